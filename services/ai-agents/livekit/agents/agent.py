@@ -1,74 +1,460 @@
+import asyncio
 import os
+import re
+import time
+import psutil
+try:
+    # openai>=3 (current livekit-plugins-openai) is built on httpx2
+    import httpx2 as httpx
+except ImportError:
+    import httpx
+from openai import AsyncClient
 from livekit.agents import (
+    DEFAULT_API_CONNECT_OPTIONS,
+    NOT_GIVEN,
+    APIConnectOptions,
     AutoSubscribe,
     JobContext,
+    JobProcess,
+    NotGivenOr,
     WorkerOptions,
     cli,
+    stt,
+    tokenize,
+    tts,
+    utils,
+    vad,
 )
 from livekit.agents import Agent, AgentSession
+from livekit.agents.tokenize import token_stream
 from livekit.plugins import openai, silero
 
+from turn_metrics import TurnMetrics
+
 USE_OPENAI = bool(os.getenv("OPENAI_API_KEY"))
+MODE = "openai" if USE_OPENAI else "local"
 print(f"[LiveKit Agent] Starting in {'OpenAI' if USE_OPENAI else 'Local'} mode")
 
-async def entrypoint(ctx: JobContext):
-    await ctx.connect(auto_subscribe=AutoSubscribe.AUDIO_ONLY)
-    
-    agent = Agent(
-        instructions="You are a helpful AI voice assistant. Keep responses concise and conversational."
+WHISPER_URL = os.getenv("WHISPER_URL", "http://faster-whisper:8000")
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://ollama:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen2.5:7b-instruct-q4_K_M")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+TTS_URL = os.getenv("TTS_URL", "http://openedai-speech:8000")
+TTS_MODEL = os.getenv("TTS_MODEL", "tts-1")
+
+# Worker capacity: rooms per worker before it stops accepting jobs (0 = CPU load only),
+# load (0-1) above which the worker is marked full, prewarmed processes kept ready
+MAX_JOBS = int(os.getenv("LIVEKIT_AGENT_MAX_JOBS", "0"))
+LOAD_THRESHOLD = float(os.getenv("LIVEKIT_AGENT_LOAD_THRESHOLD", "0.75"))
+IDLE_PROCESSES = int(os.getenv("LIVEKIT_AGENT_IDLE_PROCESSES", "2"))
+
+# Prometheus /metrics of the worker (0 = off); job processes write their metrics
+# (per-turn latency included) to the multiprocess directory it aggregates
+METRICS_PORT = int(os.getenv("LIVEKIT_AGENT_METRICS_PORT", "9464"))
+METRICS_DIR = os.getenv("LIVEKIT_AGENT_METRICS_DIR", "/tmp/livekit-agent-metrics")
+
+# Keep-alive pool per backend and process
+HTTP_MAX_CONNECTIONS = int(os.getenv("LIVEKIT_AGENT_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("LIVEKIT_AGENT_HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_TIMEOUT = float(os.getenv("LIVEKIT_AGENT_HTTP_TIMEOUT", "60"))
+
+# Voice pipeline (local mode): interim transcript interval while the user speaks
+# (0 = final transcripts only), characters before the first spoken clause may end
+# (0 = whole sentences only)
+STT_PARTIAL_INTERVAL = float(os.getenv("LIVEKIT_AGENT_STT_PARTIAL_INTERVAL", "1.0"))
+TTS_FIRST_CLAUSE_CHARS = int(os.getenv("LIVEKIT_AGENT_TTS_FIRST_CLAUSE_CHARS", "12"))
+
+# Turn handling: silence before the user's turn ends, whether the reply (and its
+# TTS) is generated before the turn is confirmed, speech needed to interrupt the
+# agent. Preemptive generation is off by default in OpenAI mode, where replies
+# discarded because the user kept talking are still billed; the VAD interruption
+# settings apply to local mode only
+PREEMPTIVE_GENERATION = (
+    os.getenv("LIVEKIT_AGENT_PREEMPTIVE_GENERATION") or ("false" if USE_OPENAI else "true")
+).lower() == "true"
+TURN_HANDLING = {
+    "endpointing": {"min_delay": float(os.getenv("LIVEKIT_AGENT_ENDPOINTING_DELAY", "0.5"))},
+    "preemptive_generation": {
+        "enabled": PREEMPTIVE_GENERATION,
+        "preemptive_tts": PREEMPTIVE_GENERATION
+        and os.getenv("LIVEKIT_AGENT_PREEMPTIVE_TTS", "true").lower() == "true",
+    },
+}
+if not USE_OPENAI:
+    TURN_HANDLING["interruption"] = {
+        "enabled": True,
+        "mode": "vad",
+        "min_duration": float(os.getenv("LIVEKIT_AGENT_MIN_INTERRUPTION_DURATION", "0.5")),
+    }
+
+INSTRUCTIONS = "You are a helpful AI voice assistant. Keep responses concise and conversational."
+
+# Clause boundary: punctuation followed by whitespace (so "1,000" and "3.5" don't split)
+CLAUSE_END = re.compile(r"[,;:.!?\u2014](?=\s)")
+
+_background_tasks: set[asyncio.Task] = set()
+
+
+def api_client(base_url: str | None, api_key: str | None) -> AsyncClient:
+    """OpenAI-compatible client with its own keep-alive connection pool"""
+    return AsyncClient(
+        base_url=base_url,
+        api_key=api_key,
+        max_retries=0,
+        http_client=httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=120,
+            ),
+        ),
     )
-    
+
+
+class WhisperSTT(openai.STT):
+    def __init__(self, client: AsyncClient | None = None):
+        super().__init__(
+            base_url=WHISPER_URL + "/v1",
+            api_key="not-needed",
+            model="whisper-1",
+            client=client,
+        )
+
+
+class OllamaLLM(openai.LLM):
+    def __init__(self, client: AsyncClient | None = None):
+        super().__init__(
+            base_url=OLLAMA_URL + "/v1",
+            api_key="ollama",
+            model=OLLAMA_MODEL,
+            client=client,
+        )
+
+
+class LocalTTS(openai.TTS):
+    def __init__(self, client: AsyncClient | None = None):
+        super().__init__(
+            base_url=TTS_URL + "/v1",
+            api_key="not-needed",
+            model=TTS_MODEL,
+            voice="alloy",
+            client=client,
+        )
+
+
+class PartialWhisperSTT(stt.STT):
+    """
+    Streaming transcription on top of the batch Whisper endpoint. The VAD
+    segments the audio; while the user is still speaking, the speech so far is
+    transcribed every `interval` seconds and sent as an interim transcript
+    (at most one such request in flight), and at the end of speech the whole
+    utterance is transcribed once for the final transcript, as with
+    stt.StreamAdapter.
+    """
+
+    def __init__(self, *, whisper: stt.STT, vad: vad.VAD, interval: float):
+        super().__init__(
+            capabilities=stt.STTCapabilities(streaming=True, interim_results=interval > 0)
+        )
+        self.whisper = whisper
+        self.vad = vad
+        self.interval = interval
+        self.whisper.on("metrics_collected", self._forward_metrics)
+
+    @property
+    def model(self) -> str:
+        return self.whisper.model
+
+    @property
+    def provider(self) -> str:
+        return self.whisper.provider
+
+    def _forward_metrics(self, *args, **kwargs):
+        self.emit("metrics_collected", *args, **kwargs)
+
+    async def _recognize_impl(
+        self,
+        buffer: utils.AudioBuffer,
+        *,
+        language: NotGivenOr[str] = NOT_GIVEN,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+    ) -> stt.SpeechEvent:
+        return await self.whisper.recognize(
+            buffer=buffer, language=language, conn_options=conn_options
+        )
+
+    def stream(
+        self,
+        *,
+        language: NotGivenOr[str] = NOT_GIVEN,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+    ) -> stt.RecognizeStream:
+        return PartialWhisperStream(self, language=language, conn_options=conn_options)
+
+    def prewarm(self) -> None:
+        self.whisper.prewarm()
+
+    async def aclose(self) -> None:
+        self.whisper.off("metrics_collected", self._forward_metrics)
+
+
+class PartialWhisperStream(stt.RecognizeStream):
+    def __init__(
+        self,
+        owner: PartialWhisperSTT,
+        *,
+        language: NotGivenOr[str],
+        conn_options: APIConnectOptions,
+    ):
+        # recognize() retries on its own, the stream itself does not
+        super().__init__(
+            stt=owner, conn_options=APIConnectOptions(max_retry=0, timeout=conn_options.timeout)
+        )
+        self._owner = owner
+        self._language = language
+        self._recognize_options = conn_options
+
+    async def _metrics_monitor_task(self, event_aiter):
+        # STT metrics come from the final recognize() calls
+        async for _ in event_aiter:
+            pass
+
+    async def _transcribe_partial(self, frames: list) -> None:
+        try:
+            # Called without recognize() so interim passes don't count as STT usage
+            event = await self._owner.whisper._recognize_impl(
+                utils.merge_frames(frames),
+                language=self._language,
+                conn_options=self._recognize_options,
+            )
+        except Exception:
+            # Interim only; the final transcript is requested separately
+            return
+        if event.alternatives and event.alternatives[0].text:
+            self._event_ch.send_nowait(
+                stt.SpeechEvent(
+                    type=stt.SpeechEventType.INTERIM_TRANSCRIPT,
+                    alternatives=[event.alternatives[0]],
+                )
+            )
+
+    async def _run(self) -> None:
+        vad_stream = self._owner.vad.stream()
+        speech: list = []
+        partial: asyncio.Task | None = None
+
+        async def forward_input():
+            async for frame in self._input_ch:
+                if isinstance(frame, self._FlushSentinel):
+                    vad_stream.flush()
+                    continue
+                vad_stream.push_frame(frame)
+            vad_stream.end_input()
+
+        async def recognize():
+            nonlocal partial
+            last_partial = 0.0
+            async for event in vad_stream:
+                if event.type == vad.VADEventType.START_OF_SPEECH:
+                    speech[:] = event.frames
+                    last_partial = time.monotonic()
+                    self._event_ch.send_nowait(
+                        stt.SpeechEvent(type=stt.SpeechEventType.START_OF_SPEECH)
+                    )
+                elif event.type == vad.VADEventType.INFERENCE_DONE and speech:
+                    speech.extend(event.frames)
+                    now = time.monotonic()
+                    if (
+                        self._owner.interval > 0
+                        and (partial is None or partial.done())
+                        and now - last_partial >= self._owner.interval
+                    ):
+                        last_partial = now
+                        partial = asyncio.create_task(self._transcribe_partial(list(speech)))
+                elif event.type == vad.VADEventType.END_OF_SPEECH:
+                    speech.clear()
+                    if partial is not None:
+                        # A late interim must not follow the final transcript
+                        partial.cancel()
+                    speech_end_time = time.time() - event.silence_duration - event.inference_duration
+                    self._event_ch.send_nowait(
+                        stt.SpeechEvent(
+                            type=stt.SpeechEventType.END_OF_SPEECH,
+                            speech_end_time=speech_end_time,
+                        )
+                    )
+                    final = await self._owner.whisper.recognize(
+                        buffer=utils.merge_frames(event.frames),
+                        language=self._language,
+                        conn_options=self._recognize_options,
+                    )
+                    if not final.alternatives or not final.alternatives[0].text:
+                        continue
+                    self._event_ch.send_nowait(
+                        stt.SpeechEvent(
+                            type=stt.SpeechEventType.FINAL_TRANSCRIPT,
+                            alternatives=[final.alternatives[0]],
+                            speech_end_time=speech_end_time,
+                        )
+                    )
+
+        tasks = [
+            asyncio.create_task(forward_input()),
+            asyncio.create_task(recognize()),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            if partial is not None:
+                tasks.append(partial)
+            await utils.aio.cancel_and_wait(*tasks)
+            await vad_stream.aclose()
+
+
+class ClauseTokenizer(tokenize.SentenceTokenizer):
+    """
+    Sentence tokenizer for incremental TTS: the first chunk of each reply ends
+    at the first clause boundary after `first_min_len` characters, so speech
+    starts before the first sentence is complete; the rest is split into
+    sentences.
+    """
+
+    def __init__(self, *, first_min_len: int, min_sentence_len: int = 20, stream_context_len: int = 10):
+        self.first_min_len = first_min_len
+        self.stream_context_len = stream_context_len
+        self.sentences = tokenize.blingfire.SentenceTokenizer(
+            min_sentence_len=min_sentence_len, stream_context_len=stream_context_len
+        )
+
+    def tokenize(self, text: str, *, language: str | None = None) -> list[str]:
+        return self.sentences.tokenize(text, language=language)
+
+    def stream(self, *, language: str | None = None) -> token_stream.BufferedSentenceStream:
+        first = self.first_min_len > 0
+
+        def split(text: str) -> list[str]:
+            nonlocal first
+            if first:
+                match = CLAUSE_END.search(text, self.first_min_len)
+                if match:
+                    first = False
+                    rest = text[match.end():]
+                    return [text[: match.end()].strip(), *(self.sentences.tokenize(rest) or [rest])]
+            return self.sentences.tokenize(text, language=language)
+
+        return token_stream.BufferedSentenceStream(
+            tokenizer=split,
+            min_token_len=1,
+            min_ctx_len=self.stream_context_len,
+        )
+
+
+async def warm_ollama(client: AsyncClient):
+    """Load the model into Ollama's memory now; a cold load delays the first reply by seconds"""
+    try:
+        await client.post(
+            OLLAMA_URL + "/api/generate",
+            body={"model": OLLAMA_MODEL, "keep_alive": OLLAMA_KEEP_ALIVE},
+            cast_to=httpx.Response,
+        )
+    except Exception as e:
+        print(f"[LiveKit Agent] Ollama warm-up failed: {e}")
+
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def prewarm(proc: JobProcess):
+    """
+    Runs once per worker process before it is handed a job: load the VAD
+    model and create the HTTP clients, so a new room does not wait for them.
+    Jobs run in their own processes (the default executor on Linux), so each
+    process's clients are only used from that job's event loop.
+    """
+    proc.userdata["vad"] = silero.VAD.load()
     if USE_OPENAI:
-        session = AgentSession(
-            vad=silero.VAD.load(),
-            stt=openai.STT(model="whisper-1"),
-            llm=openai.LLM(model="gpt-4o-mini"),
-            tts=openai.TTS(voice="alloy"),
+        client = api_client(None, os.getenv("OPENAI_API_KEY"))
+        proc.userdata["clients"] = {"stt": client, "llm": client, "tts": client}
+    else:
+        proc.userdata["clients"] = {
+            "stt": api_client(WHISPER_URL + "/v1", "not-needed"),
+            "llm": api_client(OLLAMA_URL + "/v1", "ollama"),
+            "tts": api_client(TTS_URL + "/v1", "not-needed"),
+        }
+
+
+def create_session(vad_model: vad.VAD, clients: dict[str, AsyncClient]) -> AgentSession:
+    if USE_OPENAI:
+        return AgentSession(
+            vad=vad_model,
+            stt=openai.STT(model="whisper-1", client=clients["stt"]),
+            llm=openai.LLM(model="gpt-4o-mini", client=clients["llm"]),
+            tts=openai.TTS(voice="alloy", client=clients["tts"]),
+            turn_handling=TURN_HANDLING,
         )
     else:
-        class WhisperSTT(openai.STT):
-            def __init__(self):
-                super().__init__(
-                    base_url=os.getenv("WHISPER_URL", "http://faster-whisper:8000") + "/v1",
-                    api_key="not-needed",
-                    model="whisper-1"
-                )
-        
-        class OllamaLLM(openai.LLM):
-            def __init__(self):
-                super().__init__(
-                    base_url=os.getenv("OLLAMA_URL", "http://ollama:11434") + "/v1",
-                    api_key="ollama",
-                    model=os.getenv("OLLAMA_MODEL", "qwen2.5:7b-instruct-q4_K_M")
-                )
-        
-        class LocalTTS(openai.TTS):
-            def __init__(self):
-                super().__init__(
-                    base_url=os.getenv("TTS_URL", "http://openedai-speech:8000") + "/v1",
-                    api_key="not-needed",
-                    voice="alloy"
-                )
-        
-        session = AgentSession(
-            vad=silero.VAD.load(),
-            stt=WhisperSTT(),
-            llm=OllamaLLM(),
-            tts=LocalTTS(),
+        # Interim transcripts while the user speaks, streamed Ollama tokens, and
+        # TTS that starts on the first clause; barge-in cancels generation and
+        # synthesis in flight
+        return AgentSession(
+            vad=vad_model,
+            stt=PartialWhisperSTT(
+                whisper=WhisperSTT(clients["stt"]), vad=vad_model, interval=STT_PARTIAL_INTERVAL
+            ),
+            llm=OllamaLLM(clients["llm"]),
+            tts=tts.StreamAdapter(
+                tts=LocalTTS(clients["tts"]),
+                sentence_tokenizer=ClauseTokenizer(first_min_len=TTS_FIRST_CLAUSE_CHARS),
+            ),
+            turn_handling=TURN_HANDLING,
         )
-    
+
+
+def compute_load(worker) -> float:
+    """Worker load (0-1): the higher of CPU use and the share of MAX_JOBS rooms in use"""
+    cpu_load = psutil.cpu_percent() / 100
+    return max(cpu_load, len(worker.active_jobs) / MAX_JOBS)
+
+
+async def entrypoint(ctx: JobContext):
+    clients = ctx.proc.userdata["clients"]
+    if not USE_OPENAI:
+        run_in_background(warm_ollama(clients["llm"]))
+
+    await ctx.connect(auto_subscribe=AutoSubscribe.AUDIO_ONLY)
+
+    agent = Agent(instructions=INSTRUCTIONS)
+
+    session = create_session(ctx.proc.userdata["vad"], clients)
+    turn_metrics = TurnMetrics(session, MODE)
+
     # Start session and keep running
     await session.start(agent=agent, room=ctx.room)
-    
+    turn_metrics.start()
+
     # Generate initial greeting
     await session.generate_reply(
         instructions="greet the user briefly and ask how you can help"
     )
 
 if __name__ == "__main__":
-    cli.run_app(WorkerOptions(
+    options = dict(
         entrypoint_fnc=entrypoint,
+        prewarm_fnc=prewarm,
+        load_threshold=LOAD_THRESHOLD,
+        num_idle_processes=IDLE_PROCESSES,
         api_key=os.getenv("LIVEKIT_API_KEY"),
         api_secret=os.getenv("LIVEKIT_API_SECRET"),
         ws_url=os.getenv("LIVEKIT_URL", "ws://livekit-server:7880"),
-    ))
+    )
+    if MAX_JOBS > 0:
+        options["load_fnc"] = compute_load
+    if METRICS_PORT > 0:
+        options["prometheus_port"] = METRICS_PORT
+        options["prometheus_multiproc_dir"] = METRICS_DIR
+    cli.run_app(WorkerOptions(**options))
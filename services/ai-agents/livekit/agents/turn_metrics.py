@@ -0,0 +1,147 @@
+"""
+Per-turn latency for the voice pipeline.
+
+One agent reply (a speech handle) is one turn. When it finishes, its timings
+are collected from three places:
+
+- the user message that triggered it: end of speech (VAD) to end of turn, and
+  end of speech to final transcript (STT);
+- the assistant message: LLM time to first token, TTS time to first byte and
+  end of user speech to first agent audio (e2e);
+- the LLM and TTS metrics events tagged with the reply's speech id: wall time
+  from the first request start to the last request end, i.e. LLM completion
+  and TTS completion (sentence-by-sentence synthesis issues several requests).
+
+Every stage is observed in `livekit_agent_turn_stage_seconds{mode,stage}` and
+the whole turn is logged as one structured record on the "agent.turns"
+logger; in `start` mode livekit's JSON log formatter writes the fields as
+JSON. Job processes are separate from the worker, so the histograms reach
+the worker's /metrics endpoint through PROMETHEUS_MULTIPROC_DIR.
+"""
+
+import logging
+from typing import Callable
+
+from prometheus_client import Counter, Histogram
+from livekit.agents import (
+    AgentSession,
+    ConversationItemAddedEvent,
+    SpeechCreatedEvent,
+    llm,
+    metrics,
+)
+from livekit.agents.voice import SpeechHandle
+
+logger = logging.getLogger("agent.turns")
+
+STAGES = ("end_of_turn", "transcription", "llm_ttft", "llm_total", "tts_ttfb", "tts_total", "e2e")
+
+STAGE_SECONDS = Histogram(
+    "livekit_agent_turn_stage_seconds",
+    "Time spent per pipeline stage in one agent turn",
+    labelnames=["mode", "stage"],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10, 30),
+)
+TURNS = Counter(
+    "livekit_agent_turns_total",
+    "Agent turns completed",
+    labelnames=["mode", "interrupted"],
+)
+
+
+def request_span(requests: list[tuple[float, float]]) -> float | None:
+    """Wall time from the first request start to the last request end; (end, duration) pairs"""
+    if not requests:
+        return None
+    return max(end for end, _ in requests) - min(end - duration for end, duration in requests)
+
+
+class TurnMetrics:
+    """
+    Attach after session.start(): the session tags LLM and TTS metrics with the
+    speech id in its own listener, which has to run before this one.
+    """
+
+    def __init__(self, session: AgentSession, mode: str, on_turn: Callable[[dict], None] | None = None):
+        self.session = session
+        self.mode = mode
+        self.on_turn = on_turn
+        self._requests: dict[str, dict[str, list[tuple[float, float]]]] = {}
+        self._user: llm.MetricsReport | None = None
+
+    def start(self) -> None:
+        self.session.on("speech_created", self._on_speech_created)
+        self.session.on("conversation_item_added", self._on_item_added)
+        for component in (self.session.llm, self.session.tts):
+            if component is not None:
+                component.on("metrics_collected", self._on_metrics)
+
+    def stop(self) -> None:
+        self.session.off("speech_created", self._on_speech_created)
+        self.session.off("conversation_item_added", self._on_item_added)
+        for component in (self.session.llm, self.session.tts):
+            if component is not None:
+                component.off("metrics_collected", self._on_metrics)
+
+    def _on_speech_created(self, ev: SpeechCreatedEvent) -> None:
+        self._requests[ev.speech_handle.id] = {"llm": [], "tts": []}
+        ev.speech_handle.add_done_callback(self._on_speech_done)
+
+    def _on_item_added(self, ev: ConversationItemAddedEvent) -> None:
+        if isinstance(ev.item, llm.ChatMessage) and ev.item.role == "user":
+            self._user = ev.item.metrics
+
+    def _on_metrics(self, ev: metrics.LLMMetrics | metrics.TTSMetrics) -> None:
+        requests = self._requests.get(ev.speech_id or "")
+        if requests is None:
+            return
+        if isinstance(ev, metrics.LLMMetrics):
+            requests["llm"].append((ev.timestamp, ev.duration))
+        elif isinstance(ev, metrics.TTSMetrics):
+            requests["tts"].append((ev.timestamp, ev.duration))
+
+    def _on_speech_done(self, handle: SpeechHandle) -> None:
+        requests = self._requests.pop(handle.id, {"llm": [], "tts": []})
+        reply = next(
+            (
+                item
+                for item in reversed(handle.chat_items)
+                if isinstance(item, llm.ChatMessage) and item.role == "assistant"
+            ),
+            None,
+        )
+        if reply is None:
+            # Cancelled before anything was said (e.g. a preemptive reply that was discarded)
+            return
+
+        # The reply answers the last user message if that ended before the agent spoke
+        # (a greeting the user talked over does not)
+        user: llm.MetricsReport = {}
+        started = reply.metrics.get("started_speaking_at")
+        if self._user and started and self._user.get("stopped_speaking_at", started) <= started:
+            user, self._user = self._user, None
+        stages = {
+            "end_of_turn": user.get("end_of_turn_delay"),
+            "transcription": user.get("transcription_delay"),
+            "llm_ttft": reply.metrics.get("llm_node_ttft"),
+            "llm_total": request_span(requests["llm"]),
+            "tts_ttfb": reply.metrics.get("tts_node_ttfb"),
+            "tts_total": request_span(requests["tts"]),
+            "e2e": reply.metrics.get("e2e_latency"),
+        }
+        for stage, seconds in stages.items():
+            if seconds is not None and seconds >= 0:
+                STAGE_SECONDS.labels(mode=self.mode, stage=stage).observe(seconds)
+        TURNS.labels(mode=self.mode, interrupted=str(handle.interrupted).lower()).inc()
+
+        record = {
+            "mode": self.mode,
+            "speech_id": handle.id,
+            "interrupted": handle.interrupted,
+            "user_stopped_speaking_at": user.get("stopped_speaking_at"),
+            "agent_started_speaking_at": reply.metrics.get("started_speaking_at"),
+            **{f"{stage}_s": round(seconds, 4) for stage, seconds in stages.items() if seconds is not None},
+        }
+        logger.info("turn completed", extra=record)
+        if self.on_turn is not None:
+            self.on_turn(record)
@@ -0,0 +1,232 @@
+"""
+Fake STT, LLM and TTS backends for the LiveKit agent, on one OpenAI-compatible
+HTTP port, standing in for faster-whisper, Ollama and openedai-speech (local
+mode) as well as the OpenAI API (OpenAI mode):
+
+- POST /v1/audio/transcriptions answers a fixed transcript after
+  --stt-latency-ms plus --stt-ms-per-audio-s per second of uploaded audio;
+- POST /v1/chat/completions streams a fixed reply word by word (SSE), the
+  first word after --llm-ttft-ms and every further one after --llm-token-ms;
+- POST /v1/audio/speech returns silence of --tts-s-per-char seconds per input
+  character as MP3 (or raw PCM), the first bytes after --tts-ttfb-ms and the
+  rest at --tts-rtf times real time;
+- POST /api/generate (Ollama model warm-up) answers at once.
+
+    python bench/backends.py --port 8800 --stt-latency-ms 150 --llm-ttft-ms 300 \
+        --llm-token-ms 30 --tts-ttfb-ms 120 --jitter-ms 20
+
+Counters are printed as JSON on SIGINT/SIGTERM.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import random
+import signal
+import time
+import uuid
+
+import av
+from aiohttp import web
+
+TTS_SAMPLE_RATE = 24000
+CHUNK_SECONDS = 0.2
+
+STATS = {
+    "transcriptions": 0,
+    "audio_seconds_in": 0.0,
+    "completions": 0,
+    "completion_tokens": 0,
+    "speech": 0,
+    "audio_seconds_out": 0.0,
+    "warmups": 0,
+}
+
+
+class BackendConfig:
+    def __init__(self, args: argparse.Namespace):
+        self.jitter = args.jitter_ms / 1000
+        self.stt_latency = args.stt_latency_ms / 1000
+        self.stt_per_audio_second = args.stt_ms_per_audio_s / 1000
+        self.transcript = args.transcript
+        self.llm_ttft = args.llm_ttft_ms / 1000
+        self.llm_token = args.llm_token_ms / 1000
+        self.reply = args.reply
+        self.tts_ttfb = args.tts_ttfb_ms / 1000
+        self.tts_rtf = args.tts_rtf
+        self.tts_seconds_per_char = args.tts_s_per_char
+
+    async def delay(self, base: float) -> None:
+        seconds = base + random.uniform(-self.jitter, self.jitter) if base else 0
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+
+def wav_seconds(data: bytes) -> float:
+    # 44-byte RIFF header written by rtc.AudioFrame.to_wav_bytes()
+    if len(data) < 44 or data[:4] != b"RIFF":
+        return 0.0
+    channels = int.from_bytes(data[22:24], "little")
+    byte_rate = int.from_bytes(data[28:32], "little")
+    return (len(data) - 44) / byte_rate if byte_rate and channels else 0.0
+
+
+_mp3_cache: dict[int, bytes] = {}
+
+
+def silence(seconds: float, response_format: str) -> bytes:
+    samples = max(1, int(seconds * TTS_SAMPLE_RATE))
+    if response_format == "pcm":
+        return bytes(samples * 2)
+    # Encoded once per length (in 100 ms steps)
+    key = -(-samples // (TTS_SAMPLE_RATE // 10))
+    if key not in _mp3_cache:
+        out = io.BytesIO()
+        with av.open(out, "w", format="mp3") as container:
+            stream = container.add_stream("mp3", rate=TTS_SAMPLE_RATE, layout="mono")
+            frame_size = 1152
+            for offset in range(0, key * TTS_SAMPLE_RATE // 10, frame_size):
+                frame = av.AudioFrame(format="s16", layout="mono", samples=frame_size)
+                frame.planes[0].update(bytes(frame_size * 2))
+                frame.sample_rate = TTS_SAMPLE_RATE
+                frame.pts = offset
+                for packet in stream.encode(frame):
+                    container.mux(packet)
+            for packet in stream.encode(None):
+                container.mux(packet)
+        _mp3_cache[key] = out.getvalue()
+    return _mp3_cache[key]
+
+
+async def transcriptions(request: web.Request) -> web.Response:
+    cfg: BackendConfig = request.app["cfg"]
+    seconds = 0.0
+    response_format = "json"
+    async for part in await request.multipart():
+        if part.name == "file":
+            seconds = wav_seconds(await part.read())
+        elif part.name == "response_format":
+            response_format = await part.text()
+    await cfg.delay(cfg.stt_latency + cfg.stt_per_audio_second * seconds)
+    STATS["transcriptions"] += 1
+    STATS["audio_seconds_in"] += seconds
+    body = {"text": cfg.transcript}
+    if response_format == "verbose_json":
+        body.update(language="english", duration=seconds, segments=[])
+    return web.json_response(body, headers={"X-Request-Id": uuid.uuid4().hex})
+
+
+async def chat_completions(request: web.Request) -> web.StreamResponse:
+    cfg: BackendConfig = request.app["cfg"]
+    payload = await request.json()
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    def chunk(choices: list[dict], **extra) -> bytes:
+        body = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": payload.get("model", "bench"),
+            "choices": choices,
+            **extra,
+        }
+        return f"data: {json.dumps(body)}\n\n".encode()
+
+    response = web.StreamResponse(
+        headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache", "X-Request-Id": completion_id}
+    )
+    await response.prepare(request)
+    words = cfg.reply.split(" ")
+    await cfg.delay(cfg.llm_ttft)
+    for index, word in enumerate(words):
+        if index:
+            await cfg.delay(cfg.llm_token)
+        content = word if not index else " " + word
+        delta = {"role": "assistant", "content": content} if not index else {"content": content}
+        await response.write(chunk([{"index": 0, "delta": delta, "finish_reason": None}]))
+    await response.write(chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+    usage = {"prompt_tokens": 50, "completion_tokens": len(words), "total_tokens": 50 + len(words)}
+    await response.write(chunk([], usage=usage))
+    await response.write(b"data: [DONE]\n\n")
+    STATS["completions"] += 1
+    STATS["completion_tokens"] += len(words)
+    return response
+
+
+async def speech(request: web.Request) -> web.StreamResponse:
+    cfg: BackendConfig = request.app["cfg"]
+    payload = await request.json()
+    response_format = payload.get("response_format", "mp3")
+    seconds = max(CHUNK_SECONDS, len(payload.get("input", "")) * cfg.tts_seconds_per_char)
+    audio = silence(seconds, response_format)
+
+    content_type = "audio/pcm" if response_format == "pcm" else "audio/mpeg"
+    response = web.StreamResponse(headers={"Content-Type": content_type, "X-Request-Id": uuid.uuid4().hex})
+    await response.prepare(request)
+    await cfg.delay(cfg.tts_ttfb)
+    chunks = max(1, round(seconds / CHUNK_SECONDS))
+    size = -(-len(audio) // chunks)
+    for index in range(chunks):
+        if index and cfg.tts_rtf > 0:
+            await asyncio.sleep(CHUNK_SECONDS * cfg.tts_rtf)
+        await response.write(audio[index * size : (index + 1) * size])
+    STATS["speech"] += 1
+    STATS["audio_seconds_out"] += seconds
+    return response
+
+
+async def ollama_generate(request: web.Request) -> web.Response:
+    STATS["warmups"] += 1
+    payload = await request.json()
+    return web.json_response({"model": payload.get("model"), "response": "", "done": True})
+
+
+async def serve(host: str, port: int, cfg: BackendConfig) -> None:
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app["cfg"] = cfg
+    app.router.add_post("/v1/audio/transcriptions", transcriptions)
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_post("/v1/audio/speech", speech)
+    app.router.add_post("/api/generate", ollama_generate)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    print(f"backends listening on {host}:{port}", flush=True)
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+    print(json.dumps(STATS), flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--jitter-ms", type=float, default=0, help="+/- random jitter on every delay")
+    parser.add_argument("--stt-latency-ms", type=float, default=150, help="fixed transcription latency")
+    parser.add_argument("--stt-ms-per-audio-s", type=float, default=50, help="extra latency per second of audio")
+    parser.add_argument("--transcript", default="What is the weather going to be like tomorrow?")
+    parser.add_argument("--llm-ttft-ms", type=float, default=300, help="delay before the first token")
+    parser.add_argument("--llm-token-ms", type=float, default=30, help="delay between tokens (words)")
+    parser.add_argument(
+        "--reply",
+        default="Tomorrow looks mostly sunny, with a light breeze in the afternoon. "
+        "Temperatures should reach about twenty degrees, so a light jacket will do.",
+    )
+    parser.add_argument("--tts-ttfb-ms", type=float, default=150, help="delay before the first audio bytes")
+    parser.add_argument("--tts-rtf", type=float, default=0.2, help="synthesis time per second of audio after that")
+    parser.add_argument("--tts-s-per-char", type=float, default=0.06, help="seconds of audio per input character")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, BackendConfig(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Offline latency benchmark for the LiveKit agent.
+
+Starts the fake backends (bench/backends.py) with the given latencies, then
+for every mode runs bench/replay.py in a fresh process configured through
+environment variables, like the container, and reports p50/p95 per turn
+stage: end of turn, transcription, LLM first token and completion, TTS first
+byte and completion, and end of user speech to first agent audio (e2e).
+
+Run from the livekit directory:
+
+    python bench/driver.py --audio utterance.wav --modes openai,local --turns 10 \
+        --llm-ttft-ms 300 --tts-ttfb-ms 150
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "agents"))
+
+from turn_metrics import STAGES  # noqa: E402
+
+
+def modes(url: str) -> dict[str, dict[str, str]]:
+    """Named presets; anything here can be overridden with --env KEY=VALUE"""
+    return {
+        "openai": {"OPENAI_API_KEY": "bench", "OPENAI_BASE_URL": url + "/v1"},
+        "local": {"OPENAI_API_KEY": "", "WHISPER_URL": url, "OLLAMA_URL": url, "TTS_URL": url},
+    }
+
+
+BACKEND_OPTIONS = (
+    "jitter_ms",
+    "stt_latency_ms",
+    "stt_ms_per_audio_s",
+    "llm_ttft_ms",
+    "llm_token_ms",
+    "tts_ttfb_ms",
+    "tts_rtf",
+    "tts_s_per_char",
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def start_backends(args: argparse.Namespace, port: int) -> subprocess.Popen:
+    cmd = [sys.executable, str(BENCH_DIR / "backends.py"), "--port", str(port)]
+    for option in BACKEND_OPTIONS:
+        cmd += ["--" + option.replace("_", "-"), str(getattr(args, option))]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    proc.stdout.readline()  # "listening on ..."
+    return proc
+
+
+def stop(proc: subprocess.Popen) -> str:
+    proc.send_signal(signal.SIGTERM)
+    try:
+        out, _ = proc.communicate(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        out, _ = proc.communicate()
+    return out or ""
+
+
+def run_mode(mode: str, preset: dict[str, str], args: argparse.Namespace) -> dict:
+    env = {
+        **os.environ,
+        "LIVEKIT_AGENT_METRICS_PORT": "0",
+        **preset,
+        **dict(item.split("=", 1) for item in args.env),
+    }
+    cmd = [sys.executable, str(BENCH_DIR / "replay.py"), "--turns", str(args.turns), "--pause", str(args.pause)]
+    for path in args.audio:
+        cmd += ["--audio", str(Path(path).resolve())]
+    proc = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, text=True)
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(f"replay failed in {mode} mode (exit {proc.returncode})")
+    return json.loads(lines[-1])
+
+
+def summarize(mode: str, result: dict) -> dict:
+    summary = {"mode": mode, "turns": len(result["turns"]), "timeouts": result["timeouts"]}
+    for stage in STAGES:
+        values = sorted(turn[f"{stage}_s"] for turn in result["turns"] if f"{stage}_s" in turn)
+        summary[f"{stage}_p50_ms"] = round(percentile(values, 50) * 1000, 1)
+        summary[f"{stage}_p95_ms"] = round(percentile(values, 95) * 1000, 1)
+    return summary
+
+
+def print_summary(summary: dict) -> None:
+    print(f"# {summary['mode']}: {summary['turns']} turns, {summary['timeouts']} timeouts", flush=True)
+    for stage in STAGES:
+        p50, p95 = summary[f"{stage}_p50_ms"], summary[f"{stage}_p95_ms"]
+        print(f"{summary['mode']:>8}  {stage:>14}  {p50:>10}  {p95:>10}", flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--audio", action="append", required=True, help="mono 16-bit PCM WAV utterance (repeatable)")
+    parser.add_argument("--modes", default="openai,local", help="comma list of openai, local")
+    parser.add_argument("--turns", type=int, default=10, help="utterances per mode")
+    parser.add_argument("--pause", type=float, default=1.0, help="silence after each reply, seconds")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra agent environment")
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--stt-latency-ms", type=float, default=150)
+    parser.add_argument("--stt-ms-per-audio-s", type=float, default=50)
+    parser.add_argument("--llm-ttft-ms", type=float, default=300)
+    parser.add_argument("--llm-token-ms", type=float, default=30)
+    parser.add_argument("--tts-ttfb-ms", type=float, default=150)
+    parser.add_argument("--tts-rtf", type=float, default=0.2)
+    parser.add_argument("--tts-s-per-char", type=float, default=0.06)
+    parser.add_argument("--json", help="also write the summaries and turn records to this file")
+    args = parser.parse_args()
+
+    port = free_port()
+    presets = modes(f"http://127.0.0.1:{port}")
+    selected = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = [m for m in selected if m not in presets]
+    if unknown:
+        parser.error(f"unknown mode(s): {', '.join(unknown)}")
+
+    backends = start_backends(args, port)
+    print(f"{'mode':>8}  {'stage':>14}  {'p50_ms':>10}  {'p95_ms':>10}", flush=True)
+    results = []
+    try:
+        for mode in selected:
+            result = run_mode(mode, presets[mode], args)
+            summary = summarize(mode, result)
+            print_summary(summary)
+            results.append({**summary, "records": result["turns"]})
+    finally:
+        backend_stats = stop(backends).strip().splitlines()
+        if backend_stats:
+            print(f"# backends: {backend_stats[-1]}", flush=True)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
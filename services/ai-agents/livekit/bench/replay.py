@@ -0,0 +1,190 @@
+"""
+Replay recorded utterances through the agent's AgentSession, without a LiveKit
+server, and report the per-turn timings recorded by turn_metrics.
+
+The session is built by agent.create_session(), so the mode (OpenAI or local)
+and every LIVEKIT_AGENT_* setting come from the environment exactly as in the
+container; driver.py points the backends at bench/backends.py. Audio is fed
+in real time as 10 ms frames: an utterance, then silence until the agent has
+finished its reply and --pause seconds more. The agent's audio output is
+played out (discarded) in real time as well, so endpointing, interruption and
+playout behave as they would in a room.
+
+    OPENAI_API_KEY= WHISPER_URL=http://127.0.0.1:8800 OLLAMA_URL=http://127.0.0.1:8800 \
+        TTS_URL=http://127.0.0.1:8800 python bench/replay.py --audio utterance.wav --turns 10
+
+Prints one JSON object with the turn records on the last line of stdout.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import wave
+from collections import deque
+from pathlib import Path
+from types import SimpleNamespace
+
+AGENT_DIR = Path(__file__).resolve().parent.parent / "agents"
+sys.path.insert(0, str(AGENT_DIR))
+
+import agent  # noqa: E402
+from livekit import rtc  # noqa: E402
+from livekit.agents import Agent, AgentSession  # noqa: E402
+from livekit.agents.voice import io  # noqa: E402
+from turn_metrics import TurnMetrics  # noqa: E402
+
+FRAME_SECONDS = 0.01
+
+
+def load_wav(path: Path) -> rtc.AudioFrame:
+    with wave.open(str(path)) as wav:
+        if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+            raise SystemExit(f"{path}: only mono 16-bit PCM WAV is supported")
+        return rtc.AudioFrame(
+            data=wav.readframes(wav.getnframes()),
+            sample_rate=wav.getframerate(),
+            num_channels=1,
+            samples_per_channel=wav.getnframes(),
+        )
+
+
+class ReplayAudioInput(io.AudioInput):
+    """Microphone stand-in: queued utterances, silence otherwise, paced in real time"""
+
+    def __init__(self, sample_rate: int):
+        super().__init__(label="Replay")
+        self.sample_rate = sample_rate
+        self.frame_samples = int(sample_rate * FRAME_SECONDS)
+        self._pending: deque[bytes] = deque()
+        self._next_at: float | None = None
+        self.utterance_done = asyncio.Event()
+
+    def play(self, utterance: rtc.AudioFrame) -> None:
+        data = bytes(utterance.data)
+        step = self.frame_samples * 2
+        self._pending.extend(data[offset : offset + step] for offset in range(0, len(data), step))
+        self.utterance_done.clear()
+
+    async def __anext__(self) -> rtc.AudioFrame:
+        now = time.monotonic()
+        self._next_at = max(self._next_at or now, now - 0.1) + FRAME_SECONDS
+        if self._next_at > now:
+            await asyncio.sleep(self._next_at - now)
+        if self._pending:
+            data = self._pending.popleft()
+            if not self._pending:
+                self.utterance_done.set()
+        else:
+            data = b""
+        data = data.ljust(self.frame_samples * 2, b"\0")
+        return rtc.AudioFrame(
+            data=data,
+            sample_rate=self.sample_rate,
+            num_channels=1,
+            samples_per_channel=self.frame_samples,
+        )
+
+
+class PlayoutAudioOutput(io.AudioOutput):
+    """Speaker stand-in: discards the agent's audio, reporting playout in real time"""
+
+    def __init__(self):
+        super().__init__(label="Playout", capabilities=io.AudioOutputCapabilities(pause=False))
+        self._pushed = 0.0
+        self._started = 0.0
+        self._interrupted = asyncio.Event()
+        self._playout: asyncio.Task | None = None
+
+    async def capture_frame(self, frame: rtc.AudioFrame) -> None:
+        await super().capture_frame(frame)
+        if self._playout is not None and not self._playout.done():
+            await self._playout
+        if not self._pushed:
+            self._started = time.monotonic()
+            self.on_playback_started(created_at=time.time())
+        self._pushed += frame.duration
+
+    def flush(self) -> None:
+        super().flush()
+        if self._pushed:
+            self._interrupted.clear()
+            self._playout = asyncio.create_task(self._play(self._pushed))
+
+    def clear_buffer(self) -> None:
+        if self._pushed:
+            self._interrupted.set()
+
+    async def _play(self, duration: float) -> None:
+        remaining = self._started + duration - time.monotonic()
+        interrupted = False
+        if remaining > 0:
+            try:
+                await asyncio.wait_for(self._interrupted.wait(), remaining)
+                interrupted = True
+            except asyncio.TimeoutError:
+                pass
+        played = min(time.monotonic() - self._started, duration)
+        self._pushed = 0.0
+        self.on_playback_finished(playback_position=played, interrupted=interrupted)
+
+
+async def replay(args: argparse.Namespace) -> dict:
+    utterances = [load_wav(Path(path)) for path in args.audio]
+    sample_rate = utterances[0].sample_rate
+    if any(u.sample_rate != sample_rate for u in utterances):
+        raise SystemExit("all --audio files must have the same sample rate")
+
+    # The same per-process setup the worker does before a job
+    proc = SimpleNamespace(userdata={})
+    agent.prewarm(proc)
+    session: AgentSession = agent.create_session(proc.userdata["vad"], proc.userdata["clients"])
+    mic = ReplayAudioInput(sample_rate)
+    session.input.audio = mic
+    session.output.audio = PlayoutAudioOutput()
+
+    turns: list[dict] = []
+    turn_done = asyncio.Event()
+
+    def on_turn(record: dict) -> None:
+        turns.append(record)
+        turn_done.set()
+
+    turn_metrics = TurnMetrics(session, agent.MODE, on_turn=on_turn)
+    await session.start(agent=Agent(instructions=agent.INSTRUCTIONS), record=False)
+    turn_metrics.start()
+    if not agent.USE_OPENAI:
+        await agent.warm_ollama(proc.userdata["clients"]["llm"])
+
+    timeouts = 0
+    try:
+        await asyncio.sleep(args.pause)
+        for index in range(args.turns):
+            turn_done.clear()
+            mic.play(utterances[index % len(utterances)])
+            await mic.utterance_done.wait()
+            try:
+                await asyncio.wait_for(turn_done.wait(), args.timeout)
+            except asyncio.TimeoutError:
+                timeouts += 1
+            await asyncio.sleep(args.pause)
+    finally:
+        turn_metrics.stop()
+        await session.aclose()
+    return {"mode": agent.MODE, "turns": turns, "timeouts": timeouts}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--audio", action="append", required=True, help="mono 16-bit PCM WAV utterance (repeatable)")
+    parser.add_argument("--turns", type=int, default=10, help="utterances to play (files are cycled)")
+    parser.add_argument("--pause", type=float, default=1.0, help="silence after each reply, seconds")
+    parser.add_argument("--timeout", type=float, default=30, help="give up waiting for a reply after this")
+    args = parser.parse_args()
+    result = asyncio.run(replay(args))
+    print(json.dumps(result), flush=True)
+
+
+if __name__ == "__main__":
+    main()
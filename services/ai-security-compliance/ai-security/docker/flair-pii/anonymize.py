@@ -0,0 +1,98 @@
+"""
+Replacement of detected PII spans.
+
+Spans are sorted and overlapping ones merged, then the output is built in a
+single pass as a list of untouched slices and replacements joined once at
+the end, so cost is linear in the text length plus the number of spans.
+
+Strategies:
+- placeholder: "[PER]"
+- pseudonym:   "[PER_3f9a1c2e]", keyed HMAC of type and value; the same value
+               maps to the same pseudonym across requests with the same key
+- mask:        every non-whitespace character replaced by "*"
+"""
+
+import hashlib
+import hmac
+import re
+from typing import Iterable, Iterator
+
+STRATEGIES = ("placeholder", "pseudonym", "mask")
+
+_NON_SPACE = re.compile(r"\S")
+
+# (start, end, type)
+Span = tuple[int, int, str]
+
+
+def merge_spans(spans: Iterable[Span]) -> list[Span]:
+    """
+    Sort spans and merge overlaps; a merged span keeps the type of the longest part.
+    """
+    merged: list[list] = []
+    for start, end, span_type in sorted(spans):
+        if end <= start:
+            continue
+        if merged and start < merged[-1][1]:
+            last = merged[-1]
+            if end - start > last[3]:
+                last[2], last[3] = span_type, end - start
+            last[1] = max(last[1], end)
+        else:
+            merged.append([start, end, span_type, end - start])
+    return [(start, end, span_type) for start, end, span_type, _ in merged]
+
+
+class Replacer:
+    def __init__(self, strategy: str, key: bytes = b""):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown anonymization strategy: {strategy}")
+        if strategy == "pseudonym" and not key:
+            raise ValueError("The pseudonym strategy needs a key")
+        self.strategy = strategy
+        self.key = key
+
+    def __call__(self, value: str, span_type: str) -> str:
+        if self.strategy == "mask":
+            return _NON_SPACE.sub("*", value)
+        if self.strategy == "pseudonym":
+            digest = hmac.new(self.key, f"{span_type}\0{value}".encode("utf-8"), hashlib.sha256).hexdigest()
+            return f"[{span_type}_{digest[:8]}]"
+        return f"[{span_type}]"
+
+
+def iter_anonymized(text: str, spans: Iterable[Span], replacer: Replacer) -> Iterator[str]:
+    """
+    Yields the anonymized text piece by piece.
+    """
+    pos = 0
+    for start, end, span_type in merge_spans(spans):
+        if start > pos:
+            yield text[pos:start]
+        yield replacer(text[start:end], span_type)
+        pos = end
+    if pos < len(text):
+        yield text[pos:]
+
+
+def anonymize(text: str, spans: Iterable[Span], replacer: Replacer) -> str:
+    return "".join(iter_anonymized(text, spans, replacer))
+
+
+_SEGMENT_END = re.compile(r"[.!?\n]\s")
+
+
+def split_segment(buffer: str, min_chars: int) -> int:
+    """
+    Where to cut a streamed buffer: after the last sentence end past
+    `min_chars`, or at the last whitespace. Returns 0 if the buffer is too
+    short to cut yet.
+    """
+    if len(buffer) < min_chars:
+        return 0
+    cut = 0
+    for match in _SEGMENT_END.finditer(buffer, min_chars // 2):
+        cut = match.end()
+    if not cut:
+        cut = max(buffer.rfind(" "), buffer.rfind("\n")) + 1
+    return cut if cut > 0 else len(buffer)
@@ -1,34 +1,227 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import List, Dict, Literal, Optional, Tuple
 from flair.data import Sentence
-from flair.models import SequenceTagger
-import re
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+import asyncio
+import codecs
+import os
+import secrets
+import time
 import logging
 
+from batching import InferenceScheduler, SpanTuple
+from anonymize import STRATEGIES, Replacer, anonymize, split_segment
+from cache import ResultCache, cache_key
+from bulk import NDJSON_MEDIA_TYPE, DuplexStreamingResponse, iter_bulk_items, stream_results
+from chunking import Chunk, merge_chunk_spans, split_text
+from models import MODEL_VARIANTS, ModelManager
+from instrumentation import ENTITIES, SlowRequestProfiler, observe_stages, update_memory_gauges
+from workers import InferenceWorkerPool, configure_torch_threads, default_torch_threads
+from patterns import PATTERN_SETS, IntervalIndex, load_pattern_file, patterns_fingerprint
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize FastAPI
-app = FastAPI(title="Flair PII Detection API", version="1.0.0")
-
-# Load models at startup
-logger.info("Loading Flair NER models...")
-tagger_de = SequenceTagger.load('de-ner-large')
-tagger_en = SequenceTagger.load('ner-large')
-logger.info("Models loaded successfully")
-
-# German PII Patterns
-GERMAN_PATTERNS = {
-    'IBAN': r'[A-Z]{2}\d{2}\s?[\w\s]{4,34}',
-    'PHONE_DE': r'(\+49|0049|0)\s?[1-9]\d{1,14}',
-    'EMAIL': r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}',
-    'STEUER_ID': r'\d{2}\s?\d{3}\s?\d{3}\s?\d{3}',
-    'PLZ': r'\b\d{5}\b',
-    'SOZIALVERSICHERUNG': r'\d{2}\s?\d{6}\s?[A-Z]\s?\d{3}',
-    'PERSONALAUSWEIS': r'[A-Z0-9]{9}',
+# Dynamic batching: requests arriving within BATCH_MAX_WAIT_MS share one predict() call
+BATCH_MAX_SIZE = int(os.getenv("FLAIR_BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.getenv("FLAIR_BATCH_MAX_WAIT_MS", "10"))
+MINI_BATCH_SIZE = int(os.getenv("FLAIR_MINI_BATCH_SIZE", "32"))
+
+# Long texts are tagged as sentence-packed chunks of at most CHUNK_MAX_CHARS (0 = off)
+CHUNK_MAX_CHARS = int(os.getenv("FLAIR_CHUNK_MAX_CHARS", "1000"))
+CHUNK_OVERLAP = int(os.getenv("FLAIR_CHUNK_OVERLAP_CHARS", "100"))
+
+# /analyze/batch: documents analyzed concurrently per request, and NDJSON line cap
+BULK_MAX_INFLIGHT = int(os.getenv("FLAIR_BULK_MAX_INFLIGHT", str(BATCH_MAX_SIZE * 2)))
+BULK_MAX_LINE_BYTES = int(os.getenv("FLAIR_BULK_MAX_LINE_BYTES", str(10 * 1024 * 1024)))
+
+# Opt-in sampling profiler: log hot stacks of requests slower than PROFILE_SLOW_MS (0 = off)
+PROFILE_SLOW_MS = float(os.getenv("FLAIR_PROFILE_SLOW_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("FLAIR_PROFILE_INTERVAL_MS", "10"))
+PROFILER = SlowRequestProfiler(threshold=PROFILE_SLOW_MS / 1000, interval=PROFILE_INTERVAL_MS / 1000)
+
+# Result cache: in-memory LRU entries (0 = off) and optional SQLite file
+CACHE_MAX_ENTRIES = int(os.getenv("FLAIR_CACHE_MAX_ENTRIES", "10000"))
+CACHE_DB_PATH = os.getenv("FLAIR_CACHE_DB_PATH", "").strip()
+CACHE_DB_MAX_ENTRIES = int(os.getenv("FLAIR_CACHE_DB_MAX_ENTRIES", "1000000"))
+
+# Models: variant (large, standard, fast) with per-language overrides, loaded on
+# first use unless listed in FLAIR_PRELOAD, optionally unloaded after idling
+MODEL_VARIANT = os.getenv("FLAIR_MODEL_VARIANT", "large").strip().lower()
+if MODEL_VARIANT not in MODEL_VARIANTS:
+    raise RuntimeError(f"FLAIR_MODEL_VARIANT must be one of {', '.join(MODEL_VARIANTS)}")
+MODEL_NAMES = {
+    language: os.getenv(f"FLAIR_MODEL_{language.upper()}", name).strip() or name
+    for language, name in MODEL_VARIANTS[MODEL_VARIANT].items()
 }
+MODEL_PRELOAD = [lang.strip() for lang in os.getenv("FLAIR_PRELOAD", "").split(",") if lang.strip()]
+MODEL_IDLE_UNLOAD = float(os.getenv("FLAIR_MODEL_IDLE_UNLOAD_SECONDS", "0"))
+MODEL_QUANTIZE = os.getenv("FLAIR_QUANTIZE", "false").strip().lower() in ("1", "true", "yes")
+
+# Worker-pool mode: N forked inference processes sharing the preloaded models
+# (0 = inference thread in the API process); torch threads per process (0 = auto)
+WORKERS = int(os.getenv("FLAIR_WORKERS", "0"))
+TORCH_THREADS = int(os.getenv("FLAIR_TORCH_THREADS", "0"))
+if WORKERS > 0:
+    # Models must be in memory before forking to be shared
+    MODEL_PRELOAD = MODEL_PRELOAD or list(MODEL_VARIANTS[MODEL_VARIANT])
+    TORCH_THREADS = TORCH_THREADS or default_torch_threads(WORKERS)
+    if MODEL_IDLE_UNLOAD > 0:
+        logger.warning("FLAIR_MODEL_IDLE_UNLOAD_SECONDS is ignored with FLAIR_WORKERS > 0")
+        MODEL_IDLE_UNLOAD = 0
+
+MODELS = ModelManager(MODEL_NAMES, quantized=MODEL_QUANTIZE, idle_unload=MODEL_IDLE_UNLOAD)
+
+
+def model_key(language: str) -> str:
+    return "de" if language == "de" else "en"
+
+
+def run_ner_batch(language: str, texts: List[str]) -> Tuple[List[List[SpanTuple]], Dict[str, float]]:
+    """Tag a batch of texts with one predict() call (runs in the inference thread or a worker)"""
+    started = time.perf_counter()
+    sentences = [Sentence(text) for text in texts]
+    tokenized = time.perf_counter()
+    with MODELS.use(language) as tagger:
+        forward_started = time.perf_counter()
+        tagger.predict(sentences, mini_batch_size=MINI_BATCH_SIZE)
+        finished = time.perf_counter()
+    results = [
+        [
+            (span.text, span.tag, span.start_position, span.end_position, span.score)
+            for span in sentence.get_spans('ner')
+        ]
+        for sentence in sentences
+    ]
+    return results, {"tokenize": tokenized - started, "forward": finished - forward_started}
+
+
+WORKER_POOL = InferenceWorkerPool(run_ner_batch, WORKERS, TORCH_THREADS) if WORKERS > 0 else None
+
+SCHEDULER = InferenceScheduler(
+    WORKER_POOL.run_batch if WORKER_POOL is not None else run_ner_batch,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait=BATCH_MAX_WAIT_MS / 1000,
+    # One batch in flight per worker process
+    concurrency=max(1, WORKERS),
+)
+
+
+RESULT_CACHE = (
+    ResultCache(CACHE_MAX_ENTRIES, db_path=CACHE_DB_PATH, db_max_entries=CACHE_DB_MAX_ENTRIES)
+    if CACHE_MAX_ENTRIES > 0
+    else None
+)
+
+
+async def cache_get(keys: List[str], level: str) -> List[Optional[list]]:
+    if RESULT_CACHE.persistent:
+        return await run_in_threadpool(RESULT_CACHE.get_many, keys, level)
+    return RESULT_CACHE.get_many(keys, level)
+
+
+async def cache_put(items: List[tuple]) -> None:
+    if RESULT_CACHE.persistent:
+        await run_in_threadpool(RESULT_CACHE.put_many, items)
+    else:
+        RESULT_CACHE.put_many(items)
+
+
+async def tag_chunks(
+    language: str,
+    chunks: List[Chunk],
+    stages: Optional[Dict[str, float]] = None,
+) -> List[SpanTuple]:
+    """NER over all chunks of a document, in scheduler-sized groups, with document offsets"""
+    spans_per_chunk: List[Optional[List[SpanTuple]]] = [None] * len(chunks)
+    keys: List[str] = []
+    if RESULT_CACHE is not None:
+        # Per chunk, so repeated sentences inside otherwise new documents still hit
+        keys = [
+            cache_key(CACHE_KEY, "chunk", chunk.text, MODELS.version(language), CACHE_CONFIG)
+            for chunk in chunks
+        ]
+        for i, cached in enumerate(await cache_get(keys, "chunk")):
+            if cached is not None:
+                text = chunks[i].text
+                spans_per_chunk[i] = [(text[start:end], tag, start, end, score) for tag, start, end, score in cached]
+
+    missing = [i for i, spans in enumerate(spans_per_chunk) if spans is None]
+    if missing:
+        started = time.perf_counter()
+        texts = [chunks[i].text for i in missing]
+        groups = [texts[i:i + BATCH_MAX_SIZE] for i in range(0, len(texts), BATCH_MAX_SIZE)]
+        results = await asyncio.gather(*(SCHEDULER.predict(language, group, stages) for group in groups))
+        cost = (time.perf_counter() - started) / len(missing)
+        for i, spans in zip(missing, (spans for group in results for spans in group)):
+            spans_per_chunk[i] = spans
+        if keys:
+            # Offsets, tags and scores only; never the text itself
+            await cache_put([
+                (keys[i], [[tag, start, end, score] for _, tag, start, end, score in spans_per_chunk[i]], cost)
+                for i in missing
+            ])
+    return merge_chunk_spans(chunks, spans_per_chunk)
+
+
+async def unload_idle_models() -> None:
+    while True:
+        await asyncio.sleep(max(1.0, MODEL_IDLE_UNLOAD / 4))
+        await run_in_threadpool(MODELS.unload_idle)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for language in MODEL_PRELOAD:
+        await run_in_threadpool(MODELS.load, model_key(language))
+    if WORKER_POOL is not None:
+        WORKER_POOL.start()
+    else:
+        configure_torch_threads(TORCH_THREADS)
+    await SCHEDULER.start()
+    unloader = asyncio.create_task(unload_idle_models()) if MODEL_IDLE_UNLOAD > 0 else None
+    yield
+    if unloader is not None:
+        unloader.cancel()
+    await SCHEDULER.stop()
+    if WORKER_POOL is not None:
+        await run_in_threadpool(WORKER_POOL.stop)
+    if RESULT_CACHE is not None:
+        RESULT_CACHE.close()
+
+
+# Initialize FastAPI
+app = FastAPI(title="Flair PII Detection API", version="1.0.0", lifespan=lifespan)
+
+# Key for stable pseudonyms; without it pseudonyms only stay stable until restart
+PSEUDONYM_KEY = os.getenv("FLAIR_PSEUDONYM_KEY", "").encode("utf-8")
+if not PSEUDONYM_KEY:
+    logger.warning("FLAIR_PSEUDONYM_KEY not set, using a random per-process key")
+    PSEUDONYM_KEY = secrets.token_bytes(32)
+REPLACERS = {strategy: Replacer(strategy, PSEUDONYM_KEY) for strategy in STRATEGIES}
+
+# /anonymize/stream: characters of input analyzed per segment
+STREAM_SEGMENT_CHARS = int(os.getenv("FLAIR_STREAM_SEGMENT_CHARS", "20000"))
+
+# Extra/overriding regex pattern sets per language (JSON file, see patterns.py)
+PATTERNS_FILE = os.getenv("FLAIR_PATTERNS_FILE", "").strip()
+if PATTERNS_FILE:
+    load_pattern_file(PATTERNS_FILE)
+
+# Result cache keys are keyed digests; without FLAIR_CACHE_KEY the SQLite tier
+# only serves entries written by this process
+CACHE_KEY = os.getenv("FLAIR_CACHE_KEY", "").encode("utf-8")
+if not CACHE_KEY:
+    if CACHE_DB_PATH:
+        logger.warning("FLAIR_CACHE_KEY not set, persisted cache entries are not reused after restart")
+    CACHE_KEY = secrets.token_bytes(32)
+# Changed patterns or chunk settings change results, so they are part of every key
+CACHE_CONFIG = cache_key(b"config", patterns_fingerprint(), CHUNK_MAX_CHARS, CHUNK_OVERLAP)
 
 # Request/Response models
 class AnalyzeRequest(BaseModel):
@@ -36,6 +229,9 @@ class AnalyzeRequest(BaseModel):
     language: str = "de"
     include_patterns: bool = True
 
+class AnonymizeRequest(AnalyzeRequest):
+    strategy: Literal["placeholder", "pseudonym", "mask"] = "placeholder"
+
 class Entity(BaseModel):
     text: str
     type: str
@@ -51,77 +247,155 @@ class AnalyzeResponse(BaseModel):
 @app.get("/health")
 async def health():
     """Health check endpoint"""
-    return {"status": "healthy", "models": ["de-ner-large", "ner-large"]}
+    return {"status": "healthy", "models": MODELS.status()}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    update_memory_gauges(WORKER_POOL.pids() if WORKER_POOL is not None else [])
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+REDACTED = "***REDACTED***"
+
+def build_response(entities: List[Entity]) -> AnalyzeResponse:
+    for entity in entities:
+        ENTITIES.labels(type=entity.type, source="pattern" if entity.text == REDACTED else "ner").inc()
+    
+    # Calculate risk score
+    risk_score = min(len(entities) * 20, 100)
+    
+    return AnalyzeResponse(
+        entities=entities,
+        has_pii=len(entities) > 0,
+        risk_score=risk_score
+    )
+
+async def analyze(request: AnalyzeRequest) -> AnalyzeResponse:
+    """Run NER and pattern detection on one request"""
+    language = model_key(request.language)
+    document_key = None
+    if RESULT_CACHE is not None:
+        document_key = cache_key(
+            CACHE_KEY,
+            "document",
+            request.text,
+            request.language,
+            request.include_patterns,
+            MODELS.version(language),
+            CACHE_CONFIG,
+        )
+        cached = (await cache_get([document_key], "document"))[0]
+        if cached is not None:
+            return build_response([
+                Entity(
+                    text=REDACTED if redacted else request.text[start:end],
+                    type=entity_type,
+                    start=start,
+                    end=end,
+                    score=score
+                )
+                for entity_type, start, end, score, redacted in cached
+            ])
+    
+    started = time.perf_counter()
+    entities = []
+    stages: Dict[str, float] = {}
+    
+    # NER Detection on sentence chunks, batched with concurrent requests for the same model
+    chunks = split_text(request.text, CHUNK_MAX_CHARS, CHUNK_OVERLAP)
+    spans = await tag_chunks(language, chunks, stages)
+    
+    for text, tag, start, end, score in spans:
+        entities.append(Entity(
+            text=text,
+            type=tag,
+            start=start,
+            end=end,
+            score=score
+        ))
+    
+    # Pattern-based detection (German by default, see patterns.py)
+    engine = PATTERN_SETS.get(request.language)
+    if request.include_patterns and engine is not None:
+        regex_started = time.perf_counter()
+        # Avoid duplicates: skip matches starting inside an NER entity
+        ner_index = IntervalIndex([(start, end) for _, _, start, end, _ in spans])
+        for pattern_name, start, end in engine.detect(request.text, exclude=ner_index):
+            entities.append(Entity(
+                text=REDACTED,  # Don't expose actual PII
+                type=pattern_name,
+                start=start,
+                end=end,
+                score=1.0
+            ))
+        stages["regex"] = time.perf_counter() - regex_started
+    
+    observe_stages(stages, language, len(request.text))
+    
+    if document_key is not None:
+        await cache_put([(
+            document_key,
+            [[e.type, e.start, e.end, e.score, e.text == REDACTED] for e in entities],
+            time.perf_counter() - started,
+        )])
+    
+    return build_response(entities)
 
 @app.post("/analyze", response_model=AnalyzeResponse)
 async def analyze_text(request: AnalyzeRequest):
     """Analyze text for PII entities"""
     try:
-        entities = []
-        
-        # Select appropriate tagger
-        tagger = tagger_de if request.language == "de" else tagger_en
-        
-        # NER Detection
-        sentence = Sentence(request.text)
-        tagger.predict(sentence)
-        
-        for entity in sentence.get_spans('ner'):
-            entities.append(Entity(
-                text=entity.text,
-                type=entity.tag,
-                start=entity.start_position,
-                end=entity.end_position,
-                score=entity.score
-            ))
-        
-        # Pattern-based detection (especially for German)
-        if request.include_patterns and request.language == "de":
-            for pattern_name, pattern_regex in GERMAN_PATTERNS.items():
-                for match in re.finditer(pattern_regex, request.text, re.IGNORECASE):
-                    # Avoid duplicates
-                    if not any(e.start <= match.start() < e.end for e in entities):
-                        entities.append(Entity(
-                            text="***REDACTED***",  # Don't expose actual PII
-                            type=pattern_name,
-                            start=match.start(),
-                            end=match.end(),
-                            score=1.0
-                        ))
-        
-        # Calculate risk score
-        risk_score = min(len(entities) * 20, 100)
-        
-        return AnalyzeResponse(
-            entities=entities,
-            has_pii=len(entities) > 0,
-            risk_score=risk_score
-        )
+        with PROFILER.track("/analyze"):
+            analysis = await analyze(request)
+            # Serialized here rather than by FastAPI so the stage can be timed
+            started = time.perf_counter()
+            body = analysis.model_dump_json()
+            observe_stages(
+                {"serialize": time.perf_counter() - started}, model_key(request.language), len(request.text)
+            )
+        return Response(content=body, media_type="application/json")
     
     except Exception as e:
         logger.error(f"Analysis error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/analyze/batch")
+async def analyze_batch(request: Request):
+    """
+    Analyze many documents in one call.
+    
+    Body: a JSON array of AnalyzeRequest objects, or NDJSON (Content-Type:
+    application/x-ndjson) with one AnalyzeRequest per line. Results are
+    streamed back as NDJSON in completion order; each line carries the
+    zero-based "index" of its input and either the AnalyzeResponse fields
+    or an "error".
+    """
+    async def handle(item: AnalyzeRequest) -> dict:
+        analysis = await analyze(item)
+        started = time.perf_counter()
+        result = analysis.model_dump()
+        observe_stages({"serialize": time.perf_counter() - started}, model_key(item.language), len(item.text))
+        return result
+    
+    items = iter_bulk_items(request, AnalyzeRequest, max_line_bytes=BULK_MAX_LINE_BYTES)
+    return DuplexStreamingResponse(
+        stream_results(items, handle, max_inflight=BULK_MAX_INFLIGHT),
+        media_type=NDJSON_MEDIA_TYPE,
+    )
+
 @app.post("/anonymize")
-async def anonymize_text(request: AnalyzeRequest):
+async def anonymize_text(request: AnonymizeRequest):
     """Anonymize detected PII in text"""
     try:
-        # First analyze
-        analysis = await analyze_text(request)
-        
-        # Replace entities with placeholders
-        anonymized_text = request.text
-        offset = 0
-        
-        # Sort entities by start position (reverse)
-        sorted_entities = sorted(analysis.entities, key=lambda e: e.start, reverse=True)
-        
-        for entity in sorted_entities:
-            placeholder = f"[{entity.type}]"
-            anonymized_text = (
-                anonymized_text[:entity.start] + 
-                placeholder + 
-                anonymized_text[entity.end:]
+        with PROFILER.track("/anonymize"):
+            # First analyze
+            analysis = await analyze(request)
+            
+            # Replace entities in one pass over the sorted, merged spans
+            anonymized_text = anonymize(
+                request.text,
+                [(entity.start, entity.end, entity.type) for entity in analysis.entities],
+                REPLACERS[request.strategy],
             )
         
         return {
@@ -135,16 +409,60 @@ async def anonymize_text(request: AnalyzeRequest):
         logger.error(f"Anonymization error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/anonymize/stream")
+async def anonymize_stream(
+    request: Request,
+    language: str = "de",
+    include_patterns: bool = True,
+    strategy: Literal["placeholder", "pseudonym", "mask"] = "placeholder",
+):
+    """
+    Anonymize a large plain-text body (UTF-8) as a stream.
+    
+    The body is cut into segments of about FLAIR_STREAM_SEGMENT_CHARS at
+    sentence boundaries; each segment is analyzed and written back as soon
+    as it is done, so neither input nor output is held in memory as a whole.
+    """
+    replacer = REPLACERS[strategy]
+    
+    async def anonymize_segment(segment: str) -> str:
+        analysis = await analyze(AnalyzeRequest(text=segment, language=language, include_patterns=include_patterns))
+        return anonymize(segment, [(e.start, e.end, e.type) for e in analysis.entities], replacer)
+    
+    async def generate():
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        buffer = ""
+        # A few segments are analyzed ahead while earlier ones are written out
+        pending = []
+        try:
+            async for chunk in request.stream():
+                buffer += decoder.decode(chunk)
+                while cut := split_segment(buffer, STREAM_SEGMENT_CHARS):
+                    segment, buffer = buffer[:cut], buffer[cut:]
+                    pending.append(asyncio.create_task(anonymize_segment(segment)))
+                    if len(pending) > 2:
+                        yield await pending.pop(0)
+            buffer += decoder.decode(b"", final=True)
+            if buffer:
+                pending.append(asyncio.create_task(anonymize_segment(buffer)))
+            while pending:
+                yield await pending.pop(0)
+        except Exception as e:
+            logger.error(f"Streaming anonymization error: {str(e)}")
+            raise
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    return DuplexStreamingResponse(generate(), media_type="text/plain")
+
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
     return {
         "service": "Flair PII Detection API",
         "version": "1.0.0",
-        "endpoints": ["/health", "/analyze", "/anonymize"],
+        "endpoints": ["/health", "/metrics", "/analyze", "/analyze/batch", "/anonymize", "/anonymize/stream"],
         "languages": ["en", "de"],
-        "models": {
-            "de": "de-ner-large",
-            "en": "ner-large"
-        }
+        "models": MODEL_NAMES
     }
@@ -0,0 +1,203 @@
+"""
+Dynamic micro-batching for Flair NER inference.
+
+Requests are queued per model (language). A collector per language waits up
+to `max_wait` after the first queued request for more to arrive, then hands
+up to `max_batch_size` texts to one predict() call. The call runs in a
+dedicated inference thread, so the event loop stays free while the model
+works, and the resulting spans are fanned back out to each request's future.
+While the model is busy the queue keeps filling, so batches grow with load.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable
+
+from prometheus_client import Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+# (text, tag, start_position, end_position, score)
+SpanTuple = tuple[str, str, int, int, float]
+# (language, texts) -> (spans per text, seconds per stage); runs in the inference thread
+RunBatch = Callable[[str, list[str]], tuple[list[list[SpanTuple]], dict[str, float]]]
+
+BATCH_SIZE = Histogram(
+    "flair_batch_size",
+    "Texts passed to one predict() call",
+    labelnames=["language"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+QUEUE_WAIT = Histogram(
+    "flair_queue_wait_seconds",
+    "Time a request waited before its batch started",
+    labelnames=["language"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+MODEL_SECONDS = Histogram(
+    "flair_model_seconds",
+    "Wall time of one batched predict() call",
+    labelnames=["language"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+QUEUE_DEPTH = Gauge(
+    "flair_queue_depth",
+    "Texts waiting for inference",
+    labelnames=["language"],
+)
+
+
+@dataclass
+class _Pending:
+    texts: list[str]
+    future: asyncio.Future
+    enqueued: float
+    stages: dict[str, float] | None = None
+
+
+class InferenceScheduler:
+    def __init__(self, run_batch: RunBatch, max_batch_size: int, max_wait: float, concurrency: int = 1):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.concurrency = max(1, concurrency)
+
+        self._queues: dict[str, deque[_Pending]] = {}
+        self._queued_texts: dict[str, int] = {}
+        self._wakeups: dict[str, asyncio.Event] = {}
+        self._collectors: dict[str, asyncio.Task] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._slots: asyncio.Semaphore | None = None
+        self._executor: ThreadPoolExecutor | None = None
+
+    async def start(self) -> None:
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="flair-infer")
+
+    async def stop(self) -> None:
+        for task in self._collectors.values():
+            task.cancel()
+        await asyncio.gather(*self._collectors.values(), *self._tasks, return_exceptions=True)
+        self._collectors.clear()
+        for language, queue in self._queues.items():
+            while queue:
+                pending = queue.popleft()
+                if not pending.future.done():
+                    pending.future.set_exception(RuntimeError("Inference scheduler stopped"))
+            QUEUE_DEPTH.labels(language=language).set(0)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def predict(
+        self,
+        language: str,
+        texts: list[str],
+        stages: dict[str, float] | None = None,
+    ) -> list[list[SpanTuple]]:
+        """
+        Queue `texts` for the `language` model and wait for their spans.
+        If `stages` is given, this request's share of the batch's per-stage
+        seconds (by characters) is added to it.
+        """
+        if not texts:
+            return []
+        if self._executor is None:
+            raise RuntimeError("Inference scheduler is not running")
+        loop = asyncio.get_running_loop()
+        if language not in self._queues:
+            self._queues[language] = deque()
+            self._queued_texts[language] = 0
+            self._wakeups[language] = asyncio.Event()
+            self._collectors[language] = asyncio.create_task(self._collect(language))
+
+        pending = _Pending(texts=texts, future=loop.create_future(), enqueued=loop.time(), stages=stages)
+        self._queues[language].append(pending)
+        self._queued_texts[language] += len(texts)
+        QUEUE_DEPTH.labels(language=language).inc(len(texts))
+        self._wakeups[language].set()
+        return await pending.future
+
+    async def _collect(self, language: str) -> None:
+        loop = asyncio.get_running_loop()
+        queue = self._queues[language]
+        wakeup = self._wakeups[language]
+        while True:
+            while not queue:
+                wakeup.clear()
+                await wakeup.wait()
+
+            # Give concurrent requests up to max_wait to join the first one
+            deadline = queue[0].enqueued + self.max_wait
+            while self._queued_texts[language] < self.max_batch_size and loop.time() < deadline:
+                wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    break
+
+            await self._slots.acquire()
+            batch = self._take(language)
+            if not batch:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._run(language, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _take(self, language: str) -> list[_Pending]:
+        queue = self._queues[language]
+        batch: list[_Pending] = []
+        size = 0
+        while queue:
+            pending = queue[0]
+            if batch and size + len(pending.texts) > self.max_batch_size:
+                break
+            queue.popleft()
+            self._queued_texts[language] -= len(pending.texts)
+            QUEUE_DEPTH.labels(language=language).dec(len(pending.texts))
+            if pending.future.done():
+                # Caller went away (client disconnect, timeout)
+                continue
+            batch.append(pending)
+            size += len(pending.texts)
+        return batch
+
+    async def _run(self, language: str, batch: list[_Pending]) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            now = loop.time()
+            for pending in batch:
+                QUEUE_WAIT.labels(language=language).observe(now - pending.enqueued)
+            texts = [text for pending in batch for text in pending.texts]
+            BATCH_SIZE.labels(language=language).observe(len(texts))
+
+            started = time.perf_counter()
+            try:
+                results, stage_seconds = await loop.run_in_executor(self._executor, self.run_batch, language, texts)
+            except Exception as exc:
+                logger.error(f"Batch inference failed ({language}, {len(texts)} texts): {exc}")
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(exc)
+                return
+            finally:
+                MODEL_SECONDS.labels(language=language).observe(time.perf_counter() - started)
+
+            total_chars = sum(len(text) for text in texts) or 1
+            offset = 0
+            for pending in batch:
+                part = results[offset : offset + len(pending.texts)]
+                offset += len(pending.texts)
+                if pending.stages is not None:
+                    share = sum(len(text) for text in pending.texts) / total_chars
+                    for stage, seconds in stage_seconds.items():
+                        pending.stages[stage] = pending.stages.get(stage, 0.0) + seconds * share
+                if not pending.future.done():
+                    pending.future.set_result(part)
+        finally:
+            self._slots.release()
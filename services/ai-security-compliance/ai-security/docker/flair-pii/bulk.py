@@ -0,0 +1,141 @@
+"""
+Bulk analysis helpers for /analyze/batch.
+
+Input is either a JSON array of requests or an NDJSON stream (one request per
+line). NDJSON is parsed line by line as the body arrives, at most
+`max_inflight` documents are being analyzed at any time, and every result is
+written out as one NDJSON line as soon as it is ready. Memory therefore stays
+flat regardless of how many documents a client sends.
+"""
+
+import asyncio
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+class BulkInputError(Exception):
+    pass
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that may keep reading the request body while it sends.
+
+    Under ASGI < 2.4 Starlette listens for client disconnects by calling
+    receive() alongside the response, which would swallow the remaining body
+    chunks. Here disconnects surface through request.stream() or send()
+    instead.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+
+
+async def iter_ndjson_lines(request: Request, max_line_bytes: int) -> AsyncIterator[bytes]:
+    buffer = bytearray()
+    async for chunk in request.stream():
+        buffer += chunk
+        while (newline := buffer.find(b"\n")) != -1:
+            line = bytes(buffer[:newline]).strip()
+            del buffer[: newline + 1]
+            if line:
+                yield line
+        if len(buffer) > max_line_bytes:
+            raise BulkInputError(f"NDJSON line exceeds {max_line_bytes} bytes")
+    line = bytes(buffer).strip()
+    if line:
+        yield line
+
+
+async def iter_bulk_items(
+    request: Request,
+    model: type[BaseModel],
+    max_line_bytes: int,
+) -> AsyncIterator[BaseModel | Exception]:
+    """
+    Yields one validated `model` per document, or the validation error for
+    documents that could not be parsed (so one bad line does not abort the run).
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in (NDJSON_MEDIA_TYPE, "application/jsonl", "application/ndjson"):
+        async for line in iter_ndjson_lines(request, max_line_bytes):
+            try:
+                yield model.model_validate_json(line)
+            except ValidationError as exc:
+                yield exc
+        return
+
+    try:
+        documents = json.loads(await request.body())
+    except ValueError as exc:
+        raise BulkInputError(f"Invalid JSON body: {exc}") from exc
+    if isinstance(documents, dict):
+        documents = documents.get("requests")
+    if not isinstance(documents, list):
+        raise BulkInputError("Expected a JSON array of requests or an NDJSON body")
+    for document in documents:
+        try:
+            yield model.model_validate(document)
+        except ValidationError as exc:
+            yield exc
+
+
+async def stream_results(
+    items: AsyncIterator[Any],
+    handle: Callable[[Any], Awaitable[dict]],
+    max_inflight: int,
+) -> AsyncIterator[str]:
+    """
+    Run `handle` over `items` with at most `max_inflight` running and yield
+    NDJSON lines in completion order, each tagged with the input index.
+    """
+
+    async def run(index: int, item: Any) -> dict:
+        if isinstance(item, Exception):
+            return {"index": index, "error": str(item)}
+        try:
+            return {"index": index, **(await handle(item))}
+        except Exception as exc:
+            return {"index": index, "error": str(exc)}
+
+    pending: set[asyncio.Task] = set()
+    reader: asyncio.Future | None = None
+    index = 0
+    exhausted = False
+    try:
+        while True:
+            # Keep reading input while earlier documents are still running
+            if reader is None and not exhausted and len(pending) < max_inflight:
+                reader = asyncio.ensure_future(items.__anext__())
+            waiting = pending | {reader} if reader is not None else pending
+            if not waiting:
+                return
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is reader:
+                    reader = None
+                    try:
+                        item = task.result()
+                    except StopAsyncIteration:
+                        exhausted = True
+                        continue
+                    except BulkInputError as exc:
+                        exhausted = True
+                        yield json.dumps({"index": index, "error": str(exc)}) + "\n"
+                        continue
+                    pending.add(asyncio.create_task(run(index, item)))
+                    index += 1
+                else:
+                    pending.discard(task)
+                    yield json.dumps(task.result(), ensure_ascii=False) + "\n"
+    finally:
+        if reader is not None:
+            reader.cancel()
+        for task in pending:
+            task.cancel()
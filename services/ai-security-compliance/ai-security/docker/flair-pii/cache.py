@@ -0,0 +1,149 @@
+"""
+Content-addressed cache of analysis results.
+
+Keys are HMAC-SHA-256 digests of the inputs (text, language, options, model
+version, pattern and chunking configuration) under a secret key, and values
+hold only offsets, types and scores; the raw text is never stored, so the
+cache does not become a second copy of the PII it detects, and without the
+key a persisted cache cannot be used to test whether a known text was seen.
+Entries live in a bounded in-memory LRU, optionally backed by a local SQLite
+file that survives restarts.
+
+Every entry also records the inference time it cost to compute, which is
+counted as saved time on each hit.
+"""
+
+import hashlib
+import hmac
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from prometheus_client import Counter, Gauge
+
+CACHE_LOOKUPS = Counter(
+    "flair_cache_lookups_total",
+    "Result cache lookups by level (document, chunk) and result",
+    labelnames=["level", "result"],
+)
+CACHE_SAVED_SECONDS = Counter(
+    "flair_cache_saved_seconds_total",
+    "Inference time avoided by result cache hits",
+    labelnames=["level"],
+)
+CACHE_ENTRIES = Gauge(
+    "flair_cache_entries",
+    "Entries held in the in-memory result cache",
+)
+
+_PRUNE_EVERY = 1000
+# Keys per SELECT ... IN (...), below SQLite's bound-variable limit
+_SQL_BATCH = 500
+
+
+def cache_key(secret: bytes, *parts: Any) -> str:
+    digest = hmac.new(secret, digestmod=hashlib.sha256)
+    for part in parts:
+        digest.update(str(part).encode("utf-8", errors="surrogatepass"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Thread-safe LRU of key -> (value, cost seconds) with an optional SQLite tier.
+    Values must be JSON-serializable.
+    """
+
+    def __init__(self, max_entries: int, db_path: str = "", db_max_entries: int = 1_000_000):
+        self.max_entries = max_entries
+        self.db_max_entries = db_max_entries
+        self.persistent = bool(db_path)
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+        self._puts = 0
+        self._db: sqlite3.Connection | None = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, cost REAL NOT NULL, stored_at REAL NOT NULL)"
+            )
+
+    def _remember(self, key: str, entry: tuple[Any, float]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        CACHE_ENTRIES.set(len(self._entries))
+
+    def get_many(self, keys: list[str], level: str) -> list[Any | None]:
+        """
+        Cached values for `keys`, None where missing.
+        """
+        found: dict[str, tuple[tuple[Any, float], str]] = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = (entry, "hit_memory")
+            missing = [key for key in keys if key not in found]
+            for i in range(0, len(missing) if self._db is not None else 0, _SQL_BATCH):
+                batch = missing[i : i + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._db.execute(
+                    f"SELECT key, value, cost FROM results WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, value, cost in rows:
+                    entry = (json.loads(value), cost)
+                    self._remember(key, entry)
+                    found[key] = (entry, "hit_disk")
+
+        values = []
+        for key in keys:
+            hit = found.get(key)
+            if hit is None:
+                CACHE_LOOKUPS.labels(level=level, result="miss").inc()
+                values.append(None)
+                continue
+            (value, cost), result = hit
+            CACHE_LOOKUPS.labels(level=level, result=result).inc()
+            CACHE_SAVED_SECONDS.labels(level=level).inc(cost)
+            values.append(value)
+        return values
+
+    def put_many(self, items: list[tuple[str, Any, float]]) -> None:
+        """
+        Store (key, value, cost seconds) items.
+        """
+        with self._lock:
+            for key, value, cost in items:
+                self._remember(key, (value, cost))
+            if self._db is None:
+                return
+            now = time.time()
+            self._db.executemany(
+                "INSERT OR REPLACE INTO results (key, value, cost, stored_at) VALUES (?, ?, ?, ?)",
+                [(key, json.dumps(value), cost, now) for key, value, cost in items],
+            )
+            self._puts += len(items)
+            if self._puts >= _PRUNE_EVERY:
+                self._puts = 0
+                self._db.execute(
+                    "DELETE FROM results WHERE key IN "
+                    "(SELECT key FROM results ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                    (self.db_max_entries,),
+                )
+
+    def close(self) -> None:
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+                self._db = None
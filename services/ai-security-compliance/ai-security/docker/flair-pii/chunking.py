@@ -0,0 +1,120 @@
+"""
+Splitting of long documents into model-sized chunks.
+
+Text is cut at sentence boundaries and consecutive sentences are packed into
+chunks of at most `max_chars`. A sentence longer than that is cut into
+overlapping windows at whitespace. Every chunk is a slice of the original
+text, so a span found in a chunk maps back to the document by adding the
+chunk's start offset. Each chunk also owns a "core" range: windows overlap,
+but a span is only kept by the chunk whose core contains its start, which
+makes every entity come out exactly once.
+"""
+
+import re
+from dataclasses import dataclass
+
+from batching import SpanTuple
+
+# End of sentence punctuation followed by whitespace, or a line break
+_SENTENCE_END = re.compile(r"(?<=[.!?…])[\"'»”)\]]*\s+|\n+")
+
+
+@dataclass(frozen=True)
+class Chunk:
+    start: int
+    end: int
+    core_start: int
+    core_end: int
+    text: str
+
+
+def _sentence_bounds(text: str) -> list[tuple[int, int]]:
+    bounds = []
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        if match.end() > start:
+            bounds.append((start, match.end()))
+            start = match.end()
+    if start < len(text):
+        bounds.append((start, len(text)))
+    return bounds
+
+
+def _windows(text: str, start: int, end: int, max_chars: int, overlap: int) -> list[tuple[int, int]]:
+    """
+    Overlapping windows over text[start:end], cut at whitespace where possible.
+    """
+    windows = []
+    pos = start
+    while pos < end:
+        stop = min(pos + max_chars, end)
+        if stop < end:
+            space = text.rfind(" ", pos + max_chars // 2, stop)
+            if space != -1:
+                stop = space + 1
+        windows.append((pos, stop))
+        if stop >= end:
+            break
+        next_pos = stop - overlap
+        if overlap:
+            space = text.find(" ", next_pos, stop)
+            next_pos = space + 1 if space != -1 else next_pos
+        pos = max(next_pos, pos + 1)
+    return windows
+
+
+def split_text(text: str, max_chars: int, overlap: int) -> list[Chunk]:
+    """
+    Chunks covering `text`; a single chunk if it is short or max_chars <= 0.
+    """
+    if max_chars <= 0 or len(text) <= max_chars:
+        return [Chunk(0, len(text), 0, len(text), text)]
+    overlap = max(0, min(overlap, max_chars // 2))
+
+    ranges: list[tuple[int, int]] = []
+    pack_start = pack_end = 0
+    for start, end in _sentence_bounds(text):
+        if end - pack_start <= max_chars:
+            pack_end = end
+            continue
+        if pack_end > pack_start:
+            ranges.append((pack_start, pack_end))
+        if end - start <= max_chars:
+            pack_start, pack_end = start, end
+        else:
+            ranges.extend(_windows(text, start, end, max_chars, overlap))
+            pack_start = pack_end = end
+    if pack_end > pack_start:
+        ranges.append((pack_start, pack_end))
+
+    chunks = []
+    for i, (start, end) in enumerate(ranges):
+        # Overlapping neighbours split the shared region between them
+        core_start = start if i == 0 or ranges[i - 1][1] <= start else (start + ranges[i - 1][1]) // 2
+        core_end = end if i == len(ranges) - 1 or ranges[i + 1][0] >= end else (ranges[i + 1][0] + end) // 2
+        chunks.append(Chunk(start, end, core_start, core_end, text[start:end]))
+    return chunks
+
+
+def merge_chunk_spans(chunks: list[Chunk], spans_per_chunk: list[list[SpanTuple]]) -> list[SpanTuple]:
+    """
+    Map chunk-local spans to document offsets and drop overlap duplicates.
+    """
+    spans: list[SpanTuple] = []
+    for chunk, chunk_spans in zip(chunks, spans_per_chunk):
+        for text, tag, start, end, score in chunk_spans:
+            start += chunk.start
+            end += chunk.start
+            if chunk.core_start <= start < chunk.core_end:
+                spans.append((text, tag, start, end, score))
+
+    spans.sort(key=lambda s: (s[2], -s[3]))
+    kept: list[SpanTuple] = []
+    for span in spans:
+        if kept and span[2] < kept[-1][3]:
+            # Overlaps the previous span: keep the more confident one
+            if span[4] > kept[-1][4]:
+                kept[-1] = span
+            continue
+        kept.append(span)
+    return kept
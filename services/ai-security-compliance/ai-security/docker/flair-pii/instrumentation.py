@@ -0,0 +1,154 @@
+"""
+Request-level instrumentation for flair-pii.
+
+- flair_stage_seconds: time per pipeline stage (tokenize, forward, regex,
+  serialize), labelled by language and text-length bucket. Tokenize and
+  forward are measured per batch in the inference thread or worker and
+  split across the requests in the batch by their share of characters.
+- flair_entities_total: detected entities by type and source.
+- flair_memory_bytes: RSS and PSS of the API process and of the inference
+  workers; PSS shows how much of the model memory is actually shared.
+- SlowRequestProfiler: opt-in sampling profiler. While tracked requests
+  run, a background thread samples the Python stacks of all threads; when
+  a request exceeds the threshold, its hottest stacks are logged in
+  collapsed "frame;frame;frame count" form (flamegraph.pl compatible).
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = Histogram(
+    "flair_stage_seconds",
+    "Time spent per analysis stage",
+    labelnames=["stage", "language", "length"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+ENTITIES = Counter(
+    "flair_entities_total",
+    "Detected entities by type and source (ner, pattern)",
+    labelnames=["type", "source"],
+)
+MEMORY = Gauge(
+    "flair_memory_bytes",
+    "Memory of the API process and the inference workers",
+    labelnames=["process", "kind"],
+)
+
+_LENGTH_BUCKETS = ((1_000, "<1k"), (10_000, "1k-10k"), (100_000, "10k-100k"))
+
+
+def length_bucket(length: int) -> str:
+    for limit, label in _LENGTH_BUCKETS:
+        if length < limit:
+            return label
+    return ">=100k"
+
+
+def observe_stages(stages: dict[str, float], language: str, length: int) -> None:
+    bucket = length_bucket(length)
+    for stage, seconds in stages.items():
+        STAGE_SECONDS.labels(stage=stage, language=language, length=bucket).observe(seconds)
+
+
+def _read_memory(pid: int | str) -> tuple[int, int]:
+    """
+    (RSS, PSS) in bytes from /proc; zeros where unavailable.
+    """
+    rss = pss = 0
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Rss:"):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith("Pss:"):
+                    pss = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return rss, pss
+
+
+def update_memory_gauges(worker_pids: Iterable[int]) -> None:
+    rss, pss = _read_memory("self")
+    MEMORY.labels(process="api", kind="rss").set(rss)
+    MEMORY.labels(process="api", kind="pss").set(pss)
+    worker_rss = worker_pss = 0
+    for pid in worker_pids:
+        child_rss, child_pss = _read_memory(pid)
+        worker_rss += child_rss
+        worker_pss += child_pss
+    MEMORY.labels(process="workers", kind="rss").set(worker_rss)
+    MEMORY.labels(process="workers", kind="pss").set(worker_pss)
+
+
+class SlowRequestProfiler:
+    def __init__(self, threshold: float, interval: float, top: int = 15):
+        self.threshold = threshold
+        self.interval = interval
+        self.top = top
+        self._active: dict[int, StackCounter] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._next_id = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._sample_loop, name="flair-profiler", daemon=True)
+            self._thread.start()
+
+    def _sample_loop(self) -> None:
+        own = threading.get_ident()
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.interval)
+            stacks = [
+                ";".join(f"{f.name} ({os.path.basename(f.filename)}:{f.lineno})" for f in traceback.extract_stack(frame))
+                for ident, frame in sys._current_frames().items()
+                if ident != own
+            ]
+            with self._lock:
+                if not self._active:
+                    self._wakeup.clear()
+                    continue
+                for counter in self._active.values():
+                    counter.update(stacks)
+
+    @contextmanager
+    def track(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        with self._lock:
+            self._next_id += 1
+            request_id = self._next_id
+            self._active[request_id] = StackCounter()
+            self._ensure_thread()
+            self._wakeup.set()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                samples = self._active.pop(request_id)
+            if elapsed >= self.threshold and samples:
+                hot = "\n".join(f"{stack} {count}" for stack, count in samples.most_common(self.top))
+                logger.warning(
+                    f"Slow request {name}: {elapsed * 1000:.0f} ms, "
+                    f"{sum(samples.values())} stack samples, hottest:\n{hot}"
+                )
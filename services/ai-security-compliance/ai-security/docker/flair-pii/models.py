@@ -0,0 +1,181 @@
+"""
+On-demand management of the Flair NER models.
+
+Each language's tagger is loaded the first time it is needed (or at startup
+when listed for preloading) and can be unloaded again after a period without
+use, so a replica that only sees German traffic never holds the English model.
+Lighter model variants can be selected per deployment, and on CPU the loaded
+model can be converted to int8 with torch dynamic quantization (Linear and
+LSTM layers), which roughly quarters their weight memory and speeds up
+inference at a small accuracy cost.
+"""
+
+import gc
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from flair.models import SequenceTagger
+from prometheus_client import Gauge
+
+logger = logging.getLogger(__name__)
+
+MODEL_LOADED = Gauge(
+    "flair_model_loaded",
+    "1 while the model for a language is loaded",
+    labelnames=["language", "model"],
+)
+MODEL_MEMORY = Gauge(
+    "flair_model_memory_bytes",
+    "Tensor memory of the loaded model (parameters and buffers)",
+    labelnames=["language"],
+)
+MODEL_LOAD_SECONDS = Gauge(
+    "flair_model_load_seconds",
+    "Time the last load of a language's model took",
+    labelnames=["language"],
+)
+
+# Model names per variant; FLAIR_MODEL_DE / FLAIR_MODEL_EN override single languages
+MODEL_VARIANTS = {
+    "large": {"de": "de-ner-large", "en": "ner-large"},
+    "standard": {"de": "de-ner", "en": "ner"},
+    "fast": {"de": "de-ner", "en": "ner-fast"},
+}
+
+
+def _tensor_bytes(value) -> int:
+    import torch
+
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        return sum(_tensor_bytes(item) for item in value)
+    return 0
+
+
+def model_memory_bytes(tagger) -> int:
+    """
+    Bytes held by the model's tensors; state_dict() also covers the packed
+    weights of quantized layers, which parameters() does not list.
+    """
+    if not hasattr(tagger, "state_dict"):
+        return 0
+    return sum(_tensor_bytes(value) for value in tagger.state_dict().values())
+
+
+def quantize(tagger):
+    import flair
+    import torch
+
+    if flair.device.type != "cpu":
+        logger.warning(f"Dynamic int8 quantization is CPU-only, keeping the float model on {flair.device}")
+        return tagger
+    return torch.quantization.quantize_dynamic(tagger, {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8)
+
+
+class _Slot:
+    def __init__(self, name: str):
+        self.name = name
+        self.tagger = None
+        self.lock = threading.Lock()
+        self.in_use = 0
+        self.last_used = 0.0
+        self.memory = 0
+        self.load_seconds = 0.0
+
+
+class ModelManager:
+    def __init__(self, names: dict[str, str], quantized: bool = False, idle_unload: float = 0):
+        self.quantized = quantized
+        self.idle_unload = idle_unload
+        self._slots = {language: _Slot(name) for language, name in names.items()}
+
+    def name(self, language: str) -> str:
+        return self._slots[language].name
+
+    def version(self, language: str) -> str:
+        """
+        Identifies the model producing results for `language` (cache keys).
+        """
+        return self.name(language) + ("+int8" if self.quantized else "")
+
+    def load(self, language: str):
+        slot = self._slots[language]
+        with slot.lock:
+            if slot.tagger is None:
+                self._load(language, slot)
+            return slot.tagger
+
+    def _load(self, language: str, slot: _Slot) -> None:
+        started = time.perf_counter()
+        logger.info(f"Loading Flair NER model {slot.name} ({language})...")
+        tagger = SequenceTagger.load(slot.name)
+        if self.quantized:
+            tagger = quantize(tagger)
+        slot.tagger = tagger
+        slot.last_used = time.monotonic()
+        slot.load_seconds = time.perf_counter() - started
+        slot.memory = model_memory_bytes(tagger)
+        MODEL_LOADED.labels(language=language, model=slot.name).set(1)
+        MODEL_MEMORY.labels(language=language).set(slot.memory)
+        MODEL_LOAD_SECONDS.labels(language=language).set(slot.load_seconds)
+        logger.info(
+            f"Model {slot.name} loaded in {slot.load_seconds:.1f}s "
+            f"({slot.memory / 1024 / 1024:.0f} MB{', int8' if self.quantized else ''})"
+        )
+
+    @contextmanager
+    def use(self, language: str) -> Iterator:
+        """
+        The tagger for `language`, loaded if needed and protected from
+        idle unloading while the block runs.
+        """
+        slot = self._slots[language]
+        with slot.lock:
+            if slot.tagger is None:
+                self._load(language, slot)
+            slot.in_use += 1
+            tagger = slot.tagger
+        try:
+            yield tagger
+        finally:
+            with slot.lock:
+                slot.in_use -= 1
+                slot.last_used = time.monotonic()
+
+    def unload(self, language: str) -> bool:
+        slot = self._slots[language]
+        with slot.lock:
+            if slot.tagger is None or slot.in_use:
+                return False
+            slot.tagger = None
+            slot.memory = 0
+        gc.collect()
+        MODEL_LOADED.labels(language=language, model=slot.name).set(0)
+        MODEL_MEMORY.labels(language=language).set(0)
+        logger.info(f"Unloaded idle model {slot.name} ({language})")
+        return True
+
+    def unload_idle(self) -> None:
+        if self.idle_unload <= 0:
+            return
+        now = time.monotonic()
+        for language, slot in self._slots.items():
+            if slot.tagger is not None and not slot.in_use and now - slot.last_used > self.idle_unload:
+                self.unload(language)
+
+    def status(self) -> dict[str, dict]:
+        return {
+            language: {
+                "model": slot.name,
+                "loaded": slot.tagger is not None,
+                "quantized": self.quantized,
+                "memory_bytes": slot.memory,
+                "load_seconds": round(slot.load_seconds, 2),
+                "in_use": slot.in_use,
+            }
+            for language, slot in self._slots.items()
+        }
@@ -0,0 +1,107 @@
+"""
+Regex-based PII detection.
+
+All patterns of a language are compiled once into a single alternation of
+named groups, so a text is scanned in one pass no matter how many pattern
+types exist. Where two patterns could match at the same position, the one
+listed first wins. Matches that start inside an NER entity are dropped with
+a binary search over the sorted, non-overlapping entity intervals instead of
+comparing every match with every entity.
+
+Pattern sets are registered per language; FLAIR_PATTERNS_FILE can point to a
+JSON file of {"<language>": {"<TYPE>": "<regex>", ...}} that adds or
+replaces sets at startup.
+"""
+
+import hashlib
+import json
+import logging
+import re
+from bisect import bisect_right
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+# German PII Patterns
+GERMAN_PATTERNS = {
+    'IBAN': r'[A-Z]{2}\d{2}\s?[\w\s]{4,34}',
+    'PHONE_DE': r'(\+49|0049|0)\s?[1-9]\d{1,14}',
+    'EMAIL': r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}',
+    'STEUER_ID': r'\d{2}\s?\d{3}\s?\d{3}\s?\d{3}',
+    'PLZ': r'\b\d{5}\b',
+    'SOZIALVERSICHERUNG': r'\d{2}\s?\d{6}\s?[A-Z]\s?\d{3}',
+    'PERSONALAUSWEIS': r'[A-Z0-9]{9}',
+}
+
+
+class IntervalIndex:
+    """
+    Sorted, non-overlapping [start, end) intervals with O(log n) point lookup.
+    """
+
+    def __init__(self, intervals: list[tuple[int, int]]):
+        intervals = sorted(intervals)
+        self._starts = [start for start, _ in intervals]
+        self._ends = [end for _, end in intervals]
+
+    def contains(self, pos: int) -> bool:
+        i = bisect_right(self._starts, pos) - 1
+        return i >= 0 and pos < self._ends[i]
+
+
+class PatternEngine:
+    def __init__(self, patterns: dict[str, str], flags: int = re.IGNORECASE):
+        self.types = list(patterns)
+        self.sources = dict(patterns)
+        self.flags = flags
+        # Generated group names keep arbitrary type names out of the regex syntax
+        combined = "|".join(f"(?P<p{i}>{regex})" for i, regex in enumerate(patterns.values()))
+        self._regex = re.compile(combined, flags)
+        self._group_types = {
+            self._regex.groupindex[f"p{i}"]: pattern_type for i, pattern_type in enumerate(self.types)
+        }
+
+    def finditer(self, text: str) -> Iterator[tuple[str, int, int]]:
+        """
+        Yields non-overlapping (type, start, end) matches in text order.
+        """
+        for match in self._regex.finditer(text):
+            if match.end() > match.start():
+                yield self._group_types[match.lastindex], match.start(), match.end()
+
+    def detect(self, text: str, exclude: IntervalIndex | None = None) -> list[tuple[str, int, int]]:
+        return [
+            (pattern_type, start, end)
+            for pattern_type, start, end in self.finditer(text)
+            if exclude is None or not exclude.contains(start)
+        ]
+
+
+PATTERN_SETS: dict[str, PatternEngine] = {}
+
+
+def register_patterns(language: str, patterns: dict[str, str]) -> None:
+    PATTERN_SETS[language] = PatternEngine(patterns)
+
+
+def patterns_fingerprint() -> str:
+    """
+    Digest of every registered pattern set (order, regexes and flags), so
+    cached results are not reused once the patterns change.
+    """
+    sets = {
+        language: [engine.flags, list(engine.sources.items())]
+        for language, engine in sorted(PATTERN_SETS.items())
+    }
+    return hashlib.sha256(json.dumps(sets).encode("utf-8")).hexdigest()
+
+
+def load_pattern_file(path: str) -> None:
+    with open(path, encoding="utf-8") as f:
+        sets = json.load(f)
+    for language, patterns in sets.items():
+        register_patterns(language, patterns)
+        logger.info(f"Loaded {len(patterns)} PII patterns for '{language}' from {path}")
+
+
+register_patterns("de", GERMAN_PATTERNS)
@@ -0,0 +1,172 @@
+"""
+Multi-process inference for Flair NER.
+
+predict() holds the GIL for much of its runtime, so one process uses about
+one core. In worker-pool mode the API process loads the taggers first and
+then forks N inference workers. The children inherit the model weights
+copy-on-write: weights are only read during inference, so the pages stay
+shared and N workers cost little more memory than one. Each batch formed by
+the scheduler is sent to an idle worker over a multiprocessing Pipe, and the
+worker returns plain span tuples.
+
+Every worker limits torch to `torch_threads` intra-op threads so that
+workers x threads does not oversubscribe the CPUs. Forking happens before
+any inference runs in the parent, because OpenMP thread pools do not
+survive fork.
+"""
+
+import gc
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+from multiprocessing.connection import Connection
+
+from prometheus_client import Counter, Gauge
+
+from batching import RunBatch, SpanTuple
+
+logger = logging.getLogger(__name__)
+
+WORKERS_ALIVE = Gauge(
+    "flair_inference_workers",
+    "Inference worker processes currently running",
+)
+WORKER_RESTARTS = Counter(
+    "flair_inference_worker_restarts_total",
+    "Inference worker processes replaced after dying",
+)
+
+
+def configure_torch_threads(threads: int) -> None:
+    if threads <= 0:
+        return
+    import torch
+
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only settable before the first inter-op parallel work in this process
+        pass
+
+
+def _worker_main(conn: Connection, run_batch: RunBatch, torch_threads: int) -> None:
+    # Shutdown is driven by the parent (or EOF if it dies), not by Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    configure_torch_threads(torch_threads)
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        language, texts = job
+        try:
+            conn.send(("ok", run_batch(language, texts)))
+        except Exception as exc:  # noqa: BLE001 - reported to the parent
+            conn.send(("error", f"{type(exc).__name__}: {exc}"))
+
+
+class _Worker:
+    def __init__(self, process: multiprocessing.Process, conn: Connection):
+        self.process = process
+        self.conn = conn
+
+
+class InferenceWorkerPool:
+    def __init__(self, run_batch: RunBatch, workers: int, torch_threads: int):
+        self.run_batch_fn = run_batch
+        self.size = workers
+        self.torch_threads = torch_threads
+        self._ctx = multiprocessing.get_context("fork")
+        self._idle: queue.Queue[_Worker] = queue.Queue()
+        self._workers: list[_Worker] = []
+        self._lock = threading.Lock()
+
+    def _spawn(self) -> _Worker:
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.run_batch_fn, self.torch_threads),
+            name="flair-infer",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        worker = _Worker(process, parent_conn)
+        with self._lock:
+            self._workers.append(worker)
+            WORKERS_ALIVE.set(len(self._workers))
+        return worker
+
+    def start(self) -> None:
+        # Objects allocated so far (models included) move to a permanent GC
+        # generation, so collections in the children do not touch their pages
+        gc.collect()
+        gc.freeze()
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+        logger.info(
+            f"Started {self.size} inference workers ({self.torch_threads or 'default'} torch threads each)"
+        )
+
+    def run_batch(self, language: str, texts: list[str]) -> tuple[list[list[SpanTuple]], dict[str, float]]:
+        """
+        Blocking; called from the scheduler's threads, one per worker. A batch
+        whose worker dies is retried once on a fresh worker.
+        """
+        for attempt in range(2):
+            worker = self._idle.get()
+            if not worker.process.is_alive():
+                self._replace(worker)
+                worker = self._idle.get()
+            try:
+                worker.conn.send((language, texts))
+                status, payload = worker.conn.recv()
+            except (EOFError, OSError) as exc:
+                self._replace(worker)
+                if attempt:
+                    raise RuntimeError(f"Inference worker {worker.process.pid} died") from exc
+                continue
+            self._idle.put(worker)
+            if status != "ok":
+                raise RuntimeError(payload)
+            return payload
+
+    def _replace(self, worker: _Worker) -> None:
+        worker.conn.close()
+        worker.process.join(timeout=1)
+        with self._lock:
+            self._workers.remove(worker)
+        WORKER_RESTARTS.inc()
+        logger.error(f"Inference worker {worker.process.pid} exited ({worker.process.exitcode}), restarting")
+        self._idle.put(self._spawn())
+
+    def pids(self) -> list[int]:
+        with self._lock:
+            return [worker.process.pid for worker in self._workers]
+
+    def stop(self) -> None:
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+            worker.conn.close()
+        WORKERS_ALIVE.set(0)
+        gc.unfreeze()
+
+
+def default_torch_threads(workers: int) -> int:
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
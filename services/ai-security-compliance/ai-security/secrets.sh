@@ -12,6 +12,7 @@ load_all_env "$SCRIPT_DIR"
 
 declare -A SECRETS=(
     ["LLM_GUARD_TOKEN"]="apikey:32"
+    ["FLAIR_CACHE_KEY"]="apikey:64"
 )
 
 ############################################
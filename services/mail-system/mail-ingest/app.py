@@ -1,17 +1,25 @@
 import os
+import asyncio
 import hmac
 import hashlib
 import smtplib
 import re
 import time
 import logging
+from contextlib import asynccontextmanager
+from typing import BinaryIO
 
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import PlainTextResponse, Response
 from fastapi.concurrency import run_in_threadpool
 from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
 
-app = FastAPI()
+from async_smtp import AsyncSMTP, iter_quoted_data
+from coalesce import DeliveryCoalescer
+from idempotency import IdempotencyCache, IdempotencyGuard
+from smtp_pool import AsyncSMTPConnectionPool, SMTPConnectionPool
+from spool import Spool, SpoolDeliveryWorkers
+from streaming import InvalidPayload, PayloadTooLarge, StreamedForm, parse_streaming_form
 
 MAILGUN_WEBHOOK_SIGNING_KEY = os.getenv("MAILGUN_WEBHOOK_SIGNING_KEY", "").strip()
 
@@ -23,6 +31,44 @@ SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT_SECONDS", "15"))
 SMTP_RETRY_ATTEMPTS = int(os.getenv("SMTP_RETRY_ATTEMPTS", "2"))
 SMTP_RETRY_DELAY = float(os.getenv("SMTP_RETRY_DELAY_SECONDS", "2"))
 
+# "blocking": smtplib in the threadpool; "async": non-blocking client on the event loop
+SMTP_CLIENT_MODE = os.getenv("SMTP_CLIENT_MODE", "blocking").strip().lower()
+if SMTP_CLIENT_MODE not in ("blocking", "async"):
+    raise RuntimeError(f"Unsupported SMTP_CLIENT_MODE: {SMTP_CLIENT_MODE!r}")
+
+# Persistent SMTP sessions shared across requests (SMTP_POOL_SIZE=0 disables pooling)
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "8"))
+SMTP_POOL_IDLE_TIMEOUT = float(os.getenv("SMTP_POOL_IDLE_TIMEOUT_SECONDS", "30"))
+SMTP_POOL_MAX_MESSAGES = int(os.getenv("SMTP_POOL_MAX_MESSAGES", "100"))
+SMTP_POOL_NOOP_AFTER = float(os.getenv("SMTP_POOL_NOOP_AFTER_SECONDS", "5"))
+
+# Spool mode: persist the message to disk, ACK Mailgun immediately, deliver in the background
+SPOOL_ENABLED = os.getenv("SPOOL_ENABLED", "false").strip().lower() in ("1", "true", "yes")
+SPOOL_DIR = os.getenv("SPOOL_DIR", "/data/spool")
+SPOOL_SEGMENT_MAX_BYTES = int(os.getenv("SPOOL_SEGMENT_MAX_BYTES", str(64 * 1024 * 1024)))
+SPOOL_WORKERS = int(os.getenv("SPOOL_WORKERS", "4"))
+SPOOL_RETRY_BASE_DELAY = float(os.getenv("SPOOL_RETRY_BASE_DELAY_SECONDS", "2"))
+SPOOL_RETRY_MAX_DELAY = float(os.getenv("SPOOL_RETRY_MAX_DELAY_SECONDS", "300"))
+SPOOL_MAX_ATTEMPTS = int(os.getenv("SPOOL_MAX_ATTEMPTS", "50"))
+
+# Streaming ingest: parse the webhook body incrementally and keep body-mime as raw bytes
+INGEST_STREAMING = os.getenv("INGEST_STREAMING", "false").strip().lower() in ("1", "true", "yes")
+INGEST_SPOOL_THRESHOLD = int(os.getenv("INGEST_SPOOL_THRESHOLD_BYTES", str(1024 * 1024)))
+INGEST_MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", str(50 * 1024 * 1024)))
+INGEST_MAX_FIELD_BYTES = int(os.getenv("INGEST_MAX_FIELD_BYTES", str(10 * 1024 * 1024)))
+
+# Merge identical webhooks (same sender, Message-Id and body) arriving within the window
+# into one SMTP transaction with many RCPTs (0 disables coalescing)
+SMTP_COALESCE_WINDOW_MS = float(os.getenv("SMTP_COALESCE_WINDOW_MS", "0"))
+SMTP_COALESCE_MAX_RECIPIENTS = int(os.getenv("SMTP_COALESCE_MAX_RECIPIENTS", "100"))
+
+# Remember handled webhooks (Mailgun token, Message-Id + recipient) to short-circuit redeliveries
+IDEMPOTENCY_ENABLED = os.getenv("IDEMPOTENCY_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "200000"))
+IDEMPOTENCY_MAX_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BYTES", str(32 * 1024 * 1024)))
+IDEMPOTENCY_DB_PATH = os.getenv("IDEMPOTENCY_DB_PATH", "").strip()
+
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 logging.basicConfig(
     level=LOG_LEVEL,
@@ -46,6 +92,113 @@ SMTP_ERRORS = Counter(
     "SMTP forwarding failures by type",
     labelnames=["reason"],
 )
+REQUEST_PEAK_BYTES = Histogram(
+    "mailgun_request_peak_buffer_bytes",
+    "Peak bytes of webhook payload held in memory per request",
+    labelnames=["mode"],
+    buckets=(64 * 1024, 256 * 1024, 1024**2, 4 * 1024**2, 16 * 1024**2, 64 * 1024**2, 256 * 1024**2),
+)
+
+# Raw MIME is either an in-memory message or a file streamed into SMTP DATA
+MimeSource = bytes | BinaryIO
+
+SMTP_POOL: SMTPConnectionPool | AsyncSMTPConnectionPool | None = None
+if SMTP_POOL_SIZE > 0:
+    pool_class = AsyncSMTPConnectionPool if SMTP_CLIENT_MODE == "async" else SMTPConnectionPool
+    SMTP_POOL = pool_class(
+        host=MAILSERVER_HOST,
+        port=MAILSERVER_PORT,
+        helo_domain=MAILSERVER_HELO_DOMAIN,
+        timeout=SMTP_TIMEOUT,
+        max_size=SMTP_POOL_SIZE,
+        idle_timeout=SMTP_POOL_IDLE_TIMEOUT,
+        max_messages=SMTP_POOL_MAX_MESSAGES,
+        noop_after=SMTP_POOL_NOOP_AFTER,
+    )
+
+
+_RECIPIENT_SEPARATORS = re.compile(r"[,;]")
+
+
+def parse_recipients(envelope_to: str) -> list[str]:
+    recipients = [addr.strip() for addr in _RECIPIENT_SEPARATORS.split(envelope_to) if addr.strip()]
+    if not recipients:
+        raise ValueError("No valid recipients after parsing")
+    return recipients
+
+
+def is_permanent_smtp_failure(exc: Exception) -> bool:
+    """
+    Failures that map to a 4xx webhook response; retrying them cannot succeed.
+    """
+    if isinstance(exc, (smtplib.SMTPRecipientsRefused, ValueError)):
+        return True
+    return isinstance(exc, smtplib.SMTPDataError) and exc.smtp_code in (550, 551, 552, 553, 554)
+
+
+async def deliver_spooled(meta: dict, raw_mime: BinaryIO) -> None:
+    # Single attempt; the spool owns retries and backoff
+    start = time.perf_counter()
+    try:
+        await forward(meta["sender"], meta["recipient"], raw_mime, attempts=1)
+    except Exception as e:
+        SMTP_ERRORS.labels(reason=type(e).__name__).inc()
+        raise
+    finally:
+        SMTP_FORWARD_DURATION.observe(time.perf_counter() - start)
+
+
+SPOOL: SpoolDeliveryWorkers | None = None
+if SPOOL_ENABLED:
+    SPOOL = SpoolDeliveryWorkers(
+        spool=Spool(SPOOL_DIR, segment_max_bytes=SPOOL_SEGMENT_MAX_BYTES),
+        deliver=deliver_spooled,
+        is_permanent=is_permanent_smtp_failure,
+        workers=SPOOL_WORKERS,
+        retry_base_delay=SPOOL_RETRY_BASE_DELAY,
+        retry_max_delay=SPOOL_RETRY_MAX_DELAY,
+        max_attempts=SPOOL_MAX_ATTEMPTS,
+    )
+
+
+IDEMPOTENCY: IdempotencyGuard | None = None
+if IDEMPOTENCY_ENABLED:
+    if IDEMPOTENCY_DB_PATH:
+        os.makedirs(os.path.dirname(IDEMPOTENCY_DB_PATH) or ".", exist_ok=True)
+    IDEMPOTENCY = IdempotencyGuard(
+        IdempotencyCache(
+            ttl=IDEMPOTENCY_TTL,
+            max_entries=IDEMPOTENCY_MAX_ENTRIES,
+            max_bytes=IDEMPOTENCY_MAX_BYTES,
+            db_path=IDEMPOTENCY_DB_PATH,
+        )
+    )
+
+
+def idempotency_keys(token: str, message_id: str | None, recipient: str) -> list[str]:
+    keys = [f"token:{token}"]
+    if message_id:
+        keys.append(f"message:{message_id}:{recipient}")
+    return keys
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if SPOOL is not None:
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        await SPOOL.start()
+    yield
+    if SPOOL is not None:
+        await SPOOL.stop()
+    if IDEMPOTENCY is not None:
+        IDEMPOTENCY.cache.close()
+    if isinstance(SMTP_POOL, AsyncSMTPConnectionPool):
+        await SMTP_POOL.close()
+    elif SMTP_POOL is not None:
+        await run_in_threadpool(SMTP_POOL.close)
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 def verify_mailgun_signature(api_key: str, timestamp: str, token: str, signature: str) -> bool:
@@ -64,45 +217,171 @@ def verify_mailgun_signature(api_key: str, timestamp: str, token: str, signature
     return hmac.compare_digest(digest, signature)
 
 
-def smtp_forward(envelope_from: str, envelope_to: str, raw_mime: bytes) -> None:
+def _send_message(
+    smtp: smtplib.SMTP,
+    envelope_from: str,
+    recipients: list[str],
+    raw_mime: MimeSource,
+) -> dict[str, tuple[int, bytes]]:
+    # internal, no TLS/auth needed
+    smtp.mail(envelope_from)
+    refused = {}
+    for rcpt in recipients:
+        code, msg = smtp.rcpt(rcpt)
+        if code not in (250, 251):
+            refused[rcpt] = (code, msg)
+    if isinstance(raw_mime, bytes):
+        smtp.data(raw_mime)
+        return refused
+
+    # Stream the file into DATA instead of loading it (same checks as smtplib's data())
+    raw_mime.seek(0)
+    code, msg = smtp.docmd("data")
+    if code != 354:
+        raise smtplib.SMTPDataError(code, msg)
+    for chunk in iter_quoted_data(raw_mime):
+        smtp.send(chunk)
+    code, msg = smtp.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, msg)
+    return refused
+
+
+def smtp_forward(
+    envelope_from: str,
+    envelope_to: str,
+    raw_mime: MimeSource,
+    attempts: int = SMTP_RETRY_ATTEMPTS,
+) -> dict[str, tuple[int, bytes]]:
     """
     Blocking SMTP send into docker-mailserver. Retries a few times to avoid transient drops.
+    Uses a pooled session when SMTP_POOL_SIZE > 0, otherwise a fresh connection per message.
+    Returns the recipients the server refused at RCPT time (the rest were accepted).
     """
 
     last_exc: Exception | None = None
-    recipients = [addr.strip() for addr in re.split(r"[,;]", envelope_to) if addr.strip()]
-    if not recipients:
-        raise ValueError("No valid recipients after parsing")
+    recipients = parse_recipients(envelope_to)
 
-    for attempt in range(1, SMTP_RETRY_ATTEMPTS + 1):
+    for attempt in range(1, attempts + 1):
         try:
+            if SMTP_POOL is not None:
+                with SMTP_POOL.connection() as smtp:
+                    return _send_message(smtp, envelope_from, recipients, raw_mime)
             with smtplib.SMTP(MAILSERVER_HOST, MAILSERVER_PORT, timeout=SMTP_TIMEOUT) as smtp:
                 smtp.ehlo(MAILSERVER_HELO_DOMAIN)
-                # internal, no TLS/auth needed
-                smtp.mail(envelope_from)
-                for rcpt in recipients:
-                    smtp.rcpt(rcpt)
-                smtp.data(raw_mime)
-            return
+                return _send_message(smtp, envelope_from, recipients, raw_mime)
         except Exception as exc:  # noqa: PERF203 - we want to surface all SMTP/network issues
             last_exc = exc
             logger.warning(
                 "smtp_forward_attempt_failed %s",
                 {
                     "attempt": attempt,
-                    "max_attempts": SMTP_RETRY_ATTEMPTS,
+                    "max_attempts": attempts,
                     "error": repr(exc),
                     "host": MAILSERVER_HOST,
                     "port": MAILSERVER_PORT,
                 },
             )
-            if attempt < SMTP_RETRY_ATTEMPTS:
+            if attempt < attempts:
                 time.sleep(SMTP_RETRY_DELAY)
 
     if last_exc:
         raise last_exc
 
 
+async def async_smtp_forward(
+    envelope_from: str,
+    envelope_to: str,
+    raw_mime: MimeSource,
+    attempts: int = SMTP_RETRY_ATTEMPTS,
+) -> dict[str, tuple[int, bytes]]:
+    """
+    Non-blocking equivalent of smtp_forward; retries back off with asyncio.sleep
+    so a waiting delivery does not hold a thread.
+    """
+
+    last_exc: Exception | None = None
+    recipients = parse_recipients(envelope_to)
+
+    for attempt in range(1, attempts + 1):
+        try:
+            if SMTP_POOL is not None:
+                async with SMTP_POOL.connection() as smtp:
+                    return await _async_send_message(smtp, envelope_from, recipients, raw_mime)
+            smtp = AsyncSMTP(MAILSERVER_HOST, MAILSERVER_PORT, timeout=SMTP_TIMEOUT)
+            await smtp.connect(MAILSERVER_HELO_DOMAIN)
+            try:
+                return await _async_send_message(smtp, envelope_from, recipients, raw_mime)
+            finally:
+                try:
+                    await smtp.quit()
+                except (smtplib.SMTPException, OSError):
+                    smtp.close()
+        except Exception as exc:  # noqa: PERF203 - we want to surface all SMTP/network issues
+            last_exc = exc
+            logger.warning(
+                "smtp_forward_attempt_failed %s",
+                {
+                    "attempt": attempt,
+                    "max_attempts": attempts,
+                    "error": repr(exc),
+                    "host": MAILSERVER_HOST,
+                    "port": MAILSERVER_PORT,
+                },
+            )
+            if attempt < attempts:
+                await asyncio.sleep(SMTP_RETRY_DELAY)
+
+    if last_exc:
+        raise last_exc
+
+
+async def _async_send_message(
+    smtp: AsyncSMTP,
+    envelope_from: str,
+    recipients: list[str],
+    raw_mime: MimeSource,
+) -> dict[str, tuple[int, bytes]]:
+    if not isinstance(raw_mime, bytes):
+        raw_mime.seek(0)
+    await smtp.mail(envelope_from)
+    refused = {}
+    for rcpt in recipients:
+        code, msg = await smtp.rcpt(rcpt)
+        if code not in (250, 251):
+            refused[rcpt] = (code, msg)
+    await smtp.data(raw_mime)
+    return refused
+
+
+async def forward(
+    envelope_from: str,
+    envelope_to: str,
+    raw_mime: MimeSource,
+    attempts: int = SMTP_RETRY_ATTEMPTS,
+) -> dict[str, tuple[int, bytes]]:
+    """
+    Deliver through the client selected by SMTP_CLIENT_MODE.
+    """
+    if SMTP_CLIENT_MODE == "async":
+        return await async_smtp_forward(envelope_from, envelope_to, raw_mime, attempts)
+    # Run blocking SMTP send in a thread so we don't block the event loop
+    return await run_in_threadpool(smtp_forward, envelope_from, envelope_to, raw_mime, attempts)
+
+
+async def _forward_batch(envelope_from: str, recipients: list[str], raw_mime: MimeSource) -> dict[str, tuple[int, bytes]]:
+    return await forward(envelope_from, ", ".join(recipients), raw_mime)
+
+
+COALESCER: DeliveryCoalescer | None = None
+if SMTP_COALESCE_WINDOW_MS > 0:
+    COALESCER = DeliveryCoalescer(
+        deliver=_forward_batch,
+        window=SMTP_COALESCE_WINDOW_MS / 1000,
+        max_recipients=SMTP_COALESCE_MAX_RECIPIENTS,
+    )
+
+
 @app.get("/healthz", response_class=PlainTextResponse)
 async def healthz():
     return "OK"
@@ -114,6 +393,56 @@ async def metrics():
     return Response(content=data, media_type=CONTENT_TYPE_LATEST)
 
 
+async def spool_message(
+    sender: str,
+    recipient: str,
+    message_id: str | None,
+    raw_source: MimeSource,
+    raw_size: int,
+    client_ip: str,
+) -> str:
+    """
+    Persist the message and hand it to the spool workers; Mailgun gets its ACK
+    as soon as the record is fsync'd.
+    """
+    try:
+        parse_recipients(recipient)
+    except ValueError as e:
+        SMTP_ERRORS.labels(reason="parse_error").inc()
+        REQUESTS_TOTAL.labels(result="parse_error").inc()
+        logger.warning(
+            "recipient_parsing_error %s",
+            {"error": repr(e), "raw_recipient": recipient},
+        )
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        entry = await run_in_threadpool(
+            SPOOL.spool.append,
+            {"sender": sender, "recipient": recipient, "message_id": message_id},
+            raw_source,
+        )
+    except OSError as e:
+        REQUESTS_TOTAL.labels(result="error").inc()
+        logger.exception("spool_append_failed %s", {"error": repr(e), "client_ip": client_ip})
+        raise HTTPException(status_code=500, detail="Failed to spool mail")
+
+    SPOOL.submit(entry)
+    REQUESTS_TOTAL.labels(result="spooled").inc()
+    logger.info(
+        "email_spooled %s",
+        {
+            "id": entry.id,
+            "from": sender,
+            "to": recipient,
+            "client_ip": client_ip,
+            "message_id": message_id,
+            "raw_size_bytes": raw_size,
+        },
+    )
+    return "OK"
+
+
 @app.post("/mailgun/incoming", response_class=PlainTextResponse)
 async def mailgun_incoming(request: Request):
     """
@@ -124,10 +453,43 @@ async def mailgun_incoming(request: Request):
     - sender, recipient
     - body-mime (if using Store and Notify) OR body-plain/body-html as fallback
     """
-    form = await request.form()
-
     client_ip = request.client.host if request.client else "unknown"
 
+    try:
+        if INGEST_STREAMING:
+            form = await parse_streaming_form(
+                request,
+                spool_threshold=INGEST_SPOOL_THRESHOLD,
+                max_bytes=INGEST_MAX_BYTES,
+                max_field_bytes=INGEST_MAX_FIELD_BYTES,
+                hash_mime=COALESCER is not None,
+            )
+        else:
+            content_length = request.headers.get("content-length", "")
+            if content_length.isdigit() and int(content_length) > INGEST_MAX_BYTES:
+                raise PayloadTooLarge(f"Request body exceeds {INGEST_MAX_BYTES} bytes")
+            form = await request.form()
+    except PayloadTooLarge as e:
+        REQUESTS_TOTAL.labels(result="too_large").inc()
+        logger.warning("payload_too_large %s", {"error": str(e), "client_ip": client_ip})
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidPayload as e:
+        REQUESTS_TOTAL.labels(result="parse_error").inc()
+        logger.warning("invalid_payload %s", {"error": str(e), "client_ip": client_ip})
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        return await process_webhook(form, client_ip)
+    finally:
+        if isinstance(form, StreamedForm):
+            form.close()
+
+
+async def process_webhook(form, client_ip: str) -> str:
+    """
+    Verify, then spool or forward one parsed webhook (starlette FormData or StreamedForm).
+    """
+
     # --- Verify Mailgun signature ---
     timestamp = form.get("timestamp", "")
     token = form.get("token", "")
@@ -141,10 +503,52 @@ async def mailgun_incoming(request: Request):
     recipient = form.get("recipient") or form.get("to") or "unknown@localhost"
     message_id = form.get("Message-Id") or form.get("message-id")
 
-    # Prefer raw MIME if Mailgun provides it (Store and Notify)
-    raw_mime = form.get("body-mime")
+    keys = idempotency_keys(token, message_id, recipient) if IDEMPOTENCY is not None else []
+    if keys and await IDEMPOTENCY.claim(keys):
+        REQUESTS_TOTAL.labels(result="duplicate").inc()
+        logger.info(
+            "duplicate_webhook_skipped %s",
+            {"to": recipient, "message_id": message_id, "client_ip": client_ip},
+        )
+        return "OK"
+
+    delivered = False
+    try:
+        response = await deliver_webhook(form, sender, recipient, message_id, client_ip)
+        delivered = True
+        return response
+    finally:
+        if keys:
+            await IDEMPOTENCY.release(keys, delivered)
+
+
+async def deliver_webhook(
+    form,
+    sender: str,
+    recipient: str,
+    message_id: str | None,
+    client_ip: str,
+) -> str:
+    """
+    Build the raw MIME for a verified webhook and spool or forward it.
+    """
 
-    if not raw_mime:
+    # Prefer raw MIME if Mailgun provides it (Store and Notify)
+    raw_source: MimeSource | None
+    if isinstance(form, StreamedForm):
+        # Raw bytes as received, never decoded or re-encoded
+        raw_source, raw_size = form.mime, form.mime_size
+        peak_bytes, mode = form.peak_bytes, "streaming"
+        body_hash = form.mime_hash.hexdigest() if form.mime_hash is not None and raw_size else None
+    else:
+        raw_mime = form.get("body-mime")
+        raw_source = raw_mime.encode("utf-8", errors="replace") if raw_mime else None
+        raw_size = len(raw_source) if raw_source else 0
+        peak_bytes = sum(len(v) for v in form.values() if isinstance(v, str)) + raw_size
+        mode = "buffered"
+        body_hash = hashlib.sha256(raw_source).hexdigest() if COALESCER is not None and raw_size else None
+
+    if not raw_size:
         # Fallback: very simple plain-text message if you're not using Store and Notify
         subject = form.get("subject") or ""
         body_plain = form.get("body-plain") or ""
@@ -156,8 +560,15 @@ async def mailgun_incoming(request: Request):
             "Content-Type: text/plain; charset=utf-8",
         ]
         raw_mime = "\r\n".join(headers) + "\r\n\r\n" + body_plain
+        raw_source = raw_mime.encode("utf-8", errors="replace")
+        raw_size = len(raw_source)
+        peak_bytes += raw_size
+        body_hash = None
+
+    REQUEST_PEAK_BYTES.labels(mode=mode).observe(peak_bytes)
 
-    raw_bytes = raw_mime.encode("utf-8", errors="replace")
+    if SPOOL is not None:
+        return await spool_message(sender, recipient, message_id, raw_source, raw_size, client_ip)
 
     logger.info(
         "forwarding_email %s",
@@ -167,14 +578,32 @@ async def mailgun_incoming(request: Request):
             "mailserver": f"{MAILSERVER_HOST}:{MAILSERVER_PORT}",
             "client_ip": client_ip,
             "message_id": message_id,
-            "raw_size_bytes": len(raw_bytes),
+            "raw_size_bytes": raw_size,
         },
     )
 
     start = time.perf_counter()
     try:
-        # Run blocking SMTP send in a thread so we don't block the event loop
-        await run_in_threadpool(smtp_forward, sender, recipient, raw_bytes)
+        if COALESCER is not None and message_id and body_hash:
+            if isinstance(form, StreamedForm):
+                # The batch may outlive this request, so the coalescer owns the file
+                raw_source = form.detach_mime()
+            refused = await COALESCER.submit(
+                (message_id, body_hash),
+                sender,
+                parse_recipients(recipient),
+                raw_source,
+            )
+        else:
+            refused = await forward(sender, recipient, raw_source)
+        if refused:
+            logger.warning(
+                "smtp_recipients_partially_refused %s",
+                {
+                    "refused": {rcpt: code for rcpt, (code, _) in refused.items()},
+                    "client_ip": client_ip,
+                },
+            )
         duration = time.perf_counter() - start
         SMTP_FORWARD_DURATION.observe(duration)
         REQUESTS_TOTAL.labels(result="success").inc()
@@ -0,0 +1,138 @@
+"""
+Minimal non-blocking SMTP client for the internal docker-mailserver hop.
+
+Mirrors the subset of smtplib.SMTP used by mail-ingest (EHLO, MAIL, RCPT,
+DATA, RSET, NOOP, QUIT) and raises the same smtplib exception types, so the
+error -> HTTP status mapping is shared with the blocking path. No TLS/AUTH:
+the mailserver is only reachable on the internal Docker network.
+"""
+
+import asyncio
+import re
+import smtplib
+from typing import BinaryIO, Iterator
+
+_CRLF = b"\r\n"
+_MAXLINE = 8192
+DATA_CHUNK_SIZE = 256 * 1024
+_DOT_AT_LINE_START = re.compile(rb"(?m)^\.")
+
+
+def quote_data(raw_mime: bytes) -> bytes:
+    """
+    Dot-stuff a message and append the end-of-data marker (same as smtplib.SMTP.data).
+    """
+    quoted = _DOT_AT_LINE_START.sub(b"..", raw_mime)
+    if quoted[-2:] != _CRLF:
+        quoted += _CRLF
+    return quoted + b"." + _CRLF
+
+
+def iter_quoted_data(fileobj: BinaryIO, chunk_size: int = DATA_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Streaming quote_data: dot-stuffs a file-like message chunk by chunk,
+    keeping only line-start state between chunks.
+    """
+    at_line_start = True
+    tail = b""
+    while chunk := fileobj.read(chunk_size):
+        quoted = chunk.replace(b"\n.", b"\n..")
+        if at_line_start and chunk[:1] == b".":
+            quoted = b"." + quoted
+        at_line_start = chunk[-1:] == b"\n"
+        tail = (tail + chunk[-2:])[-2:]
+        yield quoted
+    yield (b"" if tail == _CRLF else _CRLF) + b"." + _CRLF
+
+
+class AsyncSMTP:
+    def __init__(self, host: str, port: int, timeout: float):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+
+    async def connect(self, helo_domain: str) -> None:
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, limit=_MAXLINE + 2),
+            self.timeout,
+        )
+        code, msg = await self._read_reply()
+        if code != 220:
+            self.close()
+            raise smtplib.SMTPConnectError(code, msg)
+        code, msg = await self.command(f"ehlo {helo_domain}")
+        if code != 250:
+            self.close()
+            raise smtplib.SMTPHeloError(code, msg)
+
+    async def _read_reply(self) -> tuple[int, bytes]:
+        lines: list[bytes] = []
+        while True:
+            try:
+                line = await asyncio.wait_for(self._reader.readline(), self.timeout)
+            except (asyncio.LimitOverrunError, ValueError):
+                self.close()
+                raise smtplib.SMTPResponseException(500, "Line too long.")
+            if not line:
+                self.close()
+                raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+            lines.append(line[4:].strip(b" \t\r\n"))
+            try:
+                code = int(line[:3])
+            except ValueError:
+                code = -1
+                break
+            if line[3:4] != b"-":
+                break
+        return code, b"\n".join(lines)
+
+    async def _write(self, data: bytes) -> None:
+        if self._writer is None:
+            raise smtplib.SMTPServerDisconnected("please run connect() first")
+        self._writer.write(data)
+        await asyncio.wait_for(self._writer.drain(), self.timeout)
+
+    async def command(self, line: str) -> tuple[int, bytes]:
+        await self._write(line.encode("ascii") + _CRLF)
+        return await self._read_reply()
+
+    async def mail(self, sender: str) -> tuple[int, bytes]:
+        return await self.command(f"mail FROM:{smtplib.quoteaddr(sender)}")
+
+    async def rcpt(self, recipient: str) -> tuple[int, bytes]:
+        return await self.command(f"rcpt TO:{smtplib.quoteaddr(recipient)}")
+
+    async def data(self, raw_mime: bytes | BinaryIO) -> tuple[int, bytes]:
+        code, msg = await self.command("data")
+        if code != 354:
+            raise smtplib.SMTPDataError(code, msg)
+        if isinstance(raw_mime, (bytes, bytearray)):
+            await self._write(quote_data(raw_mime))
+        else:
+            # File reads may hit disk once the upload rolled over, keep them off the loop
+            chunks = iter_quoted_data(raw_mime)
+            while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+                await self._write(chunk)
+        code, msg = await self._read_reply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, msg)
+        return code, msg
+
+    async def rset(self) -> tuple[int, bytes]:
+        return await self.command("rset")
+
+    async def noop(self) -> tuple[int, bytes]:
+        return await self.command("noop")
+
+    async def quit(self) -> None:
+        try:
+            await self.command("quit")
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
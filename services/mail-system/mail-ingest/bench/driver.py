@@ -0,0 +1,340 @@
+"""
+Load driver for mail-ingest.
+
+For every mode it starts the fake SMTP sink and a fresh uvicorn process running
+app.py (configured through environment variables, like the container), then
+posts signed webhooks across a matrix of message sizes and concurrency levels
+and reports requests/s, p50/p95/p99 latency and peak RSS of the app process.
+
+Run from the mail-ingest directory:
+
+    python bench/driver.py --modes blocking,async,streaming --sizes 4k,256k,4m \
+        --concurrency 1,16,64 --requests 200 --sink-latency-ms 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from payloads import PayloadFactory, parse_size
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+BENCH_DIR = Path(__file__).resolve().parent
+SIGNING_KEY = "bench-signing-key"
+WEBHOOK_PATH = "/mailgun/incoming"
+
+# Named presets; anything here can be overridden with --env KEY=VALUE
+MODES: dict[str, dict[str, str]] = {
+    "blocking": {"SMTP_CLIENT_MODE": "blocking"},
+    "nopool": {"SMTP_CLIENT_MODE": "blocking", "SMTP_POOL_SIZE": "0"},
+    "async": {"SMTP_CLIENT_MODE": "async"},
+    "streaming": {"SMTP_CLIENT_MODE": "async", "INGEST_STREAMING": "true"},
+    "spool": {"SMTP_CLIENT_MODE": "async", "INGEST_STREAMING": "true", "SPOOL_ENABLED": "true"},
+}
+
+
+@dataclass
+class CellResult:
+    mode: str
+    size: int
+    concurrency: int
+    requests: int
+    errors: int
+    seconds: float
+    rps: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    peak_rss_mb: float
+    drain_seconds: float | None = None
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def read_rss(pid: int) -> int:
+    """
+    Resident set size in bytes from /proc (Linux only; 0 elsewhere).
+    """
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+class HTTPConnection:
+    """
+    Minimal keep-alive HTTP/1.1 client; enough for the webhook endpoint and
+    keeps the driver free of third-party dependencies.
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+
+    async def request(self, method: str, path: str, body: bytes = b"", content_type: str = "") -> tuple[int, bytes]:
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nContent-Length: {len(body)}\r\n"
+        if content_type:
+            head += f"Content-Type: {content_type}\r\n"
+        self._writer.write(head.encode("ascii") + b"\r\n")
+        self._writer.write(body)
+        try:
+            await self._writer.drain()
+            status_line = await self._reader.readuntil(b"\r\n")
+            headers = {}
+            while (line := await self._reader.readuntil(b"\r\n")) != b"\r\n":
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            payload = await self._reader.readexactly(int(headers.get("content-length", "0")))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.close()
+            raise
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        return int(status_line.split()[1]), payload
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+async def metric_value(port: int, name: str) -> float | None:
+    conn = HTTPConnection("127.0.0.1", port)
+    try:
+        _, body = await conn.request("GET", "/metrics")
+    finally:
+        conn.close()
+    for line in body.decode().splitlines():
+        if line.startswith(name + " ") or line.startswith(name + "{"):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+async def wait_until_ready(port: int, proc: subprocess.Popen, timeout: float = 20) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("mail-ingest exited during startup")
+        conn = HTTPConnection("127.0.0.1", port)
+        try:
+            status, _ = await conn.request("GET", "/healthz")
+            if status == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            conn.close()
+        await asyncio.sleep(0.1)
+    raise RuntimeError("mail-ingest did not become ready")
+
+
+async def run_cell(
+    mode: str,
+    port: int,
+    pid: int,
+    factory: PayloadFactory,
+    size: int,
+    concurrency: int,
+    requests: int,
+    spooled: bool,
+) -> CellResult:
+    latencies: list[float] = []
+    errors = 0
+    remaining = requests
+    peak_rss = read_rss(pid)
+    done = asyncio.Event()
+
+    async def sample_rss():
+        nonlocal peak_rss
+        while not done.is_set():
+            peak_rss = max(peak_rss, read_rss(pid))
+            await asyncio.sleep(0.05)
+
+    async def worker():
+        nonlocal remaining, errors
+        conn = HTTPConnection("127.0.0.1", port)
+        try:
+            while remaining > 0:
+                remaining -= 1
+                content_type, body = factory.multipart(size)
+                started = time.perf_counter()
+                try:
+                    status, _ = await conn.request("POST", WEBHOOK_PATH, body, content_type)
+                except OSError:
+                    status = 0
+                latencies.append(time.perf_counter() - started)
+                if status != 200:
+                    errors += 1
+        finally:
+            conn.close()
+
+    sampler = asyncio.create_task(sample_rss())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    drain = None
+    if spooled:
+        # Spool mode acknowledges before delivery; also report time to empty the queue
+        while (await metric_value(port, "spool_queue_depth") or 0) > 0:
+            await asyncio.sleep(0.05)
+        drain = time.perf_counter() - started - elapsed
+    done.set()
+    await sampler
+
+    latencies.sort()
+    return CellResult(
+        mode=mode,
+        size=size,
+        concurrency=concurrency,
+        requests=requests,
+        errors=errors,
+        seconds=round(elapsed, 3),
+        rps=round(requests / elapsed, 1),
+        p50_ms=round(percentile(latencies, 50) * 1000, 2),
+        p95_ms=round(percentile(latencies, 95) * 1000, 2),
+        p99_ms=round(percentile(latencies, 99) * 1000, 2),
+        peak_rss_mb=round(peak_rss / (1024 * 1024), 1),
+        drain_seconds=round(drain, 3) if drain is not None else None,
+    )
+
+
+def start_sink(args: argparse.Namespace, port: int) -> subprocess.Popen:
+    cmd = [
+        sys.executable,
+        str(BENCH_DIR / "smtp_sink.py"),
+        "--port", str(port),
+        "--latency-ms", str(args.sink_latency_ms),
+        "--jitter-ms", str(args.sink_jitter_ms),
+        "--rcpt-error-rate", str(args.sink_rcpt_error_rate),
+        "--data-error-rate", str(args.sink_data_error_rate),
+        "--drop-rate", str(args.sink_drop_rate),
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    proc.stdout.readline()  # "listening on ..."
+    return proc
+
+
+def stop(proc: subprocess.Popen) -> str:
+    proc.send_signal(signal.SIGTERM)
+    try:
+        out, _ = proc.communicate(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        out, _ = proc.communicate()
+    return out or ""
+
+
+async def run_mode(mode: str, args: argparse.Namespace, sizes: list[int], levels: list[int]) -> list[CellResult]:
+    smtp_port = free_port()
+    http_port = free_port()
+    sink = start_sink(args, smtp_port)
+    with tempfile.TemporaryDirectory(prefix="mail-ingest-bench-") as workdir:
+        env = {
+            **os.environ,
+            "MAILGUN_WEBHOOK_SIGNING_KEY": SIGNING_KEY,
+            "MAILSERVER_HOST": "127.0.0.1",
+            "MAILSERVER_PORT": str(smtp_port),
+            "LOG_LEVEL": "WARNING",
+            "SPOOL_DIR": workdir,
+            "SMTP_RETRY_DELAY_SECONDS": "0.1",
+            **MODES[mode],
+            **dict(item.split("=", 1) for item in args.env),
+        }
+        app = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(http_port),
+             "--log-level", "warning", "--no-access-log"],
+            cwd=SERVICE_DIR,
+            env=env,
+        )
+        results = []
+        try:
+            await wait_until_ready(http_port, app)
+            factory = PayloadFactory(SIGNING_KEY)
+            spooled = env.get("SPOOL_ENABLED", "").lower() in ("1", "true", "yes")
+            for size in sizes:
+                # Warm up connections and the payload body cache
+                await run_cell(mode, http_port, app.pid, factory, size, max(levels), max(levels), spooled)
+                for concurrency in levels:
+                    result = await run_cell(
+                        mode, http_port, app.pid, factory, size, concurrency, args.requests, spooled
+                    )
+                    print_row(result)
+                    results.append(result)
+        finally:
+            stop(app)
+            sink_stats = stop(sink).strip().splitlines()
+            if sink_stats:
+                print(f"# {mode} sink: {sink_stats[-1]}", flush=True)
+    return results
+
+
+COLUMNS = ("mode", "size", "concurrency", "rps", "p50_ms", "p95_ms", "p99_ms", "peak_rss_mb", "errors", "drain_seconds")
+
+
+def print_row(result: CellResult) -> None:
+    row = asdict(result)
+    print("  ".join(f"{str(row[c] if row[c] is not None else '-'):>12}" for c in COLUMNS), flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="blocking,async,streaming", help=f"comma list of {', '.join(MODES)}")
+    parser.add_argument("--sizes", default="4k,256k,4m", help="message sizes, e.g. 4k,256k,4m")
+    parser.add_argument("--concurrency", default="1,16,64", help="concurrent clients per run")
+    parser.add_argument("--requests", type=int, default=200, help="requests per size/concurrency cell")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra app environment")
+    parser.add_argument("--sink-latency-ms", type=float, default=5)
+    parser.add_argument("--sink-jitter-ms", type=float, default=0)
+    parser.add_argument("--sink-rcpt-error-rate", type=float, default=0)
+    parser.add_argument("--sink-data-error-rate", type=float, default=0)
+    parser.add_argument("--sink-drop-rate", type=float, default=0)
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        parser.error(f"unknown mode(s): {', '.join(unknown)}")
+    sizes = [parse_size(s) for s in args.sizes.split(",")]
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    print("  ".join(f"{c:>12}" for c in COLUMNS), flush=True)
+    results = []
+    for mode in modes:
+        results += asyncio.run(run_mode(mode, args, sizes, levels))
+
+    if args.json:
+        Path(args.json).write_text(json.dumps([asdict(r) for r in results], indent=2))
+
+
+if __name__ == "__main__":
+    main()
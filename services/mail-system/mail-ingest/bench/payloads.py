@@ -0,0 +1,104 @@
+"""
+Signed Mailgun "store and notify" webhook payloads for load testing.
+
+Signatures follow the scheme checked by app.verify_mailgun_signature:
+HMAC-SHA256(signing_key, timestamp + token), hex encoded.
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+import uuid
+
+_LINE = 76
+
+
+def sign(signing_key: str, timestamp: str, token: str) -> str:
+    return hmac.new(
+        key=signing_key.encode("utf-8"),
+        msg=f"{timestamp}{token}".encode("utf-8"),
+        digestmod=hashlib.sha256,
+    ).hexdigest()
+
+
+def parse_size(value: str) -> int:
+    """
+    "512", "64k", "4m" -> bytes
+    """
+    value = value.strip().lower()
+    units = {"k": 1024, "m": 1024 * 1024}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def attachment_body(size: int) -> bytes:
+    """
+    Random base64 text wrapped at 76 columns, about `size` bytes long.
+    """
+    encoded = base64.b64encode(os.urandom(size * 3 // 4 + 3))[:size]
+    return b"\r\n".join(encoded[i : i + _LINE] for i in range(0, len(encoded), _LINE))
+
+
+def build_mime(sender: str, recipient: str, message_id: str, body: bytes) -> bytes:
+    headers = (
+        f"From: {sender}\r\n"
+        f"To: {recipient}\r\n"
+        f"Subject: mail-ingest benchmark {message_id}\r\n"
+        f"Message-Id: {message_id}\r\n"
+        "MIME-Version: 1.0\r\n"
+        "Content-Type: application/octet-stream\r\n"
+        "Content-Transfer-Encoding: base64\r\n"
+        "\r\n"
+    ).encode("ascii")
+    return headers + body + b"\r\n"
+
+
+class PayloadFactory:
+    """
+    Builds multipart/form-data webhook bodies. The random MIME body of each
+    size is generated once and reused; every payload gets a fresh token,
+    timestamp and Message-Id so idempotency and coalescing stay out of the way.
+    """
+
+    def __init__(self, signing_key: str, sender: str = "bench@example.org", recipient: str = "inbox@example.org"):
+        self.signing_key = signing_key
+        self.sender = sender
+        self.recipient = recipient
+        self._bodies: dict[int, bytes] = {}
+
+    def fields(self, message_id: str) -> dict[str, str]:
+        timestamp = str(int(time.time()))
+        token = secrets.token_hex(25)
+        return {
+            "timestamp": timestamp,
+            "token": token,
+            "signature": sign(self.signing_key, timestamp, token),
+            "sender": self.sender,
+            "recipient": self.recipient,
+            "Message-Id": message_id,
+            "subject": f"mail-ingest benchmark {message_id}",
+        }
+
+    def multipart(self, size: int) -> tuple[str, bytes]:
+        """
+        Returns (content_type, body) for a webhook carrying a ~`size` byte message.
+        """
+        if size not in self._bodies:
+            self._bodies[size] = attachment_body(size)
+        message_id = f"<{uuid.uuid4().hex}@bench.local>"
+        mime = build_mime(self.sender, self.recipient, message_id, self._bodies[size])
+
+        boundary = uuid.uuid4().hex
+        parts = []
+        for name, value in self.fields(message_id).items():
+            parts.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode("utf-8")
+            )
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="body-mime"\r\n\r\n'.encode("ascii"))
+        parts.append(mime)
+        parts.append(f"\r\n--{boundary}--\r\n".encode("ascii"))
+        return f"multipart/form-data; boundary={boundary}", b"".join(parts)
@@ -0,0 +1,134 @@
+"""
+Fake SMTP server that accepts and discards mail, standing in for docker-mailserver.
+
+Latency and failure behaviour are configurable so forwarding modes can be
+compared under a slow or flaky mailserver:
+
+    python bench/smtp_sink.py --port 2525 --latency-ms 20 --jitter-ms 5 \
+        --rcpt-error-rate 0.01 --data-error-rate 0.02 --drop-rate 0.001
+
+Counters are printed as JSON on SIGINT/SIGTERM.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import signal
+
+STATS = {
+    "connections": 0,
+    "messages": 0,
+    "recipients": 0,
+    "bytes": 0,
+    "rcpt_refused": 0,
+    "data_failed": 0,
+    "dropped": 0,
+}
+
+
+class SinkConfig:
+    def __init__(self, args: argparse.Namespace):
+        self.latency = args.latency_ms / 1000
+        self.jitter = args.jitter_ms / 1000
+        self.command_latency = args.command_latency_ms / 1000
+        self.rcpt_error_rate = args.rcpt_error_rate
+        self.data_error_rate = args.data_error_rate
+        self.drop_rate = args.drop_rate
+
+    async def delay(self, base: float) -> None:
+        seconds = base + random.uniform(-self.jitter, self.jitter) if base else 0
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+
+async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, cfg: SinkConfig) -> None:
+    STATS["connections"] += 1
+
+    async def reply(line: str) -> None:
+        writer.write(line.encode() + b"\r\n")
+        await writer.drain()
+
+    rcpts = 0
+    try:
+        await reply("220 smtp-sink ESMTP")
+        while line := await reader.readline():
+            verb = line[:4].upper()
+            await cfg.delay(cfg.command_latency)
+            if verb in (b"EHLO", b"HELO"):
+                await reply("250-smtp-sink\r\n250-PIPELINING\r\n250 8BITMIME")
+            elif verb == b"MAIL":
+                rcpts = 0
+                await reply("250 2.1.0 Ok")
+            elif verb == b"RCPT":
+                if random.random() < cfg.rcpt_error_rate:
+                    STATS["rcpt_refused"] += 1
+                    await reply("550 5.1.1 User unknown")
+                else:
+                    rcpts += 1
+                    await reply("250 2.1.5 Ok")
+            elif verb == b"DATA":
+                if not rcpts:
+                    await reply("554 5.5.1 No valid recipients")
+                    continue
+                await reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                while (chunk := await reader.readline()) not in (b".\r\n", b""):
+                    size += len(chunk)
+                await cfg.delay(cfg.latency)
+                if random.random() < cfg.drop_rate:
+                    STATS["dropped"] += 1
+                    break
+                if random.random() < cfg.data_error_rate:
+                    STATS["data_failed"] += 1
+                    await reply("451 4.3.0 Temporary failure")
+                else:
+                    STATS["messages"] += 1
+                    STATS["recipients"] += rcpts
+                    STATS["bytes"] += size
+                    await reply("250 2.0.0 Ok: queued")
+                rcpts = 0
+            elif verb in (b"RSET", b"NOOP"):
+                rcpts = 0 if verb == b"RSET" else rcpts
+                await reply("250 2.0.0 Ok")
+            elif verb == b"QUIT":
+                await reply("221 2.0.0 Bye")
+                break
+            else:
+                await reply("502 5.5.2 Command not recognized")
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str, port: int, cfg: SinkConfig) -> None:
+    server = await asyncio.start_server(
+        lambda r, w: handle(r, w, cfg), host, port, limit=1024 * 1024
+    )
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    print(f"smtp-sink listening on {host}:{port}", flush=True)
+    async with server:
+        await stop.wait()
+    print(json.dumps(STATS), flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--latency-ms", type=float, default=0, help="delay before answering DATA")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="+/- random jitter on every delay")
+    parser.add_argument("--command-latency-ms", type=float, default=0, help="delay before every other reply")
+    parser.add_argument("--rcpt-error-rate", type=float, default=0, help="fraction of RCPTs answered 550")
+    parser.add_argument("--data-error-rate", type=float, default=0, help="fraction of messages answered 451")
+    parser.add_argument("--drop-rate", type=float, default=0, help="fraction of messages where the connection is dropped")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, SinkConfig(args)))
+
+
+if __name__ == "__main__":
+    main()
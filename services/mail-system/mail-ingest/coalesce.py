@@ -0,0 +1,130 @@
+"""
+Coalescing of identical concurrent deliveries into one SMTP transaction.
+
+Mailing-list style traffic makes Mailgun post the same message once per
+recipient, often within milliseconds. Webhooks whose (sender, Message-Id,
+body hash) match and that arrive within a short window are merged into a
+single MAIL/RCPT.../DATA; the RCPT results are then fanned back out so every
+webhook still gets its own outcome.
+
+A batch can outlive the request that started it (its client may disconnect
+while others wait), so the coalescer owns the file-like sources it is given:
+the batch keeps the first one open until its transaction is done, and the
+identical copies of later webhooks are closed right away.
+"""
+
+import asyncio
+import logging
+import smtplib
+from dataclasses import dataclass, field
+from typing import Awaitable, BinaryIO, Callable
+
+from prometheus_client import Counter
+
+logger = logging.getLogger("mail-ingest")
+
+COALESCED_MESSAGES = Counter(
+    "smtp_coalesced_messages_total",
+    "SMTP transactions saved by merging identical webhooks",
+)
+COALESCED_RECIPIENTS = Counter(
+    "smtp_coalesced_recipients_total",
+    "Recipients delivered through another webhook's SMTP transaction",
+)
+
+# (sender, recipients, raw MIME) -> refused recipients {rcpt: (code, message)}
+Deliver = Callable[[str, list[str], bytes | BinaryIO], Awaitable[dict[str, tuple[int, bytes]]]]
+
+
+def _close(source: bytes | BinaryIO) -> None:
+    if not isinstance(source, (bytes, bytearray)):
+        source.close()
+
+
+@dataclass
+class _Batch:
+    sender: str
+    source: bytes | BinaryIO
+    recipients: list[str] = field(default_factory=list)
+    waiters: list[tuple[list[str], asyncio.Future]] = field(default_factory=list)
+    timer: asyncio.TimerHandle | None = None
+
+
+class DeliveryCoalescer:
+    def __init__(self, deliver: Deliver, window: float, max_recipients: int):
+        self.deliver = deliver
+        self.window = window
+        self.max_recipients = max_recipients
+        self._batches: dict[tuple, _Batch] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(
+        self,
+        key: tuple,
+        sender: str,
+        recipients: list[str],
+        source: bytes | BinaryIO,
+    ) -> dict[str, tuple[int, bytes]]:
+        """
+        Deliver `source` to `recipients`, possibly together with other waiters
+        that share `key`. Returns the refused subset of `recipients`; raises
+        SMTPRecipientsRefused if all of them were refused, or the batch error.
+        A file-like `source` is closed by the coalescer, not the caller.
+        """
+        loop = asyncio.get_running_loop()
+        batch_key = (sender, *key)
+        batch = self._batches.get(batch_key)
+        if batch is None or len(batch.recipients) + len(recipients) > self.max_recipients:
+            if batch is not None:
+                self._flush(batch_key)
+            batch = _Batch(sender=sender, source=source)
+            batch.timer = loop.call_later(self.window, self._flush, batch_key)
+            self._batches[batch_key] = batch
+        else:
+            COALESCED_MESSAGES.inc()
+            COALESCED_RECIPIENTS.inc(len(recipients))
+            # Same body as the batch's own copy
+            _close(source)
+
+        future = loop.create_future()
+        batch.waiters.append((recipients, future))
+        for rcpt in recipients:
+            if rcpt not in batch.recipients:
+                batch.recipients.append(rcpt)
+        if len(batch.recipients) >= self.max_recipients:
+            self._flush(batch_key)
+        return await future
+
+    def _flush(self, batch_key: tuple) -> None:
+        batch = self._batches.pop(batch_key, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: _Batch) -> None:
+        if len(batch.waiters) > 1:
+            logger.info(
+                "smtp_coalesced_delivery %s",
+                {"webhooks": len(batch.waiters), "recipients": len(batch.recipients)},
+            )
+        try:
+            refused = await self.deliver(batch.sender, batch.recipients, batch.source)
+        except Exception as exc:
+            for _, future in batch.waiters:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        finally:
+            _close(batch.source)
+
+        for recipients, future in batch.waiters:
+            if future.done():
+                continue
+            own = {rcpt: refused[rcpt] for rcpt in recipients if rcpt in refused}
+            if len(own) == len(recipients):
+                future.set_exception(smtplib.SMTPRecipientsRefused(own))
+            else:
+                future.set_result(own)
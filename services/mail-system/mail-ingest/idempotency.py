@@ -0,0 +1,205 @@
+"""
+Idempotency guard for Mailgun webhook redeliveries.
+
+Mailgun retries a webhook when our response is slow or fails, and a captured
+signed payload can be replayed verbatim. Each verified webhook is keyed on its
+Mailgun token and on Message-Id + recipient; once a webhook was delivered (or
+spooled) its keys are remembered for a TTL, and later webhooks carrying any of
+those keys are acknowledged without touching SMTP. Concurrent duplicates wait
+for the in-flight original instead of delivering a second copy.
+
+Keys live in a bounded in-memory LRU (entry count and approximate byte cap),
+optionally backed by a local SQLite file so they survive restarts.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger("mail-ingest")
+
+IDEMPOTENCY_LOOKUPS = Counter(
+    "idempotency_lookups_total",
+    "Idempotency cache lookups by result",
+    labelnames=["result"],
+)
+IDEMPOTENCY_EVICTIONS = Counter(
+    "idempotency_evictions_total",
+    "Idempotency cache entries evicted from memory, by reason",
+    labelnames=["reason"],
+)
+IDEMPOTENCY_ENTRIES = Gauge(
+    "idempotency_cache_entries",
+    "Keys held in the in-memory idempotency cache",
+)
+IDEMPOTENCY_BYTES = Gauge(
+    "idempotency_cache_bytes",
+    "Approximate memory used by the in-memory idempotency cache",
+)
+IDEMPOTENCY_MAX_BYTES = Gauge(
+    "idempotency_cache_max_bytes",
+    "Memory cap of the in-memory idempotency cache",
+)
+
+# Rough per-entry overhead of the OrderedDict slot and the stored float
+_ENTRY_OVERHEAD = 120
+_PURGE_EVERY = 1000
+
+
+class IdempotencyCache:
+    """
+    Thread-safe LRU of key -> expiry timestamp with an optional SQLite tier.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int, db_path: str = ""):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.persistent = bool(db_path)
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, float] = OrderedDict()
+        self._bytes = 0
+        self._puts = 0
+        self._db: sqlite3.Connection | None = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS idempotency (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+            )
+        IDEMPOTENCY_MAX_BYTES.set(max_bytes)
+
+    @staticmethod
+    def _size(key: str) -> int:
+        return sys.getsizeof(key) + _ENTRY_OVERHEAD
+
+    def _remember(self, key: str, expires_at: float) -> None:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        else:
+            self._bytes += self._size(key)
+        self._entries[key] = expires_at
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            old_key, old_expiry = self._entries.popitem(last=False)
+            self._bytes -= self._size(old_key)
+            reason = "expired" if old_expiry <= time.time() else "capacity"
+            IDEMPOTENCY_EVICTIONS.labels(reason=reason).inc()
+
+    def _forget(self, key: str) -> None:
+        self._entries.pop(key)
+        self._bytes -= self._size(key)
+        IDEMPOTENCY_EVICTIONS.labels(reason="expired").inc()
+
+    def _update_gauges(self) -> None:
+        IDEMPOTENCY_ENTRIES.set(len(self._entries))
+        IDEMPOTENCY_BYTES.set(self._bytes)
+
+    def contains(self, keys: list[str]) -> bool:
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                expires_at = self._entries.get(key)
+                if expires_at is None:
+                    continue
+                if expires_at <= now:
+                    self._forget(key)
+                    continue
+                self._entries.move_to_end(key)
+                IDEMPOTENCY_LOOKUPS.labels(result="hit_memory").inc()
+                self._update_gauges()
+                return True
+
+            if self._db is not None:
+                placeholders = ",".join("?" * len(keys))
+                row = self._db.execute(
+                    f"SELECT key, expires_at FROM idempotency WHERE key IN ({placeholders}) AND expires_at > ?",
+                    (*keys, now),
+                ).fetchone()
+                if row is not None:
+                    self._remember(row[0], row[1])
+                    IDEMPOTENCY_LOOKUPS.labels(result="hit_sqlite").inc()
+                    self._update_gauges()
+                    return True
+
+            self._update_gauges()
+        IDEMPOTENCY_LOOKUPS.labels(result="miss").inc()
+        return False
+
+    def add(self, keys: list[str]) -> None:
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            for key in keys:
+                self._remember(key, expires_at)
+            self._update_gauges()
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO idempotency (key, expires_at) VALUES (?, ?)",
+                    [(key, expires_at) for key in keys],
+                )
+                self._puts += 1
+                if self._puts % _PURGE_EVERY == 0:
+                    self._db.execute("DELETE FROM idempotency WHERE expires_at <= ?", (time.time(),))
+
+    def close(self) -> None:
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+                self._db = None
+
+
+class IdempotencyGuard:
+    """
+    Event-loop side of the cache: adds in-flight tracking so that concurrent
+    duplicates share the outcome of the first request.
+    """
+
+    def __init__(self, cache: IdempotencyCache):
+        self.cache = cache
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    async def _contains(self, keys: list[str]) -> bool:
+        if self.cache.persistent:
+            return await run_in_threadpool(self.cache.contains, keys)
+        return self.cache.contains(keys)
+
+    async def claim(self, keys: list[str]) -> bool:
+        """
+        True if the webhook was already handled (caller should just ACK).
+        Otherwise the keys are reserved and the caller must call release().
+        """
+        while True:
+            if await self._contains(keys):
+                return True
+            pending = next((self._inflight[k] for k in keys if k in self._inflight), None)
+            if pending is None:
+                break
+            IDEMPOTENCY_LOOKUPS.labels(result="inflight").inc()
+            if await asyncio.shield(pending):
+                return True
+            # The original failed; re-check and try to take over
+
+        future = asyncio.get_running_loop().create_future()
+        for key in keys:
+            self._inflight[key] = future
+        return False
+
+    async def release(self, keys: list[str], delivered: bool) -> None:
+        if delivered:
+            if self.cache.persistent:
+                await run_in_threadpool(self.cache.add, keys)
+            else:
+                self.cache.add(keys)
+        future = None
+        for key in keys:
+            future = self._inflight.pop(key, None) or future
+        if future is not None and not future.done():
+            future.set_result(delivered)
@@ -0,0 +1,331 @@
+"""
+Bounded pools of persistent SMTP sessions into docker-mailserver.
+
+Connections are opened lazily (TCP connect + EHLO) and handed back to the pool
+after each message, so bursts of webhooks reuse a handful of live sessions
+instead of paying a handshake per message. SMTPConnectionPool serves the
+blocking smtplib path, AsyncSMTPConnectionPool the asyncio path; both apply
+the same reuse policy and report into the same metrics.
+"""
+
+import asyncio
+import logging
+import smtplib
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from async_smtp import AsyncSMTP
+
+logger = logging.getLogger("mail-ingest")
+
+SMTP_POOL_CONNECTIONS = Gauge(
+    "smtp_pool_connections",
+    "Open pooled SMTP connections by state",
+    labelnames=["state"],
+)
+SMTP_POOL_WAIT = Histogram(
+    "smtp_pool_wait_seconds",
+    "Time spent waiting for a pooled SMTP connection",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 15),
+)
+SMTP_POOL_RECONNECTS = Counter(
+    "smtp_pool_reconnects_total",
+    "Pooled SMTP connections that were closed and replaced, by reason",
+    labelnames=["reason"],
+)
+
+
+class _PooledConnection:
+    __slots__ = ("smtp", "last_used", "messages")
+
+    def __init__(self, smtp: smtplib.SMTP | AsyncSMTP):
+        self.smtp = smtp
+        self.last_used = time.monotonic()
+        self.messages = 0
+
+
+class SMTPConnectionPool:
+    """
+    Thread-safe pool of at most `max_size` SMTP sessions.
+
+    - Idle sessions older than `idle_timeout` are closed instead of reused.
+    - Sessions idle for longer than `noop_after` are probed with NOOP first.
+    - Sessions that served `max_messages` messages are rotated out.
+    - A session whose transaction failed with an SMTP reply is RSET before it
+      goes back to the pool; network failures drop the session.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        helo_domain: str,
+        timeout: float,
+        max_size: int,
+        idle_timeout: float,
+        max_messages: int,
+        noop_after: float,
+    ):
+        self.host = host
+        self.port = port
+        self.helo_domain = helo_domain
+        self.timeout = timeout
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self.noop_after = noop_after
+
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._idle: list[_PooledConnection] = []
+        self._in_use = 0
+
+    def _open(self) -> _PooledConnection:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            smtp.ehlo(self.helo_domain)
+        except Exception:
+            smtp.close()
+            raise
+        return _PooledConnection(smtp)
+
+    def _discard(self, conn: _PooledConnection, reason: str) -> None:
+        SMTP_POOL_RECONNECTS.labels(reason=reason).inc()
+        try:
+            conn.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            conn.smtp.close()
+
+    def _update_gauges(self) -> None:
+        SMTP_POOL_CONNECTIONS.labels(state="idle").set(len(self._idle))
+        SMTP_POOL_CONNECTIONS.labels(state="in_use").set(self._in_use)
+
+    def _checkout(self) -> _PooledConnection:
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                return self._open()
+
+            idle_for = time.monotonic() - conn.last_used
+            if idle_for > self.idle_timeout:
+                self._discard(conn, "idle_timeout")
+                continue
+            if idle_for > self.noop_after:
+                try:
+                    healthy = conn.smtp.noop()[0] == 250
+                except (smtplib.SMTPException, OSError):
+                    healthy = False
+                if not healthy:
+                    self._discard(conn, "health_check")
+                    continue
+            return conn
+
+    def _checkin(self, conn: _PooledConnection, exc: BaseException | None) -> None:
+        if exc is not None:
+            if not isinstance(exc, smtplib.SMTPResponseException):
+                self._discard(conn, "error")
+                return
+            # Server answered, so the session is alive; clear the half-done transaction
+            try:
+                healthy = conn.smtp.rset()[0] == 250
+            except (smtplib.SMTPException, OSError):
+                healthy = False
+            if not healthy:
+                self._discard(conn, "health_check")
+                return
+        else:
+            conn.messages += 1
+            if self.max_messages and conn.messages >= self.max_messages:
+                self._discard(conn, "max_messages")
+                return
+
+        conn.last_used = time.monotonic()
+        with self._lock:
+            self._idle.append(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[smtplib.SMTP]:
+        """
+        Borrow a ready (post-EHLO) SMTP session for exactly one message.
+        """
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            SMTP_POOL_WAIT.observe(time.perf_counter() - start)
+            raise TimeoutError("Timed out waiting for a pooled SMTP connection")
+        SMTP_POOL_WAIT.observe(time.perf_counter() - start)
+
+        try:
+            conn = self._checkout()
+        except BaseException:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            self._update_gauges()
+        try:
+            yield conn.smtp
+        except BaseException as exc:
+            self._checkin(conn, exc)
+            raise
+        else:
+            self._checkin(conn, None)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+                self._update_gauges()
+            self._slots.release()
+
+    def close(self) -> None:
+        """
+        Close all idle sessions (used on shutdown).
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._update_gauges()
+        for conn in idle:
+            try:
+                conn.smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                conn.smtp.close()
+        logger.info("smtp_pool_closed %s", {"closed_connections": len(idle)})
+
+
+class AsyncSMTPConnectionPool:
+    """
+    asyncio counterpart of SMTPConnectionPool with the same reuse policy.
+    Not thread-safe: use it from the event loop only.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        helo_domain: str,
+        timeout: float,
+        max_size: int,
+        idle_timeout: float,
+        max_messages: int,
+        noop_after: float,
+    ):
+        self.host = host
+        self.port = port
+        self.helo_domain = helo_domain
+        self.timeout = timeout
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self.noop_after = noop_after
+
+        self._slots = asyncio.Semaphore(max_size)
+        self._idle: list[_PooledConnection] = []
+        self._in_use = 0
+
+    async def _open(self) -> _PooledConnection:
+        smtp = AsyncSMTP(self.host, self.port, timeout=self.timeout)
+        await smtp.connect(self.helo_domain)
+        return _PooledConnection(smtp)
+
+    async def _discard(self, conn: _PooledConnection, reason: str) -> None:
+        SMTP_POOL_RECONNECTS.labels(reason=reason).inc()
+        try:
+            await conn.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            conn.smtp.close()
+
+    def _update_gauges(self) -> None:
+        SMTP_POOL_CONNECTIONS.labels(state="idle").set(len(self._idle))
+        SMTP_POOL_CONNECTIONS.labels(state="in_use").set(self._in_use)
+
+    async def _checkout(self) -> _PooledConnection:
+        while self._idle:
+            conn = self._idle.pop()
+            idle_for = time.monotonic() - conn.last_used
+            if idle_for > self.idle_timeout:
+                await self._discard(conn, "idle_timeout")
+                continue
+            if idle_for > self.noop_after:
+                try:
+                    healthy = (await conn.smtp.noop())[0] == 250
+                except (smtplib.SMTPException, OSError):
+                    healthy = False
+                if not healthy:
+                    await self._discard(conn, "health_check")
+                    continue
+            return conn
+        return await self._open()
+
+    async def _checkin(self, conn: _PooledConnection, exc: BaseException | None) -> None:
+        if exc is not None:
+            if not isinstance(exc, smtplib.SMTPResponseException):
+                # Includes cancellation mid-command: the session state is unknown,
+                # so drop the socket without another round trip
+                SMTP_POOL_RECONNECTS.labels(reason="error").inc()
+                conn.smtp.close()
+                return
+            try:
+                healthy = (await conn.smtp.rset())[0] == 250
+            except (smtplib.SMTPException, OSError):
+                healthy = False
+            if not healthy:
+                await self._discard(conn, "health_check")
+                return
+        else:
+            conn.messages += 1
+            if self.max_messages and conn.messages >= self.max_messages:
+                await self._discard(conn, "max_messages")
+                return
+
+        conn.last_used = time.monotonic()
+        self._idle.append(conn)
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[AsyncSMTP]:
+        """
+        Borrow a ready (post-EHLO) SMTP session for exactly one message.
+        """
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except TimeoutError:
+            SMTP_POOL_WAIT.observe(time.perf_counter() - start)
+            raise TimeoutError("Timed out waiting for a pooled SMTP connection") from None
+        SMTP_POOL_WAIT.observe(time.perf_counter() - start)
+
+        try:
+            conn = await self._checkout()
+        except BaseException:
+            self._slots.release()
+            raise
+
+        self._in_use += 1
+        self._update_gauges()
+        try:
+            yield conn.smtp
+        except BaseException as exc:
+            await self._checkin(conn, exc)
+            raise
+        else:
+            await self._checkin(conn, None)
+        finally:
+            self._in_use -= 1
+            self._update_gauges()
+            self._slots.release()
+
+    async def close(self) -> None:
+        """
+        Close all idle sessions (used on shutdown).
+        """
+        idle, self._idle = self._idle, []
+        self._update_gauges()
+        for conn in idle:
+            try:
+                await conn.smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                conn.smtp.close()
+        logger.info("smtp_pool_closed %s", {"closed_connections": len(idle)})
@@ -0,0 +1,498 @@
+"""
+Durable on-disk spool for accepted Mailgun webhooks.
+
+Each accepted message is appended to the active segment file and fsync'd
+before the webhook is acknowledged. Delivery workers drain the spool in the
+background with exponential backoff; delivered (or dead-lettered) records are
+noted in a per-segment ack log, and fully acknowledged segments are deleted.
+On restart every record that is not in an ack log is queued again, so delivery
+is at-least-once.
+
+Layout of SPOOL_DIR:
+    segment-0000000001.log   records: header + JSON metadata + raw MIME
+    segment-0000000001.ack   8-byte offsets of finished records
+    dead/                    messages that failed permanently (.eml + .json)
+"""
+
+import asyncio
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import struct
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass, field
+from typing import Awaitable, BinaryIO, Callable
+
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger("mail-ingest")
+
+SPOOL_DEPTH = Gauge(
+    "spool_queue_depth",
+    "Messages in the spool waiting for delivery",
+)
+SPOOL_OLDEST_AGE = Gauge(
+    "spool_oldest_message_age_seconds",
+    "Age of the oldest undelivered message in the spool",
+)
+SPOOL_DELIVERIES = Counter(
+    "spool_deliveries_total",
+    "Spool delivery attempts by outcome",
+    labelnames=["result"],
+)
+
+# magic, metadata length, body length, crc32(metadata + body)
+_HEADER = struct.Struct("!4sIQI")
+_MAGIC = b"MGSP"
+_ACK = struct.Struct("!Q")
+_COPY_CHUNK = 1 << 20
+
+
+@dataclass
+class SpoolEntry:
+    segment: int
+    offset: int
+    meta: dict
+    body_offset: int
+    body_length: int
+    attempts: int = 0
+
+    @property
+    def id(self) -> str:
+        return self.meta["id"]
+
+
+class _BodyReader(io.RawIOBase):
+    """
+    Read-only window [offset, offset + length) over a segment file.
+    """
+
+    def __init__(self, f: BinaryIO, offset: int, length: int):
+        self._f = f
+        self._offset = offset
+        self._length = length
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, pos: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self._length}[whence]
+        self._pos = min(max(base + pos, 0), self._length)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def read(self, size: int = -1) -> bytes:
+        remaining = self._length - self._pos
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        self._f.seek(self._offset + self._pos)
+        data = self._f.read(size)
+        self._pos += len(data)
+        return data
+
+    def close(self) -> None:
+        self._f.close()
+        super().close()
+
+
+@dataclass
+class _Segment:
+    records: int = 0
+    acked: set[int] = field(default_factory=set)
+
+
+class Spool:
+    """
+    Append-only segment store. All methods are blocking and thread-safe;
+    call them from a worker thread when running inside the event loop.
+    """
+
+    def __init__(self, directory: str, segment_max_bytes: int):
+        self.directory = directory
+        self.dead_letter_dir = os.path.join(directory, "dead")
+        self.segment_max_bytes = segment_max_bytes
+
+        self._lock = threading.Lock()
+        self._segments: dict[int, _Segment] = {}
+        self._active: int = 0
+        self._active_file = None
+
+    def _path(self, segment: int, suffix: str) -> str:
+        return os.path.join(self.directory, f"segment-{segment:010d}.{suffix}")
+
+    def _fsync_dir(self) -> None:
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _roll(self) -> None:
+        if self._active_file is not None:
+            self._active_file.close()
+            self._active_file = None
+        self._active += 1
+        self._segments[self._active] = _Segment()
+        # Unbuffered, so a failed append leaves no bytes behind in a buffer
+        self._active_file = open(self._path(self._active, "log"), "ab", buffering=0)
+        self._fsync_dir()
+
+    def _write(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            view = view[self._active_file.write(view):]
+
+    def _discard_partial(self, offset: int) -> None:
+        """
+        Cut a failed append off the active segment. Recovery stops at the first
+        bad record, so anything appended after a partial one would be lost.
+        """
+        try:
+            os.ftruncate(self._active_file.fileno(), offset)
+            self._active_file.seek(offset)
+        except OSError:
+            # The partial record stays at the tail of this segment (recovery
+            # truncates it there); later appends go to a new one
+            logger.exception("spool_segment_broken %s", {"segment": self._active, "offset": offset})
+            try:
+                self._active_file.close()
+            except OSError:
+                pass
+            self._active_file = None
+
+    def _read_segment(self, segment: int) -> list[SpoolEntry]:
+        path = self._path(segment, "log")
+        acked: set[int] = set()
+        try:
+            with open(self._path(segment, "ack"), "rb") as f:
+                data = f.read()
+            usable = len(data) - len(data) % _ACK.size
+            acked = {off for (off,) in _ACK.iter_unpack(data[:usable])}
+        except FileNotFoundError:
+            pass
+
+        entries: list[SpoolEntry] = []
+        records = 0
+        good_end = 0
+        with open(path, "rb") as f:
+            while True:
+                offset = f.tell()
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                magic, meta_len, body_len, crc = _HEADER.unpack(header)
+                if magic != _MAGIC:
+                    break
+                meta_raw = f.read(meta_len)
+                body_offset = f.tell()
+                # CRC over the body is computed in chunks to keep memory flat
+                checksum = zlib.crc32(meta_raw)
+                remaining = body_len
+                while remaining:
+                    chunk = f.read(min(remaining, 1 << 20))
+                    if not chunk:
+                        break
+                    checksum = zlib.crc32(chunk, checksum)
+                    remaining -= len(chunk)
+                if remaining or len(meta_raw) < meta_len or checksum != crc:
+                    break
+                records += 1
+                good_end = f.tell()
+                if offset not in acked:
+                    entries.append(
+                        SpoolEntry(
+                            segment=segment,
+                            offset=offset,
+                            meta=json.loads(meta_raw),
+                            body_offset=body_offset,
+                            body_length=body_len,
+                        )
+                    )
+            file_end = f.seek(0, os.SEEK_END)
+
+        if good_end < file_end:
+            # Torn write from a crash: the record was never acknowledged to Mailgun
+            logger.warning(
+                "spool_truncated_segment %s",
+                {"segment": segment, "valid_bytes": good_end, "file_bytes": file_end},
+            )
+            with open(path, "r+b") as f:
+                f.truncate(good_end)
+
+        self._segments[segment] = _Segment(records=records, acked=acked)
+        return entries
+
+    def open(self) -> list[SpoolEntry]:
+        """
+        Recover existing segments and start a fresh active segment.
+        Returns the undelivered entries in spool order.
+        """
+        os.makedirs(self.dead_letter_dir, exist_ok=True)
+        segments = sorted(
+            int(name[len("segment-"):-len(".log")])
+            for name in os.listdir(self.directory)
+            if name.startswith("segment-") and name.endswith(".log")
+        )
+        pending: list[SpoolEntry] = []
+        with self._lock:
+            for segment in segments:
+                pending.extend(self._read_segment(segment))
+            self._active = segments[-1] if segments else 0
+            self._roll()
+            for segment in segments:
+                self._maybe_remove(segment)
+        return pending
+
+    def append(self, meta: dict, body: bytes | BinaryIO) -> SpoolEntry:
+        """
+        Durably store one message. Returns once the record is on disk.
+        A file-like body is copied in chunks (one pass for the CRC, one to write).
+        """
+        meta = {"id": uuid.uuid4().hex, "enqueued_at": time.time(), **meta}
+        meta_raw = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+        if isinstance(body, (bytes, bytearray)):
+            body_len = len(body)
+            crc = zlib.crc32(body, zlib.crc32(meta_raw))
+        else:
+            body.seek(0)
+            body_len, crc = 0, zlib.crc32(meta_raw)
+            while chunk := body.read(_COPY_CHUNK):
+                body_len += len(chunk)
+                crc = zlib.crc32(chunk, crc)
+            body.seek(0)
+        header = _HEADER.pack(_MAGIC, len(meta_raw), body_len, crc)
+
+        with self._lock:
+            if self._active_file is None or self._active_file.tell() >= self.segment_max_bytes:
+                self._roll()
+            offset = self._active_file.tell()
+            try:
+                self._write(header)
+                self._write(meta_raw)
+                if isinstance(body, (bytes, bytearray)):
+                    self._write(body)
+                else:
+                    while chunk := body.read(_COPY_CHUNK):
+                        self._write(chunk)
+                os.fsync(self._active_file.fileno())
+            except BaseException:
+                self._discard_partial(offset)
+                raise
+            self._segments[self._active].records += 1
+            return SpoolEntry(
+                segment=self._active,
+                offset=offset,
+                meta=meta,
+                body_offset=offset + _HEADER.size + len(meta_raw),
+                body_length=body_len,
+            )
+
+    def open_body(self, entry: SpoolEntry) -> _BodyReader:
+        """
+        File-like view of a record's body, for streaming it into SMTP DATA.
+        """
+        return _BodyReader(open(self._path(entry.segment, "log"), "rb"), entry.body_offset, entry.body_length)
+
+    def ack(self, entry: SpoolEntry) -> None:
+        """
+        Mark a record as finished. Not fsync'd: losing an ack on crash only
+        means the message is delivered once more after restart.
+        """
+        with self._lock:
+            with open(self._path(entry.segment, "ack"), "ab") as f:
+                f.write(_ACK.pack(entry.offset))
+            self._segments[entry.segment].acked.add(entry.offset)
+            self._maybe_remove(entry.segment)
+
+    def dead_letter(self, entry: SpoolEntry, error: str) -> None:
+        """
+        Copy a permanently failed message to dead/ and acknowledge it. If the
+        body cannot be read, only the metadata (with the read error) is written.
+        """
+        base = os.path.join(self.dead_letter_dir, f"{int(entry.meta['enqueued_at'])}-{entry.id}")
+        record = {**entry.meta, "attempts": entry.attempts, "error": error}
+        try:
+            with self.open_body(entry) as src, open(base + ".eml", "wb") as f:
+                shutil.copyfileobj(src, f, _COPY_CHUNK)
+        except OSError as exc:
+            # Unreadable segment: keep the metadata so the message can be traced
+            record["body_error"] = repr(exc)
+            try:
+                os.remove(base + ".eml")
+            except FileNotFoundError:
+                pass
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        self.ack(entry)
+
+    def _maybe_remove(self, segment: int) -> None:
+        state = self._segments.get(segment)
+        if segment == self._active or state is None or len(state.acked) < state.records:
+            return
+        for suffix in ("log", "ack"):
+            try:
+                os.remove(self._path(segment, suffix))
+            except FileNotFoundError:
+                pass
+        del self._segments[segment]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._active_file is not None:
+                self._active_file.close()
+                self._active_file = None
+
+
+class SpoolDeliveryWorkers:
+    """
+    Pool of asyncio tasks that deliver spooled messages.
+
+    `deliver(meta, body)` performs a single delivery attempt (streaming the
+    body from a file-like object) and raises on
+    failure; `is_permanent(exc)` decides whether a failure is dead-lettered
+    right away instead of retried.
+    """
+
+    def __init__(
+        self,
+        spool: Spool,
+        deliver: Callable[[dict, BinaryIO], Awaitable[None]],
+        is_permanent: Callable[[Exception], bool],
+        workers: int,
+        retry_base_delay: float,
+        retry_max_delay: float,
+        max_attempts: int,
+    ):
+        self.spool = spool
+        self.deliver = deliver
+        self.is_permanent = is_permanent
+        self.workers = workers
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.max_attempts = max_attempts
+
+        self._queue: asyncio.Queue[SpoolEntry] = asyncio.Queue()
+        # Insertion-ordered, so the first entry is always the oldest
+        self._pending: dict[str, SpoolEntry] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._timers: set[asyncio.TimerHandle] = set()
+
+        SPOOL_DEPTH.set_function(lambda: len(self._pending))
+        SPOOL_OLDEST_AGE.set_function(self._oldest_age)
+
+    def _oldest_age(self) -> float:
+        oldest = next(iter(self._pending.values()), None)
+        return time.time() - oldest.meta["enqueued_at"] if oldest else 0.0
+
+    async def start(self) -> None:
+        recovered = await asyncio.to_thread(self.spool.open)
+        for entry in recovered:
+            self.submit(entry)
+        if recovered:
+            logger.info("spool_recovered %s", {"messages": len(recovered)})
+        self._tasks = [
+            asyncio.create_task(self._run(), name=f"spool-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        for timer in self._timers:
+            timer.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await asyncio.to_thread(self.spool.close)
+
+    def submit(self, entry: SpoolEntry) -> None:
+        self._pending[entry.id] = entry
+        self._queue.put_nowait(entry)
+
+    def _schedule_retry(self, entry: SpoolEntry) -> float:
+        delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** (entry.attempts - 1))
+        delay *= random.uniform(0.8, 1.2)
+
+        def requeue():
+            self._timers.discard(timer)
+            self._queue.put_nowait(entry)
+
+        timer = asyncio.get_running_loop().call_later(delay, requeue)
+        self._timers.add(timer)
+        return delay
+
+    async def _finish(self, entry: SpoolEntry, step: Callable[..., None], *args) -> None:
+        """
+        Ack or dead-letter an entry. A failure here must not end the worker: the
+        record stays unacknowledged on disk and is queued again after restart.
+        """
+        try:
+            await asyncio.to_thread(step, *args)
+        except Exception as exc:
+            logger.error(
+                "spool_finish_failed %s",
+                {"id": entry.id, "step": step.__name__, "error": repr(exc)},
+            )
+        self._pending.pop(entry.id, None)
+
+    async def _run(self) -> None:
+        while True:
+            entry = await self._queue.get()
+            entry.attempts += 1
+            try:
+                body = await asyncio.to_thread(self.spool.open_body, entry)
+                try:
+                    await self.deliver(entry.meta, body)
+                finally:
+                    body.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                permanent = self.is_permanent(exc)
+                if permanent or (self.max_attempts and entry.attempts >= self.max_attempts):
+                    SPOOL_DELIVERIES.labels(result="dead_letter").inc()
+                    logger.error(
+                        "spool_dead_letter %s",
+                        {
+                            "id": entry.id,
+                            "message_id": entry.meta.get("message_id"),
+                            "attempts": entry.attempts,
+                            "permanent": permanent,
+                            "error": repr(exc),
+                        },
+                    )
+                    await self._finish(entry, self.spool.dead_letter, entry, repr(exc))
+                else:
+                    SPOOL_DELIVERIES.labels(result="retry").inc()
+                    delay = self._schedule_retry(entry)
+                    logger.warning(
+                        "spool_delivery_failed %s",
+                        {
+                            "id": entry.id,
+                            "attempts": entry.attempts,
+                            "retry_in_seconds": round(delay, 1),
+                            "error": repr(exc),
+                        },
+                    )
+            else:
+                SPOOL_DELIVERIES.labels(result="delivered").inc()
+                await self._finish(entry, self.spool.ack, entry)
+                logger.info(
+                    "spool_delivered %s",
+                    {
+                        "id": entry.id,
+                        "message_id": entry.meta.get("message_id"),
+                        "attempts": entry.attempts,
+                        "queued_seconds": round(time.time() - entry.meta["enqueued_at"], 3),
+                    },
+                )
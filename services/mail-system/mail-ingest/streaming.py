@@ -0,0 +1,295 @@
+"""
+Incremental parsing of Mailgun webhook bodies.
+
+The request body is fed chunk by chunk from request.stream() into
+python-multipart's low-level parsers instead of request.form(). Only the
+fields mail-ingest actually reads are kept in memory; `body-mime` is written
+as raw bytes into a SpooledTemporaryFile that rolls over to disk past the
+spool threshold, so a large message is never decoded, re-encoded or held as
+one big string. The file is later streamed straight into SMTP DATA.
+"""
+
+import hashlib
+import tempfile
+from urllib.parse import unquote_to_bytes
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from python_multipart.multipart import MultipartParser, QuerystringParser, parse_options_header
+
+MIME_FIELD = "body-mime"
+
+# Everything else Mailgun sends (body-html, stripped-*, attachments, ...) is discarded
+KEPT_FIELDS = frozenset(
+    {
+        "timestamp",
+        "token",
+        "signature",
+        "sender",
+        "from",
+        "recipient",
+        "to",
+        "Message-Id",
+        "message-id",
+        "subject",
+        "body-plain",
+    }
+)
+
+
+class PayloadTooLarge(Exception):
+    pass
+
+
+class InvalidPayload(Exception):
+    pass
+
+
+class StreamedForm:
+    """
+    Result of parse_streaming_form: small fields plus the raw MIME file.
+    """
+
+    def __init__(self, spool_threshold: int, max_field_bytes: int, hash_mime: bool = False):
+        self.fields: dict[str, str] = {}
+        self.mime: tempfile.SpooledTemporaryFile | None = None
+        self.mime_size = 0
+        self.peak_bytes = 0
+        # SHA-256 of body-mime, computed on the fly when requested
+        self.mime_hash = hashlib.sha256() if hash_mime else None
+
+        self._spool_threshold = spool_threshold
+        self._max_field_bytes = max_field_bytes
+        self._field_bytes = 0
+        self._name: str | None = None
+        self._value: bytearray | None = None
+        self._in_mime = False
+        self._pending: list[memoryview] = []
+
+    def get(self, key: str, default=None):
+        return self.fields.get(key, default)
+
+    def close(self) -> None:
+        if self.mime is not None:
+            self.mime.close()
+
+    def detach_mime(self) -> tempfile.SpooledTemporaryFile | None:
+        """
+        Hand the MIME file to a new owner; close() no longer closes it.
+        """
+        mime, self.mime = self.mime, None
+        return mime
+
+    # --- parser callbacks ---
+
+    def start_field(self, name: str, is_file: bool = False) -> None:
+        self._name = name
+        self._value = None
+        self._in_mime = False
+        if is_file:
+            return
+        if name == MIME_FIELD and self.mime is None:
+            self.mime = tempfile.SpooledTemporaryFile(max_size=self._spool_threshold)
+            self._in_mime = True
+        elif name in KEPT_FIELDS:
+            self._value = bytearray()
+
+    def field_data(self, data: memoryview) -> None:
+        if self._in_mime:
+            # Written after parser.write() returns; the chunk stays alive until then
+            self._pending.append(data)
+            self.mime_size += len(data)
+            if self.mime_hash is not None:
+                self.mime_hash.update(data)
+        elif self._value is not None:
+            self._field_bytes += len(data)
+            if self._field_bytes > self._max_field_bytes:
+                raise PayloadTooLarge(f"Form fields exceed {self._max_field_bytes} bytes")
+            self._value += data
+
+    def end_field(self) -> None:
+        if self._value is not None:
+            self.fields.setdefault(self._name, self._value.decode("utf-8", errors="replace"))
+        self._name = None
+        self._value = None
+        self._in_mime = False
+
+    # --- buffering ---
+
+    def _in_memory_bytes(self, chunk_size: int) -> int:
+        mime_in_memory = self.mime_size if self.mime_size <= self._spool_threshold else 0
+        return chunk_size + self._field_bytes + mime_in_memory
+
+    async def flush(self, chunk_size: int) -> None:
+        self.peak_bytes = max(self.peak_bytes, self._in_memory_bytes(chunk_size))
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        if self.mime_size > self._spool_threshold:
+            # Rolled over (or about to): disk writes go to a worker thread
+            await run_in_threadpool(_write_all, self.mime, pending)
+        else:
+            _write_all(self.mime, pending)
+
+
+def _write_all(fileobj, chunks: list[memoryview]) -> None:
+    for chunk in chunks:
+        fileobj.write(chunk)
+
+
+class _PercentDecoder:
+    """
+    Incremental application/x-www-form-urlencoded value decoder; keeps an
+    incomplete %XX escape across chunk boundaries.
+    """
+
+    def __init__(self):
+        self._carry = b""
+
+    def feed(self, data: bytes) -> bytes:
+        data = self._carry + data
+        cut = data.rfind(b"%", max(0, len(data) - 2))
+        if cut != -1:
+            data, self._carry = data[:cut], data[cut:]
+        else:
+            self._carry = b""
+        return unquote_to_bytes(data.replace(b"+", b" "))
+
+    def finish(self) -> bytes:
+        rest, self._carry = self._carry, b""
+        return unquote_to_bytes(rest.replace(b"+", b" "))
+
+
+def _multipart_parser(form: StreamedForm, boundary: bytes) -> MultipartParser:
+    header_field = bytearray()
+    header_value = bytearray()
+    part: dict = {}
+
+    def on_part_begin():
+        part.clear()
+
+    def on_header_field(data, start, end):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data, start, end):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        if header_field.lower() == b"content-disposition":
+            _, options = parse_options_header(bytes(header_value))
+            part["name"] = options.get(b"name", b"").decode("utf-8", errors="replace")
+            part["is_file"] = b"filename" in options
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        form.start_field(part.get("name", ""), part.get("is_file", False))
+
+    def on_part_data(data, start, end):
+        form.field_data(memoryview(data)[start:end])
+
+    def on_part_end():
+        form.end_field()
+
+    return MultipartParser(
+        boundary,
+        {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+
+
+def _urlencoded_parser(form: StreamedForm) -> QuerystringParser:
+    name = bytearray()
+    state: dict = {}
+
+    def ensure_started():
+        if not state.get("started"):
+            form.start_field(unquote_to_bytes(bytes(name).replace(b"+", b" ")).decode("utf-8", errors="replace"))
+            state["started"] = True
+            state["decoder"] = _PercentDecoder()
+
+    def on_field_start():
+        name.clear()
+        state.clear()
+
+    def on_field_name(data, start, end):
+        name.extend(data[start:end])
+
+    def on_field_data(data, start, end):
+        ensure_started()
+        decoded = state["decoder"].feed(data[start:end])
+        if decoded:
+            form.field_data(memoryview(decoded))
+
+    def on_field_end():
+        ensure_started()
+        tail = state["decoder"].finish()
+        if tail:
+            form.field_data(memoryview(tail))
+        form.end_field()
+
+    return QuerystringParser(
+        {
+            "on_field_start": on_field_start,
+            "on_field_name": on_field_name,
+            "on_field_data": on_field_data,
+            "on_field_end": on_field_end,
+        }
+    )
+
+
+async def parse_streaming_form(
+    request: Request,
+    spool_threshold: int,
+    max_bytes: int,
+    max_field_bytes: int,
+    hash_mime: bool = False,
+) -> StreamedForm:
+    """
+    Parse a multipart/form-data or urlencoded webhook body without buffering it.
+    Raises PayloadTooLarge past `max_bytes`, InvalidPayload on malformed bodies.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise PayloadTooLarge(f"Request body exceeds {max_bytes} bytes")
+
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    form = StreamedForm(spool_threshold=spool_threshold, max_field_bytes=max_field_bytes, hash_mime=hash_mime)
+    if content_type == b"multipart/form-data":
+        if b"boundary" not in options:
+            raise InvalidPayload("Missing boundary in multipart body")
+        parser = _multipart_parser(form, options[b"boundary"])
+    elif content_type == b"application/x-www-form-urlencoded":
+        parser = _urlencoded_parser(form)
+    else:
+        raise InvalidPayload(f"Unsupported content type: {content_type.decode(errors='replace')}")
+
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_bytes:
+                raise PayloadTooLarge(f"Request body exceeds {max_bytes} bytes")
+            try:
+                parser.write(chunk)
+            except PayloadTooLarge:
+                raise
+            except Exception as exc:
+                raise InvalidPayload("Malformed form body") from exc
+            await form.flush(len(chunk))
+        parser.finalize()
+        await form.flush(0)
+    except BaseException:
+        form.close()
+        raise
+
+    if form.mime is not None:
+        form.mime.seek(0)
+    return form
@@ -0,0 +1,261 @@
+import os
+import json
+import hmac
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from pydantic import BaseModel, Field
+
+from pool import QueueFull, WorkerPool
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+PORT = int(os.getenv("RUNNER_PORT", "8000"))
+
+# Bearer token for /run; running without one has to be asked for explicitly
+API_TOKEN = os.getenv("RUNNER_API_TOKEN", "").strip()
+ALLOW_UNAUTHENTICATED = os.getenv("RUNNER_ALLOW_UNAUTHENTICATED", "false").lower() == "true"
+
+# Warm workers forked from a server that has already imported RUNNER_PRELOAD
+WORKERS = int(os.getenv("RUNNER_WORKERS", "0")) or os.cpu_count() or 1
+PRELOAD = [m.strip() for m in os.getenv("RUNNER_PRELOAD", "json,re,datetime,math").split(",") if m.strip()]
+MAX_JOBS_PER_WORKER = int(os.getenv("RUNNER_MAX_JOBS_PER_WORKER", "1000"))
+MAX_QUEUE = int(os.getenv("RUNNER_MAX_QUEUE", "100"))
+
+# Per-job limits; a request may ask for less, not more
+JOB_TIMEOUT = float(os.getenv("RUNNER_JOB_TIMEOUT_SECONDS", "30"))
+MAX_JOB_TIMEOUT = float(os.getenv("RUNNER_MAX_JOB_TIMEOUT_SECONDS", "300"))
+MEMORY_LIMIT_MB = int(os.getenv("RUNNER_MEMORY_LIMIT_MB", "1024"))
+MAX_OUTPUT_BYTES = int(os.getenv("RUNNER_MAX_OUTPUT_BYTES", str(1024 * 1024)))
+DISCONNECT_POLL_SECONDS = 0.5
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(
+    level=LOG_LEVEL,
+    format="%(asctime)s %(levelname)s %(message)s",
+)
+logger = logging.getLogger("python-runner")
+
+# Prometheus metrics
+JOBS_TOTAL = Counter(
+    "runner_jobs_total",
+    "Jobs finished, by kind and status",
+    labelnames=["kind", "status"],
+)
+JOB_SECONDS = Histogram(
+    "runner_job_seconds",
+    "Job execution time on the worker (queue wait excluded)",
+    labelnames=["kind", "status"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+
+POOL = WorkerPool(
+    size=WORKERS,
+    app_dir=APP_DIR,
+    preload=PRELOAD,
+    memory_limit_mb=MEMORY_LIMIT_MB,
+    max_jobs_per_worker=MAX_JOBS_PER_WORKER,
+    max_queue=MAX_QUEUE,
+)
+
+
+class JobRequest(BaseModel):
+    # Exactly one of code, script (path below /app) or function ("module:callable")
+    code: str | None = None
+    script: str | None = None
+    function: str | None = None
+    input: Any = None
+    args: list[Any] = []
+    kwargs: dict[str, Any] = {}
+    timeout: float | None = Field(default=None, gt=0)
+    memory_mb: int | None = Field(default=None, gt=0)
+    stream: bool = False
+
+    @property
+    def kind(self) -> str:
+        return "function" if self.function else "script" if self.script else "code"
+
+
+class OutputBuffer:
+    """stdout/stderr of one job, capped at MAX_OUTPUT_BYTES (UTF-8) in total"""
+
+    def __init__(self):
+        self.size = 0
+        self.truncated = False
+
+    def accept(self, text: str) -> str:
+        remaining = MAX_OUTPUT_BYTES - self.size
+        if remaining <= 0:
+            self.truncated = True
+            return ""
+        data = text.encode()
+        if len(data) > remaining:
+            self.truncated = True
+            # Cut on a character boundary
+            data = data[:remaining]
+            text = data.decode(errors="ignore")
+        self.size += len(data)
+        return text
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if not API_TOKEN:
+        if not ALLOW_UNAUTHENTICATED:
+            raise RuntimeError(
+                "RUNNER_API_TOKEN is not set; set it or RUNNER_ALLOW_UNAUTHENTICATED=true to run jobs without auth"
+            )
+        logger.warning("RUNNER_API_TOKEN is not set: any container on the network can run code")
+    await POOL.start()
+    yield
+    await POOL.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def check_token(request: Request) -> None:
+    if not API_TOKEN:
+        return
+    supplied = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(supplied, API_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid runner token")
+
+
+def job_payload(req: JobRequest) -> dict:
+    targets = [name for name in ("code", "script", "function") if getattr(req, name)]
+    if len(targets) != 1:
+        raise HTTPException(status_code=422, detail="Provide exactly one of code, script or function")
+    if req.function:
+        return {"function": req.function, "args": req.args, "kwargs": req.kwargs}
+    return {targets[0]: getattr(req, targets[0]), "input": req.input}
+
+
+def finish(req: JobRequest, outcome: dict, output: OutputBuffer) -> dict:
+    seconds = outcome["seconds"]
+    JOBS_TOTAL.labels(kind=req.kind, status=outcome["status"]).inc()
+    JOB_SECONDS.labels(kind=req.kind, status=outcome["status"]).observe(seconds)
+    if outcome["status"] not in ("ok", "error"):
+        logger.warning(f"{req.kind} job {outcome['status']}: {outcome['error']}")
+    result = outcome.get("result")
+    return {
+        "status": outcome["status"],
+        "result": json.loads(result) if result is not None else None,
+        "error": outcome.get("error"),
+        "traceback": outcome.get("traceback"),
+        "duration_ms": round(seconds * 1000, 2),
+        "output_truncated": output.truncated,
+    }
+
+
+async def run_job(req: JobRequest, job: dict, on_output) -> dict:
+    timeout = min(req.timeout or JOB_TIMEOUT, MAX_JOB_TIMEOUT)
+    started: list[float] = []
+    try:
+        return await POOL.run(
+            job,
+            timeout=timeout,
+            memory_mb=req.memory_mb,
+            on_output=on_output,
+            on_start=lambda: started.append(time.perf_counter()),
+        )
+    except QueueFull:
+        raise HTTPException(status_code=429, detail="Job queue is full")
+    except asyncio.CancelledError:
+        # Client went away; time on the worker counts even though nobody got the result
+        JOBS_TOTAL.labels(kind=req.kind, status="cancelled").inc()
+        if started:
+            JOB_SECONDS.labels(kind=req.kind, status="cancelled").observe(time.perf_counter() - started[0])
+        raise
+
+
+def ndjson(record: dict) -> bytes:
+    return (json.dumps(record) + "\n").encode()
+
+
+async def stream_job(req: JobRequest, job: dict):
+    """NDJSON: {"type": "stdout"|"stderr", "data": ...} lines, then {"type": "done", ...}"""
+    output = OutputBuffer()
+    lines: asyncio.Queue[bytes | None] = asyncio.Queue()
+
+    def on_output(kind: str, text: str) -> None:
+        if text := output.accept(text):
+            lines.put_nowait(ndjson({"type": kind, "data": text}))
+
+    async def produce() -> None:
+        try:
+            outcome = await run_job(req, job, on_output)
+            lines.put_nowait(ndjson({"type": "done", **finish(req, outcome, output)}))
+        except HTTPException as exc:
+            # Queue filled up between the check in run() and here
+            lines.put_nowait(ndjson({"type": "done", "status": "rejected", "error": exc.detail}))
+        finally:
+            lines.put_nowait(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (line := await lines.get()) is not None:
+            yield line
+    finally:
+        # Client went away mid-job: cancelling kills the job's worker
+        if not producer.done():
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+
+@app.get("/healthz", response_class=PlainTextResponse)
+async def healthz():
+    return "OK"
+
+
+@app.get("/metrics")
+async def metrics():
+    data = generate_latest()
+    return Response(content=data, media_type=CONTENT_TYPE_LATEST)
+
+
+@app.post("/run")
+async def run(req: JobRequest, request: Request):
+    """
+    Run code, a script or a function on a warm worker. Without `stream` the
+    response is one JSON object with the result and the captured output;
+    with `stream` it is NDJSON, output lines first.
+    """
+    check_token(request)
+    job = job_payload(req)
+    if req.stream:
+        if POOL.full():
+            raise HTTPException(status_code=429, detail="Job queue is full")
+        return StreamingResponse(stream_job(req, job), media_type="application/x-ndjson")
+
+    output = OutputBuffer()
+    captured: dict[str, list[str]] = {"stdout": [], "stderr": []}
+
+    def on_output(kind: str, text: str) -> None:
+        if text := output.accept(text):
+            captured[kind].append(text)
+
+    # Nothing reads a plain request's connection while the job runs, so poll it:
+    # cancelling kills the job's worker once the client has gone away
+    job_task = asyncio.create_task(run_job(req, job, on_output))
+    try:
+        while not (await asyncio.wait({job_task}, timeout=DISCONNECT_POLL_SECONDS))[0]:
+            if await request.is_disconnected():
+                logger.info(f"{req.kind} job cancelled: client disconnected")
+                job_task.cancel()
+                await asyncio.gather(job_task, return_exceptions=True)
+                return Response(status_code=499)
+    finally:
+        if not job_task.done():
+            job_task.cancel()
+    outcome = job_task.result()
+    return {
+        **finish(req, outcome, output),
+        "stdout": "".join(captured["stdout"]),
+        "stderr": "".join(captured["stderr"]),
+    }
@@ -1,3 +1,14 @@
-print("Python runner is up!")
+"""
+python-runner entry point: python /app/main.py
 
+The service itself lives in app.py. multiprocessing runs this script again in
+every worker process it starts, so it imports nothing at module level; the
+workers only load worker.py and RUNNER_PRELOAD from the fork server.
+"""
 
+if __name__ == "__main__":
+    import uvicorn
+
+    from app import LOG_LEVEL, PORT, app
+
+    uvicorn.run(app, host="0.0.0.0", port=PORT, log_level=LOG_LEVEL.lower(), access_log=False)
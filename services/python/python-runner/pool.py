@@ -0,0 +1,269 @@
+"""
+Pre-forked pool of warm Python workers.
+
+Workers are forked from a multiprocessing fork server that has already
+imported the preload modules (pandas, numpy, ... plus worker.py, which runs
+the jobs), so a new worker starts in milliseconds with those imports done,
+and jobs reuse the worker instead of paying interpreter startup every run.
+A worker only takes jobs once it has reported ready, so its startup never
+counts against a job's timeout.
+
+Each worker runs one job at a time, received over a Pipe:
+
+- {"code": "..."}: Python source executed in a fresh namespace with `input`
+  bound to the job input; the job's result is whatever it assigns to `result`;
+- {"script": "path.py"}: the same for a file below the app directory;
+- {"function": "module:callable"}: called with `args`/`kwargs`; modules are
+  imported from the app directory and reloaded when their file changes.
+
+Output written to stdout/stderr is sent back line by line while the job
+runs, followed by one "done" message. Memory is capped per job with a soft
+RLIMIT_AS (address space, so it includes the preloaded modules). A job that
+runs past its timeout, or whose consumer goes away, has its worker killed and
+replaced; workers are also recycled after a MemoryError and after
+`max_jobs_per_worker` jobs, so state leaked by jobs does not accumulate.
+This bounds runaway jobs; it is not a sandbox for untrusted code.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Connection
+from typing import Callable
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from worker import serve
+
+logger = logging.getLogger(__name__)
+
+# Seconds a new worker may take to report ready
+WORKER_START_TIMEOUT = 60
+
+# Receives ("stdout" | "stderr", text) while a job runs
+OutputCallback = Callable[[str, str], None]
+
+QUEUE_DEPTH = Gauge(
+    "runner_queue_depth",
+    "Jobs waiting for an idle worker",
+)
+WORKERS_BUSY = Gauge(
+    "runner_workers_busy",
+    "Workers currently running a job",
+)
+QUEUE_WAIT = Histogram(
+    "runner_queue_wait_seconds",
+    "Time a job waited for an idle worker",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+WORKER_RESTARTS = Counter(
+    "runner_worker_restarts_total",
+    "Workers replaced, by reason",
+    labelnames=["reason"],
+)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class _Worker:
+    def __init__(self, process: multiprocessing.Process, conn: Connection):
+        self.process = process
+        self.conn = conn
+        self.jobs = 0
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+
+
+class WorkerPool:
+    def __init__(
+        self,
+        size: int,
+        app_dir: str,
+        preload: list[str],
+        memory_limit_mb: int,
+        max_jobs_per_worker: int,
+        max_queue: int,
+    ):
+        self.size = max(1, size)
+        self.app_dir = app_dir
+        self.preload = preload
+        self.memory_limit_mb = memory_limit_mb
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_queue = max_queue
+        self.waiting = 0
+        self._ctx = multiprocessing.get_context("forkserver")
+        self._idle: asyncio.Queue[_Worker] | None = None
+        self._workers: set[_Worker] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self._executor: ThreadPoolExecutor | None = None
+
+    def _spawn(self) -> _Worker:
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=serve,
+            args=(child_conn, self.app_dir),
+            name="python-runner-worker",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        try:
+            if not parent_conn.poll(WORKER_START_TIMEOUT):
+                raise RuntimeError(f"Worker did not start within {WORKER_START_TIMEOUT}s")
+            parent_conn.recv()
+        except BaseException:
+            process.kill()
+            process.join()
+            parent_conn.close()
+            raise
+        spawned = _Worker(process, parent_conn)
+        self._workers.add(spawned)
+        return spawned
+
+    async def start(self) -> None:
+        # Workers only need worker.py, never the app (see main.py)
+        self._ctx.set_forkserver_preload([serve.__module__, *self.preload])
+        self._idle = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="runner-job")
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        workers = await asyncio.gather(*(loop.run_in_executor(self._executor, self._spawn) for _ in range(self.size)))
+        for worker in workers:
+            self._idle.put_nowait(worker)
+        logger.info(
+            f"Started {self.size} workers in {time.perf_counter() - started:.2f}s "
+            f"(preloaded: {', '.join(self.preload) or 'none'})"
+        )
+
+    async def stop(self) -> None:
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        workers, self._workers = self._workers, set()
+        for worker in workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in workers:
+            worker.process.join(timeout=5)
+            worker.kill()
+            worker.process.join()
+            worker.conn.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def full(self) -> bool:
+        return self._idle is not None and self._idle.empty() and self.waiting >= self.max_queue
+
+    async def run(
+        self,
+        job: dict,
+        *,
+        timeout: float,
+        memory_mb: int | None,
+        on_output: OutputCallback,
+        on_start: Callable[[], None] | None = None,
+    ) -> dict:
+        """
+        Run `job` on the next idle worker and return its outcome; output is passed
+        to `on_output` on the event loop as it arrives, and `on_start` is called
+        once a worker has picked the job up. `memory_mb` can only lower
+        the pool's memory limit. Raises QueueFull when `max_queue` jobs are already
+        waiting for a worker.
+        """
+        if self._idle is None:
+            raise RuntimeError("Worker pool is not running")
+        if self.full():
+            raise QueueFull()
+        loop = asyncio.get_running_loop()
+        limit = self.memory_limit_mb
+        if memory_mb and memory_mb > 0:
+            limit = min(memory_mb, limit) if limit > 0 else memory_mb
+        job = {**job, "memory_bytes": limit * 1024 * 1024 if limit > 0 else None}
+
+        self.waiting += 1
+        QUEUE_DEPTH.inc()
+        enqueued = time.perf_counter()
+        try:
+            worker = await self._idle.get()
+        finally:
+            self.waiting -= 1
+            QUEUE_DEPTH.dec()
+        QUEUE_WAIT.observe(time.perf_counter() - enqueued)
+        WORKERS_BUSY.inc()
+        if on_start is not None:
+            on_start()
+
+        def emit(kind: str, text: str) -> None:
+            loop.call_soon_threadsafe(on_output, kind, text)
+
+        future = loop.run_in_executor(self._executor, self._execute, worker, job, timeout, emit)
+        try:
+            outcome = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Consumer went away: stop the job rather than let it hold the worker. The
+            # replacement runs in its own task, since the caller may be cancelled again
+            # at its next await
+            worker.kill()
+            task = asyncio.create_task(self._replace(worker, "cancelled", after=future))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            raise
+        finally:
+            WORKERS_BUSY.dec()
+
+        worker.jobs += 1
+        if outcome["status"] in ("timeout", "crashed") or outcome.pop("recycle", False):
+            await self._replace(worker, outcome["status"])
+        elif self.max_jobs_per_worker and worker.jobs >= self.max_jobs_per_worker:
+            await self._replace(worker, "recycled")
+        else:
+            self._idle.put_nowait(worker)
+        return outcome
+
+    @staticmethod
+    def _execute(worker: _Worker, job: dict, timeout: float, emit: Callable[[str, str], None]) -> dict:
+        started = time.perf_counter()
+        deadline = time.monotonic() + timeout
+        try:
+            worker.conn.send(job)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not worker.conn.poll(remaining):
+                    worker.kill()
+                    outcome = {"status": "timeout", "result": None, "error": f"Job exceeded its {timeout:g}s timeout"}
+                    break
+                kind, payload = worker.conn.recv()
+                if kind == "done":
+                    outcome = payload
+                    break
+                emit(kind, payload)
+        except (EOFError, OSError):
+            worker.process.join(timeout=1)
+            outcome = {
+                "status": "crashed",
+                "result": None,
+                "error": f"Worker exited during the job (exit code {worker.process.exitcode})",
+            }
+        outcome["seconds"] = time.perf_counter() - started
+        return outcome
+
+    async def _replace(self, worker: _Worker, reason: str, after: asyncio.Future | None = None) -> None:
+        if after is not None:
+            await asyncio.wait([after])
+        WORKER_RESTARTS.labels(reason=reason).inc()
+        if reason != "recycled":
+            logger.warning(f"Worker {worker.process.pid} replaced ({reason})")
+        self._workers.discard(worker)
+        worker.kill()
+        worker.conn.close()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, worker.process.join, 1)
+        if self._idle is not None:
+            self._idle.put_nowait(await loop.run_in_executor(None, self._spawn))
@@ -6,6 +6,11 @@ echo "================================= Python Runner ========================"
 echo
 echo "Internal Container DNS: python-runner"
 echo "Mounted Code Directory: ./python-runner (host) -> /app (container)"
-echo "Entry File: /app/main.py"
-echo "(Note: Internal-only service with no exposed ports; view output via logs)"
+echo "Job API (internal only): http://python-runner:8000/run"
+echo "  API Token: ${RUNNER_API_TOKEN:-<not_set_in_env>}"
+echo "  Headers: { \"Authorization\": \"Bearer \${RUNNER_API_TOKEN}\" }"
+echo "  POST {\"code\": \"result = input['x'] * 2\", \"input\": {\"x\": 21}}"
+echo "  POST {\"script\": \"jobs/report.py\"} or {\"function\": \"mymodule:handler\", \"args\": [...]}"
+echo "  Add \"stream\": true for NDJSON output lines while the job runs"
+echo "Metrics: http://python-runner:8000/metrics (queue depth, job times, worker restarts)"
 echo "Logs: corekit logs -f python-runner"
@@ -0,0 +1,166 @@
+"""
+Worker side of the python-runner pool.
+
+This module runs inside the worker processes. It imports only the standard
+library, so the fork server can preload it (with RUNNER_PRELOAD) without
+pulling in the web app; the pool in pool.py starts `serve` in each worker.
+"""
+
+import asyncio
+import contextlib
+import gc
+import importlib
+import inspect
+import json
+import os
+import resource
+import signal
+import sys
+import traceback
+from multiprocessing.connection import Connection
+from typing import Callable
+
+# Output is sent on every newline, or once this much is buffered
+OUTPUT_CHUNK = 4096
+
+
+class _PipeWriter:
+    def __init__(self, conn: Connection, kind: str):
+        self.conn = conn
+        self.kind = kind
+        self.buffer = ""
+
+    def write(self, text: str) -> int:
+        self.buffer += text
+        if "\n" in text or len(self.buffer) >= OUTPUT_CHUNK:
+            self.flush()
+        return len(text)
+
+    def flush(self) -> None:
+        if self.buffer:
+            self.conn.send((self.kind, self.buffer))
+            self.buffer = ""
+
+    def isatty(self) -> bool:
+        return False
+
+
+class _JobRunner:
+    """Worker-side state: compiled scripts and imported job modules, kept between jobs"""
+
+    def __init__(self, app_dir: str):
+        self.app_dir = os.path.realpath(app_dir)
+        self.scripts: dict[str, tuple[float, object]] = {}
+        self.module_mtimes: dict[str, float] = {}
+
+    def script(self, path: str):
+        full = os.path.realpath(os.path.join(self.app_dir, path))
+        if not full.startswith(self.app_dir + os.sep):
+            raise ValueError(f"Script {path!r} is outside {self.app_dir}")
+        mtime = os.stat(full).st_mtime
+        cached = self.scripts.get(full)
+        if cached is None or cached[0] != mtime:
+            with open(full, encoding="utf-8") as source:
+                cached = (mtime, compile(source.read(), full, "exec"))
+            self.scripts[full] = cached
+        return cached[1]
+
+    def function(self, target: str) -> Callable:
+        module_name, _, attr = target.partition(":")
+        if not module_name or not attr:
+            raise ValueError(f"Function must be 'module:callable', got {target!r}")
+        module = importlib.import_module(module_name)
+        path = getattr(module, "__file__", None)
+        if path and os.path.realpath(path).startswith(self.app_dir + os.sep):
+            mtime = os.stat(path).st_mtime
+            if self.module_mtimes.setdefault(module_name, mtime) != mtime:
+                module = importlib.reload(module)
+                self.module_mtimes[module_name] = mtime
+        value = module
+        for part in attr.split("."):
+            value = getattr(value, part)
+        return value
+
+    def run(self, job: dict):
+        if "function" in job:
+            result = self.function(job["function"])(*job.get("args", []), **job.get("kwargs", {}))
+            if inspect.isawaitable(result):
+                result = asyncio.run(result)
+            return result
+        code = self.script(job["script"]) if "script" in job else compile(job["code"], "<job>", "exec")
+        namespace = {"__name__": "__job__", "input": job.get("input")}
+        exec(code, namespace)
+        return namespace.get("result")
+
+
+def _set_memory_limit(limit: int) -> None:
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY and (limit == resource.RLIM_INFINITY or limit > hard):
+        limit = hard
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+class _ResultNotJSON(ValueError):
+    pass
+
+
+def _encode_result(result) -> str:
+    # Strict JSON: NaN/Infinity would break the HTTP response and NDJSON lines
+    try:
+        return json.dumps(result, default=str, allow_nan=False)
+    except ValueError as exc:
+        raise _ResultNotJSON(f"Job result is not valid JSON: {exc}") from None
+
+
+def _job_traceback(exc: BaseException) -> str:
+    # Only the job's own frames, not the runner's
+    frames = [frame for frame in traceback.extract_tb(exc.__traceback__) if frame.filename != __file__]
+    return "".join(
+        ["Traceback (most recent call last):\n", *traceback.format_list(frames), *traceback.format_exception_only(exc)]
+    )
+
+
+def serve(conn: Connection, app_dir: str) -> None:
+    """Worker process entry point: report ready, then run jobs until told to stop"""
+    # Shutdown is driven by the parent (or EOF if it dies), not by Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if app_dir not in sys.path:
+        sys.path.insert(0, app_dir)
+    runner = _JobRunner(app_dir)
+    stdout, stderr = _PipeWriter(conn, "stdout"), _PipeWriter(conn, "stderr")
+    conn.send(("ready", os.getpid()))
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+
+        outcome = {"status": "ok", "result": None, "error": None, "recycle": False}
+        limit = job.get("memory_bytes") or resource.RLIM_INFINITY
+        try:
+            _set_memory_limit(limit)
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                try:
+                    result = runner.run(job)
+                finally:
+                    stdout.flush()
+                    stderr.flush()
+            outcome["result"] = _encode_result(result)
+        except _ResultNotJSON as exc:
+            outcome.update(status="error", error=str(exc))
+        except MemoryError:
+            outcome.update(status="memory", error="Job exceeded its memory limit", recycle=True)
+        except BaseException as exc:  # noqa: BLE001 - reported to the caller, SystemExit included
+            outcome.update(status="error", error=f"{type(exc).__name__}: {exc}", traceback=_job_traceback(exc))
+        finally:
+            _set_memory_limit(resource.RLIM_INFINITY)
+        try:
+            conn.send(("done", outcome))
+        except (BrokenPipeError, OSError):
+            break
+        if outcome["recycle"]:
+            break
+        gc.collect(0)
@@ -2,16 +2,59 @@
 title: n8n Pipe Function
 author: Cole Medin
 author_url: https://www.youtube.com/@ColeMedin
-version: 0.1.0
+version: 0.2.0
 
 This module defines a Pipe class that utilizes N8N for an Agent
+
+Calls go through one shared aiohttp session (keep-alive connection pool) with
+connect/read timeouts, retries for failed connects and 429/503 responses
+(502/504 and dropped connections only with `retry_unsafe`, since n8n may
+already be running the workflow), and a limit on concurrent n8n calls. When
+the chat requests streaming, n8n responses are streamed through as they
+arrive: Server-Sent Events, n8n's streaming webhook responses
+(newline-delimited JSON events) and chunked plain text. Regular JSON responses
+are read from `response_field` as before.
+
+While the workflow runs, a heartbeat status is emitted every `emit_interval`
+until the reply (or its first streamed piece) arrives. When the user stops
+or abandons the chat, the in-flight HTTP request is cancelled and its
+connection closed; if `cancel_url` is set, the pipe also notifies that
+webhook (with the `X-Request-Id` sent on the original call) so a workflow
+there can stop the n8n execution.
+
+Optionally, replies are cached in memory per (n8n_url, sessionId scope, input)
+with a TTL and LRU eviction, and identical concurrent calls share one
+upstream request. Cache statistics are shown in the completion status.
 """
 
-from typing import Optional, Callable, Awaitable
+from typing import Optional, Callable, Awaitable, AsyncIterator
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from pydantic import BaseModel, Field
-import os
+import asyncio
+import codecs
+import hashlib
+import json
 import time
-import requests
+import uuid
+import weakref
+import aiohttp
+
+# Event types of n8n's streaming webhook responses (one JSON object per line)
+N8N_STREAM_EVENTS = ("begin", "item", "end", "error")
+# Responses and failures where n8n cannot have started the workflow
+RETRY_STATUSES = (429, 503)
+RETRY_ERRORS = (aiohttp.ClientConnectorError,) + (
+    (aiohttp.ConnectionTimeoutError,) if hasattr(aiohttp, "ConnectionTimeoutError") else ()
+)
+# The request may have reached n8n: retrying can run the workflow twice
+UNSAFE_RETRY_STATUSES = (502, 504)
+UNSAFE_RETRY_ERRORS = (aiohttp.ServerDisconnectedError,)
+
+
+class AbandonedCall(Exception):
+    """The caller that owned a shared in-flight n8n call went away."""
+
 
 def extract_event_info(event_emitter) -> tuple[Optional[str], Optional[str]]:
     if not event_emitter or not event_emitter.__closure__:
@@ -23,6 +66,26 @@ def extract_event_info(event_emitter) -> tuple[Optional[str], Optional[str]]:
             return chat_id, message_id
     return None, None
 
+
+async def iter_lines(response: aiohttp.ClientResponse) -> AsyncIterator[str]:
+    """Decoded lines (without line breaks) of a response body as they arrive."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending: list[str] = []
+    async for chunk in response.content.iter_any():
+        text = decoder.decode(chunk)
+        if "\n" not in text:
+            pending.append(text)
+            continue
+        first, *lines, rest = text.split("\n")
+        yield ("".join(pending) + first).rstrip("\r")
+        for line in lines:
+            yield line.rstrip("\r")
+        pending = [rest]
+    rest = "".join(pending) + decoder.decode(b"", final=True)
+    if rest:
+        yield rest.rstrip("\r")
+
+
 class Pipe:
     class Valves(BaseModel):
         n8n_url: str = Field(
@@ -37,14 +100,447 @@ class Pipe:
         enable_status_indicator: bool = Field(
             default=True, description="Enable or disable status indicator emissions"
         )
+        enable_streaming: bool = Field(
+            default=True,
+            description="Stream chunked/SSE n8n responses to the chat as they arrive",
+        )
+        connect_timeout: float = Field(
+            default=10.0, description="Seconds to connect to n8n (0 = no limit)"
+        )
+        read_timeout: float = Field(
+            default=300.0,
+            description="Max seconds without data from n8n, e.g. between stream chunks (0 = no limit)",
+        )
+        total_timeout: float = Field(
+            default=0.0, description="Max seconds for a whole n8n call (0 = no limit)"
+        )
+        max_retries: int = Field(
+            default=2,
+            description="Retries for failed connects and 429/503 responses",
+        )
+        retry_unsafe: bool = Field(
+            default=False,
+            description=(
+                "Also retry 502/504 and dropped connections; n8n may already have "
+                "started the workflow, so only for idempotent workflows"
+            ),
+        )
+        retry_backoff: float = Field(
+            default=0.5, description="Seconds before the first retry, doubled per retry"
+        )
+        max_concurrency: int = Field(
+            default=16, description="Max concurrent n8n calls from this pipe"
+        )
+        cancel_url: str = Field(
+            default="",
+            description="Webhook notified with sessionId/requestId when a call is abandoned (empty = off)",
+        )
+        enable_cache: bool = Field(
+            default=False,
+            description="Cache replies for identical input (for deterministic workflows)",
+        )
+        cache_scope: str = Field(
+            default="session",
+            description="Share cached replies within one chat ('session') or across all chats ('global')",
+        )
+        cache_ttl: float = Field(
+            default=300.0, description="Seconds a cached reply stays valid"
+        )
+        cache_max_entries: int = Field(
+            default=500, description="Max cached replies (least recently used are evicted)"
+        )
+        dedupe_inflight: bool = Field(
+            default=False,
+            description="Identical concurrent calls (same cache key) share one n8n request",
+        )
 
     def __init__(self):
         self.type = "pipe"
         self.id = "n8n_pipe"
         self.name = "N8N Pipe"
         self.valves = self.Valves()
-        self.last_emit_time = 0
-        pass
+        # Last status emission per chat (event emitter), for emit_interval
+        self.last_emit_times: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._background: set[asyncio.Task] = set()
+        # cache key -> (expires at, reply); in-flight cache key -> shared result
+        self._cache: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.cache_stats = {"hits": 0, "misses": 0, "shared": 0}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_size = 0
+
+    async def on_shutdown(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    def get_session(self) -> aiohttp.ClientSession:
+        # One keep-alive pool per event loop; its size is bounded by max_concurrency
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=0, ttl_dns_cache=300),
+                raise_for_status=False,
+            )
+            self._session_loop = loop
+            self._semaphore = None
+        size = max(1, self.valves.max_concurrency)
+        if self._semaphore is None or self._semaphore_size != size:
+            # Calls already holding the old semaphore finish under the old limit
+            self._semaphore = asyncio.Semaphore(size)
+            self._semaphore_size = size
+        return self._session
+
+    @asynccontextmanager
+    async def post(
+        self, payload: dict, stream: bool, request_id: str
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        session = self.get_session()
+        headers = {
+            "Authorization": f"Bearer {self.valves.n8n_bearer_token}",
+            "Content-Type": "application/json",
+            "X-Request-Id": request_id,
+        }
+        if stream:
+            headers["Accept"] = "text/event-stream, application/json;q=0.9, */*;q=0.8"
+        timeout = aiohttp.ClientTimeout(
+            total=self.valves.total_timeout or None,
+            connect=self.valves.connect_timeout or None,
+            sock_read=self.valves.read_timeout or None,
+        )
+        retry_statuses = RETRY_STATUSES
+        retry_errors = RETRY_ERRORS
+        if self.valves.retry_unsafe:
+            retry_statuses += UNSAFE_RETRY_STATUSES
+            retry_errors += UNSAFE_RETRY_ERRORS
+        async with self._semaphore:
+            attempt = 0
+            while True:
+                delay = self.valves.retry_backoff * 2**attempt
+                try:
+                    response = await session.post(
+                        self.valves.n8n_url, json=payload, headers=headers, timeout=timeout
+                    )
+                except retry_errors:
+                    if attempt >= self.valves.max_retries:
+                        raise
+                else:
+                    if response.status not in retry_statuses or attempt >= self.valves.max_retries:
+                        break
+                    retry_after = response.headers.get("Retry-After", "")
+                    if retry_after.isdigit():
+                        delay = max(delay, float(retry_after))
+                    response.release()
+                attempt += 1
+                await asyncio.sleep(delay)
+
+            try:
+                if response.status != 200:
+                    raise Exception(f"Error: {response.status} - {await response.text()}")
+                yield response
+            except BaseException:
+                # Cancelled or abandoned mid-response: drop the connection
+                # instead of returning it to the pool
+                response.close()
+                raise
+            finally:
+                response.release()
+
+    def event_text(self, event) -> str:
+        """Text carried by one JSON event of a streamed n8n response."""
+        if not isinstance(event, dict):
+            return event if isinstance(event, str) else ""
+        event_type = event.get("type")
+        if event_type in N8N_STREAM_EVENTS:
+            if event_type == "error":
+                raise Exception(f"n8n workflow error: {event.get('content') or event}")
+            if event_type == "item":
+                return event.get("content") or ""
+            return ""
+        value = event.get(self.valves.response_field)
+        return value if isinstance(value, str) else ""
+
+    def sse_text(self, message: str) -> str:
+        try:
+            return self.event_text(json.loads(message))
+        except json.JSONDecodeError:
+            return message
+
+    def extract_response(self, text: str):
+        data = json.loads(text)
+        # "Respond with all incoming items" returns a list
+        if isinstance(data, list) and data:
+            data = data[0]
+        return data[self.valves.response_field]
+
+    async def iter_response(self, response: aiohttp.ClientResponse) -> AsyncIterator[str]:
+        """Text pieces of an n8n response as they arrive."""
+        content_type = response.headers.get("Content-Type", "")
+        if "text/event-stream" in content_type:
+            data: list[str] = []
+            async for line in iter_lines(response):
+                if line.startswith("data:"):
+                    data.append(line[5:].removeprefix(" "))
+                    continue
+                if line or not data:
+                    continue
+                message, data = "\n".join(data), []
+                if message == "[DONE]":
+                    return
+                yield self.sse_text(message)
+            if data and data != ["[DONE]"]:
+                yield self.sse_text("\n".join(data))
+            return
+
+        if "json" in content_type:
+            # n8n streaming webhooks send one JSON event per line; a regular
+            # (possibly multi-line) JSON body is read in full instead
+            buffered: list[str] = []
+            async for line in iter_lines(response):
+                if not buffered:
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        event = None
+                    if isinstance(event, dict) and event.get("type") in N8N_STREAM_EVENTS:
+                        yield self.event_text(event)
+                        continue
+                buffered.append(line)
+            if any(line.strip() for line in buffered):
+                yield str(self.extract_response("\n".join(buffered)))
+            return
+
+        # Chunked plain text
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        async for chunk in response.content.iter_any():
+            yield decoder.decode(chunk)
+        yield decoder.decode(b"", final=True)
+
+    async def heartbeat(self, __event_emitter__: Callable[[dict], Awaitable[None]]):
+        started = time.monotonic()
+        try:
+            while True:
+                await asyncio.sleep(max(0.1, self.valves.emit_interval))
+                elapsed = time.monotonic() - started
+                await self.emit_status(
+                    __event_emitter__,
+                    "info",
+                    f"/Calling N8N Workflow... ({elapsed:.0f}s)",
+                    False,
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The chat's event channel went away; the call itself carries on
+            return
+
+    def start_heartbeat(
+        self, __event_emitter__: Callable[[dict], Awaitable[None]]
+    ) -> Optional[asyncio.Task]:
+        if not __event_emitter__ or not self.valves.enable_status_indicator:
+            return None
+        return asyncio.create_task(self.heartbeat(__event_emitter__))
+
+    def abandon(self, payload: dict, request_id: str):
+        """Tell n8n (via cancel_url) that nobody is waiting for this call any more."""
+        if not self.valves.cancel_url:
+            return
+        task = asyncio.get_running_loop().create_task(self.notify_cancel(payload, request_id))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def notify_cancel(self, payload: dict, request_id: str):
+        timeout = aiohttp.ClientTimeout(
+            total=self.valves.total_timeout or 30,
+            connect=self.valves.connect_timeout or None,
+            sock_read=self.valves.read_timeout or None,
+        )
+        try:
+            async with self.get_session().post(
+                self.valves.cancel_url,
+                json={"sessionId": payload.get("sessionId"), "requestId": request_id},
+                headers={"Authorization": f"Bearer {self.valves.n8n_bearer_token}"},
+                timeout=timeout,
+            ) as response:
+                # Read the (short) body so the connection goes back to the pool
+                await response.read()
+        except Exception:
+            # Best effort; the webhook call itself is already closed
+            pass
+
+    def cache_key(self, payload: dict) -> Optional[str]:
+        if not (self.valves.enable_cache or self.valves.dedupe_inflight):
+            return None
+        scope = "" if self.valves.cache_scope == "global" else payload.get("sessionId")
+        parts = [
+            self.valves.n8n_url,
+            self.valves.response_field,
+            scope,
+            payload.get(self.valves.input_field),
+        ]
+        return hashlib.sha256(
+            json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+
+    async def reuse(self, key: Optional[str]) -> tuple[Optional[str], str]:
+        """A cached or in-flight reply for `key`, with its source; (None, "n8n") if there is none."""
+        if key is None:
+            return None, "n8n"
+        if self.valves.enable_cache:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._cache.move_to_end(key)
+                self.cache_stats["hits"] += 1
+                return entry[1], "cache"
+            if entry is not None:
+                del self._cache[key]
+            self.cache_stats["misses"] += 1
+        future = self._inflight.get(key) if self.valves.dedupe_inflight else None
+        if future is not None:
+            try:
+                # Shielded: a follower giving up must not cancel the shared call
+                reply = await asyncio.shield(future)
+            except AbandonedCall:
+                return None, "n8n"
+            self.cache_stats["shared"] += 1
+            return reply, "shared"
+        return None, "n8n"
+
+    def begin(self, key: Optional[str]) -> Optional[asyncio.Future]:
+        if key is None or not self.valves.dedupe_inflight:
+            return None
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        return future
+
+    def finish(
+        self,
+        key: Optional[str],
+        future: Optional[asyncio.Future],
+        reply: Optional[str] = None,
+        error: Optional[BaseException] = None,
+    ):
+        if error is None and key is not None and self.valves.enable_cache:
+            self._cache[key] = (time.monotonic() + self.valves.cache_ttl, reply)
+            self._cache.move_to_end(key)
+            while len(self._cache) > max(0, self.valves.cache_max_entries):
+                self._cache.popitem(last=False)
+        if future is None:
+            return
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if future.done():
+            return
+        if error is None:
+            future.set_result(reply)
+        else:
+            future.set_exception(error)
+            # Mark retrieved, there may be no followers
+            future.exception()
+
+    def complete_message(self, source: str) -> str:
+        if not (self.valves.enable_cache or self.valves.dedupe_inflight):
+            return "Complete"
+        stats = self.cache_stats
+        return (
+            f"Complete ({source}; cache: {stats['hits']} hits, {stats['misses']} misses, "
+            f"{stats['shared']} shared, {len(self._cache)} entries)"
+        )
+
+    async def cached_call(
+        self, payload: dict, __event_emitter__: Callable[[dict], Awaitable[None]]
+    ) -> tuple[str, str]:
+        key = self.cache_key(payload)
+        reply, source = await self.reuse(key)
+        if reply is not None:
+            return reply, source
+        future = self.begin(key)
+        try:
+            reply = await self.call_n8n(payload, __event_emitter__)
+        except asyncio.CancelledError:
+            self.finish(key, future, error=AbandonedCall())
+            raise
+        except Exception as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, reply)
+        return reply, source
+
+    async def call_n8n(
+        self, payload: dict, __event_emitter__: Callable[[dict], Awaitable[None]]
+    ) -> str:
+        request_id = uuid.uuid4().hex
+        heartbeat = self.start_heartbeat(__event_emitter__)
+        try:
+            async with self.post(payload, stream=False, request_id=request_id) as response:
+                return "".join([piece async for piece in self.iter_response(response)])
+        except asyncio.CancelledError:
+            self.abandon(payload, request_id)
+            raise
+        finally:
+            if heartbeat:
+                heartbeat.cancel()
+
+    async def stream_n8n(
+        self,
+        payload: dict,
+        __event_emitter__: Callable[[dict], Awaitable[None]],
+    ) -> AsyncIterator[str]:
+        key = self.cache_key(payload)
+        try:
+            reply, source = await self.reuse(key)
+        except Exception as e:
+            # The shared call failed
+            await self.emit_status(
+                __event_emitter__,
+                "error",
+                f"Error during sequence execution: {str(e)}",
+                True,
+            )
+            return
+        if reply is not None:
+            yield reply
+            await self.emit_status(
+                __event_emitter__, "info", self.complete_message(source), True
+            )
+            return
+
+        future = self.begin(key)
+        pieces: list[str] = []
+        request_id = uuid.uuid4().hex
+        # Heartbeat until the first piece arrives; after that the reply shows progress
+        heartbeat = self.start_heartbeat(__event_emitter__)
+        try:
+            async with self.post(payload, stream=True, request_id=request_id) as response:
+                async for piece in self.iter_response(response):
+                    if piece:
+                        if heartbeat:
+                            heartbeat.cancel()
+                            heartbeat = None
+                        pieces.append(piece)
+                        yield piece
+        except (asyncio.CancelledError, GeneratorExit):
+            # Stopped by the user or the client went away
+            self.finish(key, future, error=AbandonedCall())
+            self.abandon(payload, request_id)
+            raise
+        except Exception as e:
+            self.finish(key, future, error=e)
+            await self.emit_status(
+                __event_emitter__,
+                "error",
+                f"Error during sequence execution: {str(e)}",
+                True,
+            )
+            return
+        finally:
+            if heartbeat:
+                heartbeat.cancel()
+        self.finish(key, future, "".join(pieces))
+        await self.emit_status(
+            __event_emitter__, "info", self.complete_message(source), True
+        )
 
     async def emit_status(
         self,
@@ -58,7 +554,9 @@ class Pipe:
             __event_emitter__
             and self.valves.enable_status_indicator
             and (
-                current_time - self.last_emit_time >= self.valves.emit_interval or done
+                current_time - self.last_emit_times.get(__event_emitter__, 0)
+                >= self.valves.emit_interval
+                or done
             )
         ):
             await __event_emitter__(
@@ -72,7 +570,7 @@ class Pipe:
                     },
                 }
             )
-            self.last_emit_time = current_time
+            self.last_emit_times[__event_emitter__] = current_time
 
     async def pipe(
         self,
@@ -86,25 +584,23 @@ class Pipe:
         )
         chat_id, _ = extract_event_info(__event_emitter__)
         messages = body.get("messages", [])
+        n8n_response = None
+        complete = "Complete"
 
         # Verify a message is available
         if messages:
             question = messages[-1]["content"]
+            payload = {"sessionId": f"{chat_id}"}
+            payload[self.valves.input_field] = question
+
+            # Stream the reply through as n8n produces it
+            if self.valves.enable_streaming and body.get("stream"):
+                return self.stream_n8n(payload, __event_emitter__)
+
             try:
                 # Invoke N8N workflow
-                headers = {
-                    "Authorization": f"Bearer {self.valves.n8n_bearer_token}",
-                    "Content-Type": "application/json",
-                }
-                payload = {"sessionId": f"{chat_id}"}
-                payload[self.valves.input_field] = question
-                response = requests.post(
-                    self.valves.n8n_url, json=payload, headers=headers
-                )
-                if response.status_code == 200:
-                    n8n_response = response.json()[self.valves.response_field]
-                else:
-                    raise Exception(f"Error: {response.status_code} - {response.text}")
+                n8n_response, source = await self.cached_call(payload, __event_emitter__)
+                complete = self.complete_message(source)
 
                 # Set assitant message with chain reply
                 body["messages"].append({"role": "assistant", "content": n8n_response})
@@ -131,5 +627,5 @@ class Pipe:
                 }
             )
 
-        await self.emit_status(__event_emitter__, "info", "Complete", True)
+        await self.emit_status(__event_emitter__, "info", complete, True)
         return n8n_response